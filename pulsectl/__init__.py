@@ -7,10 +7,15 @@ from .pulsectl import (
 	PulsePortInfo, PulseClientInfo, PulseServerInfo, PulseModuleInfo,
 	PulseSinkInfo, PulseSinkInputInfo, PulseSourceInfo, PulseSourceOutputInfo,
 	PulseCardProfileInfo, PulseCardPortInfo, PulseCardInfo, PulseVolumeInfo,
-	PulseExtStreamRestoreInfo, PulseEventInfo,
+	PulseExtStreamRestoreInfo, PulseEventInfo, PulseSampleInfo,
+	PulseSnapshotInfo, PulseBatchOpInfo, PulseLevelsInfo, PulseCallStatsInfo,
 
 	PulseEventTypeEnum, PulseEventFacilityEnum, PulseEventMaskEnum,
 	PulseStateEnum, PulseUpdateEnum, PulsePortAvailableEnum, PulseDirectionEnum,
+	PulseStreamStateEnum, PulseSampleFormatEnum,
 
-	PulseError, PulseIndexError, PulseOperationFailed, PulseOperationInvalid,
-	PulseLoopStop, PulseDisconnected, PulseObject, Pulse, connect_to_cli )
+	PulseError, PulseIndexError, PulseOperationFailed, PulseOperationInvalid, PulseTimeout,
+	PulseLoopStop, PulseDisconnected, PulseObject,
+	Pulse, PulseThreaded, PulsePeakMonitor, PulseEventQueue, PulseStream, PulseRecordStream,
+	PulsePlaybackStream, PulseStats, PulseTraceRing, PulseTraceJSONL,
+	pcm_levels, trace_set, connect_to_cli )
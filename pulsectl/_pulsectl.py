@@ -4,7 +4,8 @@ from __future__ import print_function
 
 # C Bindings
 
-import os, sys, ctypes.util, functools as ft
+import os, sys, ctypes.util, functools as ft, threading, traceback
+from collections import namedtuple
 from ctypes import *
 
 
@@ -24,6 +25,9 @@ if sys.version_info.major >= 3:
 	import time
 	mono_time = time.monotonic
 
+	# Unsigned-byte memoryview over raw memory, e.g. buffers from libpulse, without copying
+	mem_view = lambda addr, n: memoryview((c_char * n).from_address(addr)).cast('B')
+
 else:
 	c_str_p = c_char_p
 
@@ -41,6 +45,8 @@ else:
 			raise OSError(err, os.strerror(err))
 		return ts.tv_sec + ts.tv_nsec * 1e-9
 
+	mem_view = lambda addr, n: memoryview((c_ubyte * n).from_address(addr))
+
 
 PA_INVALID = 2**32-1
 
@@ -101,11 +107,19 @@ PA_SAMPLE_FLOAT32NE = dict(
 	little=PA_SAMPLE_FLOAT32LE,
 	big=PA_SAMPLE_FLOAT32BE )[sys.byteorder]
 
+PA_STREAM_UNCONNECTED = 0
+PA_STREAM_CREATING = 1
+PA_STREAM_READY = 2
+PA_STREAM_FAILED = 3
+PA_STREAM_TERMINATED = 4
+
 PA_STREAM_DONT_MOVE = 0x0200
 PA_STREAM_PEAK_DETECT = 0x0800
 PA_STREAM_ADJUST_LATENCY = 0x2000
 PA_STREAM_DONT_INHIBIT_AUTO_SUSPEND = 0x8000
 
+PA_SEEK_RELATIVE = 0
+
 def c_enum_map(**values):
 	return dict((v, force_str(k)) for k,v in values.items())
 
@@ -137,8 +151,16 @@ PA_DIRECTION_MAP = c_enum_map(unknown=0, output=1, input=2)
 #  pa_sink_state / pa_source_state, but seem to match.
 PA_OBJ_STATE_MAP = c_enum_map(invalid=-1, running=0, idle=1, suspended=2)
 
+PA_STREAM_STATE_MAP = c_enum_map(
+	unconnected=PA_STREAM_UNCONNECTED, creating=PA_STREAM_CREATING,
+	ready=PA_STREAM_READY, failed=PA_STREAM_FAILED, terminated=PA_STREAM_TERMINATED )
+PA_SAMPLE_FORMAT_MAP = c_enum_map(
+	u8=0, alaw=1, ulaw=2, s16le=3, s16be=4, float32le=5, float32be=6,
+	s32le=7, s32be=8, s24le=9, s24be=10, s24_32le=11, s24_32be=12 )
+
 
 class PA_MAINLOOP(Structure): pass
+class PA_THREADED_MAINLOOP(Structure): pass
 class PA_STREAM(Structure): pass
 class PA_MAINLOOP_API(Structure): pass
 class PA_CONTEXT(Structure): pass
@@ -342,6 +364,20 @@ class PA_MODULE_INFO(Structure):
 		('proplist', POINTER(PA_PROPLIST)),
 	]
 
+class PA_SAMPLE_INFO(Structure):
+	_fields_ = [
+		('index', c_uint32),
+		('name', c_char_p),
+		('volume', PA_CVOLUME),
+		('sample_spec', PA_SAMPLE_SPEC),
+		('channel_map', PA_CHANNEL_MAP),
+		('duration', c_uint64),
+		('bytes', c_uint32),
+		('lazy', c_int),
+		('filename', c_char_p),
+		('proplist', POINTER(PA_PROPLIST)),
+	]
+
 class PA_EXT_STREAM_RESTORE_INFO(Structure):
 	_fields_ = [
 		('name', c_char_p),
@@ -457,6 +493,12 @@ PA_MODULE_INFO_CB_T = CFUNCTYPE(c_void_p,
 	c_int,
 	c_void_p)
 
+PA_SAMPLE_INFO_CB_T = CFUNCTYPE(c_void_p,
+	POINTER(PA_CONTEXT),
+	POINTER(PA_SAMPLE_INFO),
+	c_int,
+	c_void_p)
+
 PA_SUBSCRIBE_CB_T = CFUNCTYPE(c_void_p,
 	POINTER(PA_CONTEXT),
 	c_int,
@@ -472,6 +514,25 @@ PA_STREAM_NOTIFY_CB_T = CFUNCTYPE(c_void_p,
 	POINTER(PA_STREAM),
 	c_void_p)
 
+PA_STREAM_SUCCESS_CB_T = CFUNCTYPE(c_void_p,
+	POINTER(PA_STREAM),
+	c_int,
+	c_void_p)
+
+
+# Tracing info for a single libpulse call, passed to LibPulse.trace callable
+# ts = call start (mono_time), res = result summary, errno = pulse errno on failed checks
+LibPulseCall = namedtuple('LibPulseCall', 'func args ts duration res errno')
+
+def trace_value(v, n=40):
+	'Returns short summary of ctypes value for LibPulseCall - type name for structs/pointers/callbacks.'
+	if v is None or isinstance(v, (int, float)): return v
+	if isinstance(v, (bytes, unicode)):
+		v = force_str(v, 'replace')
+		return v if len(v) <= n else v[:n] + '...'
+	if isinstance(v, ctypes._Pointer) and not v: return 'NULL'
+	return type(v).__name__
+
 
 class LibPulse(object):
 
@@ -484,6 +545,7 @@ class LibPulse(object):
 		pa_strerror=([c_int], c_str_p),
 		pa_runtime_path=([c_str_p], (c_char_p, 'not_null')),
 		pa_operation_unref=[POINTER(PA_OPERATION)],
+		pa_operation_cancel=[POINTER(PA_OPERATION)],
 
 		pa_mainloop_new=(POINTER(PA_MAINLOOP)),
 		pa_mainloop_get_api=([POINTER(PA_MAINLOOP)], POINTER(PA_MAINLOOP_API)),
@@ -497,6 +559,17 @@ class LibPulse(object):
 		pa_mainloop_quit=([POINTER(PA_MAINLOOP), c_int]),
 		pa_mainloop_free=[POINTER(PA_MAINLOOP)],
 
+		pa_threaded_mainloop_new=(POINTER(PA_THREADED_MAINLOOP)),
+		pa_threaded_mainloop_get_api=(
+			[POINTER(PA_THREADED_MAINLOOP)], POINTER(PA_MAINLOOP_API) ),
+		pa_threaded_mainloop_start=([POINTER(PA_THREADED_MAINLOOP)], 'int_check_ge0'),
+		pa_threaded_mainloop_stop=[POINTER(PA_THREADED_MAINLOOP)],
+		pa_threaded_mainloop_lock=[POINTER(PA_THREADED_MAINLOOP)],
+		pa_threaded_mainloop_unlock=[POINTER(PA_THREADED_MAINLOOP)],
+		pa_threaded_mainloop_wait=[POINTER(PA_THREADED_MAINLOOP)],
+		pa_threaded_mainloop_signal=[POINTER(PA_THREADED_MAINLOOP), c_int],
+		pa_threaded_mainloop_free=[POINTER(PA_THREADED_MAINLOOP)],
+
 		pa_signal_init=([POINTER(PA_MAINLOOP_API)], 'int_check_ge0'),
 		pa_signal_new=([c_int, PA_SIGNAL_CB_T, POINTER(PA_SIGNAL_EVENT)]),
 		pa_signal_done=None,
@@ -589,6 +662,14 @@ class LibPulse(object):
 		pa_context_subscribe=( 'pa_op',
 			[POINTER(PA_CONTEXT), c_int, PA_CONTEXT_SUCCESS_CB_T, c_void_p] ),
 		pa_context_set_subscribe_callback=[POINTER(PA_CONTEXT), PA_SUBSCRIBE_CB_T, c_void_p],
+		pa_context_get_sample_info_by_index=( 'pa_op',
+			[POINTER(PA_CONTEXT), c_uint32, PA_SAMPLE_INFO_CB_T, c_void_p] ),
+		pa_context_get_sample_info_by_name=( 'pa_op',
+			[POINTER(PA_CONTEXT), c_str_p, PA_SAMPLE_INFO_CB_T, c_void_p] ),
+		pa_context_get_sample_info_list=( 'pa_op',
+			[POINTER(PA_CONTEXT), PA_SAMPLE_INFO_CB_T, c_void_p] ),
+		pa_context_remove_sample=( 'pa_op',
+			[POINTER(PA_CONTEXT), c_str_p, PA_CONTEXT_SUCCESS_CB_T, c_void_p] ),
 		pa_context_play_sample=( 'pa_op',
 			[POINTER(PA_CONTEXT), c_str_p, c_str_p, c_uint32, PA_CONTEXT_SUCCESS_CB_T, c_void_p] ),
 		pa_context_play_sample_with_proplist=( 'pa_op',
@@ -608,6 +689,7 @@ class LibPulse(object):
 		pa_proplist_from_string=([c_str_p], POINTER(PA_PROPLIST)),
 		pa_proplist_iterate=([POINTER(PA_PROPLIST), POINTER(c_void_p)], c_str_p),
 		pa_proplist_gets=([POINTER(PA_PROPLIST), c_str_p], c_str_p),
+		pa_proplist_copy=([POINTER(PA_PROPLIST)], (POINTER(PA_PROPLIST), 'not_null')),
 		pa_proplist_free=[POINTER(PA_PROPLIST)],
 
 		pa_channel_map_init_mono=(
@@ -618,6 +700,8 @@ class LibPulse(object):
 		pa_channel_map_parse=(
 			[POINTER(PA_CHANNEL_MAP), c_str_p], (POINTER(PA_CHANNEL_MAP), 'not_null') ),
 		pa_channel_position_to_string=([c_int], c_str_p),
+		pa_frame_size=([POINTER(PA_SAMPLE_SPEC)], c_size_t),
+		pa_sample_spec_valid=([POINTER(PA_SAMPLE_SPEC)], c_int),
 
 		pa_stream_new_with_proplist=(
 			[ POINTER(PA_CONTEXT), c_str_p,
@@ -625,64 +709,169 @@ class LibPulse(object):
 			POINTER(PA_STREAM) ),
 		pa_stream_set_monitor_stream=([POINTER(PA_STREAM), c_uint32], 'int_check_ge0'),
 		pa_stream_set_read_callback=[POINTER(PA_STREAM), PA_STREAM_REQUEST_CB_T, c_void_p],
+		pa_stream_set_state_callback=[POINTER(PA_STREAM), PA_STREAM_NOTIFY_CB_T, c_void_p],
+		pa_stream_get_state=([POINTER(PA_STREAM)], c_int),
 		pa_stream_connect_record=(
 			[POINTER(PA_STREAM), c_str_p, POINTER(PA_BUFFER_ATTR), c_int], 'int_check_ge0' ),
 		pa_stream_unref=[POINTER(PA_STREAM)],
 		pa_stream_peek=(
-			[POINTER(PA_STREAM), POINTER(c_void_p), POINTER(c_int)], 'int_check_ge0' ),
+			[POINTER(PA_STREAM), POINTER(c_void_p), POINTER(c_size_t)], 'int_check_ge0' ),
 		pa_stream_drop=([POINTER(PA_STREAM)], 'int_check_ge0'),
+		pa_stream_readable_size=([POINTER(PA_STREAM)], c_size_t),
+		pa_stream_connect_playback=(
+			[ POINTER(PA_STREAM), c_str_p, POINTER(PA_BUFFER_ATTR),
+				c_int, POINTER(PA_CVOLUME), POINTER(PA_STREAM) ], 'int_check_ge0' ),
+		pa_stream_set_write_callback=[POINTER(PA_STREAM), PA_STREAM_REQUEST_CB_T, c_void_p],
+		pa_stream_writable_size=([POINTER(PA_STREAM)], c_size_t),
+		pa_stream_begin_write=(
+			[POINTER(PA_STREAM), POINTER(c_void_p), POINTER(c_size_t)], 'int_check_ge0' ),
+		pa_stream_cancel_write=([POINTER(PA_STREAM)], 'int_check_ge0'),
+		pa_stream_write=(
+			[POINTER(PA_STREAM), c_void_p, c_size_t, c_void_p, c_int64, c_int], 'int_check_ge0' ),
+		pa_stream_connect_upload=([POINTER(PA_STREAM), c_size_t], 'int_check_ge0'),
+		pa_stream_finish_upload=([POINTER(PA_STREAM)], 'int_check_ge0'),
+		pa_stream_drain=([POINTER(PA_STREAM), PA_STREAM_SUCCESS_CB_T, c_void_p], 'pa_op'),
+		pa_stream_cork=(
+			[POINTER(PA_STREAM), c_int, PA_STREAM_SUCCESS_CB_T, c_void_p], 'pa_op' ),
 		pa_stream_disconnect=([POINTER(PA_STREAM)], 'int_check_ge0') )
 
 	class CallError(Exception): pass
 
-
 	def __init__(self):
-		p = CDLL(ctypes.util.find_library('libpulse') or 'libpulse.so.0')
-
-		self.funcs = dict()
-		for k, spec in self.func_defs.items():
-			func, args, res_proc = getattr(p, k), None, None
-			if spec:
-				if not isinstance(spec, tuple): spec = (spec,)
-				for v in spec:
-					assert v, [k, spec, v]
-					if isinstance(v, list): args = v
-					else: res_proc = v
-			func_k = k if not k.startswith('pa_') else k[3:]
-			self.funcs[func_k] = self._func_wrapper(k, func, args, res_proc)
-
-	def _func_wrapper(self, func_name, func, args=list(), res_proc=None):
-		func.restype, func.argtypes = None, args
-		if isinstance(res_proc, tuple): func.restype, res_proc = res_proc
+		# Library is only loaded and functions bound/annotated on first call
+		self._lib, self._trace, self.funcs = None, None, dict()
+		self._lock = threading.RLock() # for binding and trace implementation swaps
+
+	def _lib_load(self):
+		if not self._lib: self._lib = CDLL(ctypes.util.find_library('libpulse') or 'libpulse.so.0')
+		return self._lib
+
+	@property
+	def trace(self):
+		'Callable to pass LibPulseCall tuples to, None to disable tracing - see pulsectl.trace_set().'
+		return self._trace
+
+	@trace.setter
+	def trace(self, sink):
+		with self._lock:
+			self._trace = sink
+			for k, func in list(self.funcs.items()): self._func_impl_set(k, func)
+
+	def trace_swap(self, sink):
+		'Sets new trace sink and returns previous one, as a single atomic operation.'
+		with self._lock:
+			sink_prev, self.trace = self._trace, sink
+			return sink_prev
+
+	def _func_get(self, k):
+		'''Returns _func_wrapper() for specified name, creating it on first access.
+			Names are same as in func_defs, but without "pa_" prefix, e.g. "context_new".'''
+		func_name = 'pa_{}'.format(k)
+		if func_name not in self.func_defs: raise AttributeError(k)
+		spec, args, res_proc = self.func_defs[func_name], None, None
+		if spec:
+			if not isinstance(spec, tuple): spec = (spec,)
+			for v in spec:
+				assert v, [k, spec, v]
+				if isinstance(v, list): args = v
+				else: res_proc = v
+		with self._lock:
+			func = self.funcs.get(k)
+			if not func:
+				func = self.funcs[k] = self._func_wrapper(k, func_name, args, res_proc)
+				setattr(self, k, func) # to bypass __getattr__ on subsequent lookups
+		return func
+
+	def _func_wrapper(self, k, func_name, arg_types=list(), res_proc=None):
+		'''Returns wrapper that binds libpulse function on first call,
+				and then passes all calls to specialized _func_fast() or _func_traced() callable,
+				which also replaces it as LibPulse attribute, so that it's used directly from there.
+			Wrapper itself can still be used, e.g. if stored before first call.'''
+		restype = None
+		if isinstance(res_proc, tuple): restype, res_proc = res_proc
 		if isinstance(res_proc, str):
-			if res_proc.startswith('int_check_'): func.restype = c_int
-			elif res_proc == 'pa_op': func.restype = POINTER(PA_OPERATION)
-		elif not func.restype and hasattr(res_proc, 'c_type'): func.restype = res_proc.c_type
-		elif not func.restype: func.restype, res_proc = res_proc, None
-
-		def _wrapper(*args):
-			# print('libpulse call:', func_name, args, file=sys.stderr)
-			# sys.stderr.flush()
-			res = func(*args)
-			if isinstance(res_proc, str):
-				assert res_proc in ['int_check_ge0', 'pa_op', 'not_null']
-				if (res_proc == 'int_check_ge0' and res < 0)\
-						or (res_proc == 'pa_op' and not res)\
-						or (res_proc == 'not_null' and not res):
-					err = [func_name, args, res]
-					if args and isinstance(getattr(args[0], 'contents', None), PA_CONTEXT):
-						errno_ = self.context_errno(args[0])
-						err.append('{} [pulse errno {}]'.format(self.strerror(errno_), errno_))
-					else: err.append('Return value check failed: {}'.format(res_proc))
-					raise self.CallError(*err)
-			elif res_proc: res = res_proc(res)
-			return res
-
-		_wrapper.__name__ = 'libpulse.{}'.format(func_name)
+			assert res_proc in ['int_check_ge0', 'pa_op', 'not_null'], res_proc
+			if res_proc.startswith('int_check_'): restype = c_int
+			elif res_proc == 'pa_op': restype = POINTER(PA_OPERATION)
+		elif not restype and hasattr(res_proc, 'c_type'): restype = res_proc.c_type
+		elif not restype: restype, res_proc = res_proc, None
+
+		def _func_bind(*args):
+			with self._lock:
+				if func_impl[0] is _func_bind: # can be bound from other thread already
+					func = getattr(self._lib_load(), func_name)
+					func.restype, func.argtypes = restype, arg_types
+					_wrapper.func_fast = self._func_fast(func_name, func, res_proc)
+					self._func_impl_set(k, _wrapper)
+			return func_impl[0](*args)
+
+		def _wrapper(*args): return func_impl[0](*args)
+		_wrapper.__name__, _wrapper.func_name = 'libpulse.{}'.format(func_name), func_name
+		_wrapper.func_impl = func_impl = [_func_bind]
 		return _wrapper
 
-	def __getattr__(self, k): return self.funcs[k]
+	def _func_impl_set(self, k, wrapper):
+		'Sets fast or traced implementation for bound wrapper, depending on whether tracing is enabled.'
+		func = getattr(wrapper, 'func_fast', None)
+		if not func: return # not bound yet
+		if self._trace is not None: func = self._func_traced(wrapper.func_name, func)
+		wrapper.func_impl[0] = func
+		setattr(self, k, func)
+
+	def _func_fast(self, func_name, func, res_proc):
+		'''Returns callable for bound ctypes function with minimal overhead for its result check.
+			Can be ctypes function itself, if there is no result processing for it.'''
+		if not res_proc: return func
+		if res_proc == 'int_check_ge0':
+			def _call(*args):
+				res = func(*args)
+				if res < 0: self._func_error(func_name, res_proc, args, res)
+				return res
+		elif res_proc in ['pa_op', 'not_null']:
+			def _call(*args):
+				res = func(*args)
+				if not res: self._func_error(func_name, res_proc, args, res)
+				return res
+		else:
+			def _call(*args): return res_proc(func(*args))
+		_call.__name__ = 'libpulse.{}'.format(func_name)
+		return _call
+
+	def _func_error(self, func_name, res_proc, args, res):
+		err = [func_name, args, res]
+		if args and isinstance(getattr(args[0], 'contents', None), PA_CONTEXT):
+			errno_ = self._lib.pa_context_errno(args[0]) # not wrapped, to avoid tracing it
+			err.append('{} [pulse errno {}]'.format(self.strerror(errno_), errno_))
+		else: err.append('Return value check failed: {}'.format(res_proc))
+		raise self.CallError(*err)
+
+	def _func_traced(self, func_name, func):
+		'Returns wrapper for _func_fast() callable, passing LibPulseCall info to trace sink.'
+		def _call(*args):
+			trace, ts = self._trace, mono_time()
+			try: res = func(*args)
+			except self.CallError as err:
+				if trace is not None: self._trace_call(trace, func_name, args, ts, err.args[2], True)
+				raise
+			if trace is not None: self._trace_call(trace, func_name, args, ts, res)
+			return res
+		_call.__name__ = 'libpulse.{}'.format(func_name)
+		return _call
+
+	def _trace_call(self, trace, func_name, args, ts, res, failed=False):
+		# Errors from trace sink are printed to stderr, as they should not affect libpulse calls
+		duration, errno_ = mono_time() - ts, None
+		try:
+			if failed and args and isinstance(getattr(args[0], 'contents', None), PA_CONTEXT):
+				errno_ = self._lib.pa_context_errno(args[0]) # not wrapped, to avoid tracing it
+			trace(LibPulseCall( func_name,
+				tuple(trace_value(v) for v in args), ts, duration, trace_value(res), errno_ ))
+		except Exception: traceback.print_exc()
+
+	def __getattr__(self, k):
+		if k.startswith('_'): raise AttributeError(k)
+		return self._func_get(k)
 
 	def return_value(self): return pointer(c_int())
 
-pa = LibPulse()
+pa = LibPulse() # lazy proxy - libpulse is only loaded on first function call
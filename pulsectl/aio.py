@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+'''asyncio interface for pulsectl, python-3.6+ only.
+
+	All info/control methods of AsyncPulse are coroutines with same signatures
+		as Pulse ones, and any number of these can be running concurrently on same connection.
+
+	Example:
+		async with AsyncPulse('mixer') as pulse:
+			sinks, sources = await asyncio.gather(pulse.sink_list(), pulse.source_list())
+			async for ev in pulse.subscribe_events('sink', 'source'): print(ev)'''
+
+import asyncio, select, inspect
+
+from . import _pulsectl as c
+from .pulsectl import (
+	is_str, assert_pulse_object, Pulse, PulseSnapshotInfo, PulseEventMaskEnum,
+	PulseError, PulseIndexError, PulseOperationFailed, PulseDisconnected )
+
+
+class AsyncPulse(object):
+	'''asyncio-native pulse client, running libpulse mainloop from asyncio eventloop.
+
+		Wraps regular Pulse instance with libpulse poll function that never blocks,
+			and only records fds and timeout to wait on, which are then passed to asyncio.
+		Mainloop iterations are only run from asyncio callbacks when these are ready,
+			or when new operations are sent, so nothing here blocks the asyncio loop.
+
+		Created without connection, which should be
+			established via "async with AsyncPulse(...)" or connect() call.
+		Info objects and exceptions are same as with Pulse class.'''
+
+	def __init__(self, client_name=None, server=None):
+		self._pulse = Pulse(client_name, server, connect=False)
+		self._pulse.set_poll_func(self._pulse_poll_func)
+		self._pulse.event_callback = self._pulse_event_cb
+		self._aio_loop, self._waiters, self._ev_queues = None, list(), set()
+		self._poll_fds, self._poll_timeout = list(), -1
+		self._fds, self._timer, self._iter_handle = dict(), None, None
+
+	async def connect(self, autospawn=False, wait=False, timeout=None):
+		'''Connect to pulseaudio server, same as Pulse.connect(),
+			but "timeout" can also be enforced via e.g. asyncio.wait_for().'''
+		p = self._pulse
+		if not p._loop:
+			raise PulseError('Eventloop object was already'
+				' destroyed and cannot be reused from this instance.')
+		if p.connected is not None: p._ctx_init()
+		flags, p.connected = 0, None
+		if not autospawn: flags |= c.PA_CONTEXT_NOAUTOSPAWN
+		if wait: flags |= c.PA_CONTEXT_NOFAIL
+		try: c.pa.context_connect(p._ctx, p.server, flags, None)
+		except c.pa.CallError: p.connected = False
+		try: await asyncio.wait_for(self._pulse_wait(lambda: p.connected is not None), timeout)
+		except asyncio.TimeoutError:
+			c.pa.context_disconnect(p._ctx)
+			raise PulseError('Timed-out connecting to pulseaudio server [{:,.1f}s]'.format(timeout))
+		if not p.connected: raise PulseError('Failed to connect to pulseaudio server')
+
+	def disconnect(self):
+		self._pulse.disconnect()
+		self._pulse_wakeup()
+
+	def close(self):
+		self._pulse_unwatch()
+		self._pulse.close()
+		waiters, self._waiters = self._waiters, list()
+		for check, fut in waiters:
+			if not fut.done(): fut.set_exception(PulseDisconnected())
+		for queue in self._ev_queues: queue.put_nowait(None)
+
+	async def __aenter__(self):
+		if not self._pulse.connected: await self.connect(autospawn=True)
+		return self
+	async def __aexit__(self, err_t, err, err_tb): self.close()
+
+
+	def _pulse_poll_func(self, fds, timeout):
+		# Called from pa_mainloop_poll() in _pulse_iterate() and never blocks,
+		#  only returning fds that are ready now and storing all of them for _pulse_watch().
+		self._poll_fds, self._poll_timeout = list((fd.fd, fd.events) for fd in fds), timeout
+		if not fds: return 0
+		poller = select.poll()
+		for fd in fds: poller.register(fd.fd, fd.events)
+		ready = dict(poller.poll(0))
+		for fd in fds: fd.revents = ready.get(fd.fd, 0)
+		return len(ready)
+
+	def _pulse_iterate(self):
+		self._iter_handle, loop = None, self._pulse._loop
+		if not loop: return
+		try:
+			c.pa.mainloop_prepare(loop, -1)
+			c.pa.mainloop_poll(loop)
+			n = c.pa.mainloop_dispatch(loop)
+		except c.pa.CallError: n = 0 # e.g. from mainloop_dispatch() on disconnect
+		self._pulse_waiters_check()
+		if self._pulse.connected is False:
+			for queue in self._ev_queues: queue.put_nowait(None)
+		# Dispatched events can enable others, so loop until there's nothing to do right away
+		if n > 0: self._pulse_wakeup()
+		else: self._pulse_watch()
+
+	def _pulse_wakeup(self):
+		if self._iter_handle is None and self._pulse._loop:
+			self._iter_handle = self._aio_loop.call_soon(self._pulse_iterate)
+
+	def _pulse_watch(self):
+		'Registers fds and timeout from last pa_mainloop_poll() call in asyncio loop.'
+		fds, loop = dict(), self._aio_loop
+		for fd, ev in self._poll_fds: fds[fd] = fds.get(fd, 0) | ev
+		for fd, ev in list(self._fds.items()):
+			if fds.get(fd) == ev: continue
+			if ev & select.POLLIN: loop.remove_reader(fd)
+			if ev & select.POLLOUT: loop.remove_writer(fd)
+			del self._fds[fd]
+		for fd, ev in fds.items():
+			if fd in self._fds: continue
+			if ev & select.POLLIN: loop.add_reader(fd, self._pulse_wakeup)
+			if ev & select.POLLOUT: loop.add_writer(fd, self._pulse_wakeup)
+			self._fds[fd] = ev
+		if self._timer: self._timer.cancel()
+		self._timer = None if self._poll_timeout < 0 else\
+			loop.call_later(self._poll_timeout, self._pulse_wakeup)
+
+	def _pulse_unwatch(self):
+		loop = self._aio_loop
+		if not loop: return
+		for fd, ev in self._fds.items():
+			if ev & select.POLLIN: loop.remove_reader(fd)
+			if ev & select.POLLOUT: loop.remove_writer(fd)
+		self._fds.clear()
+		for h in self._timer, self._iter_handle:
+			if h: h.cancel()
+		self._timer = self._iter_handle = None
+
+	def _pulse_wait(self, check):
+		'Returns future that is done when check() returns True after any mainloop iteration.'
+		if not self._aio_loop: self._aio_loop = asyncio.get_event_loop()
+		fut = self._aio_loop.create_future()
+		self._waiters.append((check, fut))
+		self._pulse_wakeup()
+		return fut
+
+	def _pulse_waiters_check(self):
+		if not self._waiters: return
+		waiters, self._waiters = self._waiters, list()
+		for check, fut in waiters:
+			if fut.done(): continue # cancelled
+			try: done = check()
+			except Exception as err: fut.set_exception(err)
+			else:
+				if done: fut.set_result(True)
+				else: self._waiters.append((check, fut))
+
+	async def _pulse_op(self, op_func):
+		'''Sends pa_operation via op_func(cb) -> (c_cb, pa_op) and waits for it to complete.
+			Operation is cancelled if waiting coroutine is, so that c_cb is never called after that.'''
+		p = self._pulse
+		act_id, cb = p._pulse_action()
+		try: c_cb, pa_op = op_func(cb)
+		except Exception:
+			p._actions.pop(act_id, None)
+			raise
+		try: await self._pulse_wait(lambda: not p.connected or p._actions[act_id] is not None)
+		except asyncio.CancelledError:
+			c.pa.operation_cancel(pa_op)
+			raise
+		finally:
+			c.pa.operation_unref(pa_op)
+			res = p._actions.pop(act_id, None)
+		if not res: raise PulseOperationFailed(act_id)
+
+	async def _pulse_get(self, spec, index=None):
+		data = list()
+		await self._pulse_op(lambda cb: self._pulse._pulse_info_op(spec, data, cb, index))
+		if index is not None or spec[3]: # singleton
+			if not data: raise PulseIndexError(index)
+			data, = data
+		return data
+
+	async def _pulse_value(self, pulse_op, pulse_args, cb_t):
+		'Async version of Pulse._pulse_value_call().'
+		data, p = list(), self._pulse
+		await self._pulse_op(lambda cb: p._pulse_value_op(pulse_op, pulse_args, cb_t, data, cb))
+		return p._pulse_value(data)
+
+	async def _pulse_call(self, spec, args, kws):
+		pulse_op, func, index_arg = spec
+		pulse_args = self._pulse._pulse_method_args(func, index_arg, args, kws)
+		await self._pulse_op(lambda cb: self._pulse._pulse_method_issue(pulse_op, pulse_args, cb))
+
+
+	# Info/control methods like sink_list() or sink_mute()
+	#  are added after class definition, from wrapper specs of Pulse ones.
+
+	async def snapshot(self):
+		'''Returns PulseSnapshotInfo with server_info() and results of all object lists,
+			same as Pulse.snapshot(), requesting all of these at the same time.'''
+		keys = sorted(Pulse._snapshot_methods)
+		data = await asyncio.gather(*(
+			getattr(self, Pulse._snapshot_methods[k])() for k in keys ))
+		return PulseSnapshotInfo(**dict(zip(keys, data)))
+
+	async def module_load(self, name, args=''):
+		pulse_op, pulse_args, cb_t = Pulse._module_load_args(name, args)
+		return Pulse._module_load_check(await self._pulse_value(pulse_op, pulse_args, cb_t), pulse_args)
+
+	async def stream_restore_test(self):
+		'Returns module-stream-restore version int (e.g. 1) or None if it is unavailable.'
+		return await self._pulse_value(*Pulse._stream_restore_test_args)
+
+	async def default_set(self, obj):
+		'Set passed sink or source to be used as default one by pulseaudio server.'
+		await getattr(self, self._pulse._obj_method('default_set', obj))(obj)
+
+	async def sink_default_get(self):
+		'Wrapper around server_info() to return sink for default_sink_name there.'
+		return await self.get_sink_by_name((await self.server_info()).default_sink_name)
+	async def source_default_get(self):
+		'Wrapper around server_info() to return source for default_source_name there.'
+		return await self.get_source_by_name((await self.server_info()).default_source_name)
+
+	async def mute(self, obj, mute=True):
+		await getattr(self, self._pulse._obj_method('mute', obj))(obj.index, mute)
+		obj.mute = mute
+
+	async def port_set(self, obj, port):
+		await getattr(self, self._pulse._obj_method('port_set', obj))(obj.index, port)
+		obj.port_active = port
+
+	async def card_profile_set(self, card, profile):
+		assert_pulse_object(card)
+		if is_str(profile):
+			profile_dict = dict((p.name, p) for p in card.profile_list)
+			if profile not in profile_dict:
+				raise PulseIndexError( 'Card does not have'
+					' profile with specified name: {!r}'.format(profile) )
+			profile = profile_dict[profile]
+		await self.card_profile_set_by_index(card.index, profile.name)
+		card.profile_active = profile
+
+	async def volume_set(self, obj, vol):
+		await getattr(self, self._pulse._obj_method('volume_set', obj))(obj.index, vol)
+		obj.volume = vol
+
+	async def volume_set_all_chans(self, obj, vol):
+		assert_pulse_object(obj)
+		obj.volume.value_flat = vol
+		await self.volume_set(obj, obj.volume)
+
+	async def volume_change_all_chans(self, obj, inc):
+		assert_pulse_object(obj)
+		obj.volume.values = [max(0, v + inc) for v in obj.volume.values]
+		await self.volume_set(obj, obj.volume)
+
+	volume_get_all_chans = Pulse.volume_get_all_chans # does not query anything
+
+	async def play_sample(self, name, sink=None, volume=1.0, proplist_str=None):
+		'Play sample stored on the server, same as Pulse.play_sample().'
+		proplist = c.pa.proplist_from_string(proplist_str) if proplist_str else None
+		pulse_op, pulse_args = Pulse._play_sample_args(name, sink, volume, proplist)
+		try: await self._pulse_op(
+			lambda cb: self._pulse._pulse_method_issue(pulse_op, pulse_args, cb) )
+		finally:
+			if proplist: c.pa.proplist_free(proplist)
+
+
+	async def event_mask_set(self, *masks):
+		mask = 0
+		for m in masks: mask |= PulseEventMaskEnum[m]._c_val
+		await self._pulse_op(lambda cb:
+			self._pulse._pulse_method_issue(c.pa.context_subscribe, [mask], cb) )
+
+	def _pulse_event_cb(self, ev):
+		for queue in self._ev_queues: queue.put_nowait(ev)
+
+	async def subscribe_events(self, *masks):
+		'''Async generator of PulseEventInfo objects for
+				events received while iterating over it, with any number of these allowed.
+			Specified event masks (if any) are set via event_mask_set() when iteration starts,
+				otherwise whatever was set before (or gets set later) is used.
+			Raises PulseDisconnected when connection to the server is lost or closed.
+			Example: async for ev in pulse.subscribe_events('all'): print(ev)'''
+		queue = asyncio.Queue()
+		self._ev_queues.add(queue)
+		try:
+			if masks: await self.event_mask_set(*masks)
+			while True:
+				ev = await queue.get()
+				if ev is None: raise PulseDisconnected()
+				yield ev
+		finally: self._ev_queues.discard(queue)
+
+
+def _async_method(name, method):
+	get_spec, call_spec = (getattr(method, k, None) for k in ['_pulse_get_spec', '_pulse_call_spec'])
+	if get_spec:
+		async def _method(self, index=None): return await self._pulse_get(get_spec, index)
+	elif call_spec:
+		async def _method(self, *args, **kws): return await self._pulse_call(call_spec, args, kws)
+	else: return
+	_method.__name__, _method.__qualname__ = name, 'AsyncPulse.{}'.format(name)
+	_method.__doc__ = method.__doc__
+	try: _method.__signature__ = inspect.signature(method)
+	except (TypeError, ValueError): pass
+	return _method
+
+for k, v in sorted(vars(Pulse).items()):
+	if k.startswith('_') or k in vars(AsyncPulse): continue
+	v = _async_method(k, v)
+	if v: setattr(AsyncPulse, k, v)
+
+for k in 'name server connected event_types event_facilities event_masks channel_list_enum'.split():
+	setattr(AsyncPulse, k, property(lambda self,k=k: getattr(self._pulse, k)))
+del k, v
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+from .pulsectl import PulseLoopStop
+
+
+class PulseStateCache(object):
+	'''Local copy of pulse server objects, kept up-to-date via subscription events.
+
+		Holds server info and dicts of sinks, sources,
+			sink_inputs, source_outputs, cards, clients and modules, keyed by index.
+		Events only record what has changed, and objects are only
+			re-fetched on update() or listen() calls, all of them in one go.
+
+		Events can't be processed while eventloop is running (e.g. from event callbacks),
+			so update() has to be called at some point after each event_listen(),
+			which is what listen() method here does.
+
+		Uses same event callback mechanism as event_listen(),
+			so "event_callback" should be passed here instead of pulse.event_callback_set(),
+			if it's needed - will be called with events after they are recorded.
+
+		Example:
+			with pulsectl.Pulse('mixer') as pulse:
+				cache = PulseStateCache(pulse)
+				while True:
+					for fac, idx in cache.listen(): print(fac, idx, cache.get(fac, idx))'''
+
+	obj_types = dict( # event facility -> (attr, info-method)
+		sink=('sinks', 'sink_info'), source=('sources', 'source_info'),
+		sink_input=('sink_inputs', 'sink_input_info'),
+		source_output=('source_outputs', 'source_output_info'),
+		card=('cards', 'card_info'), client=('clients', 'client_info'),
+		module=('modules', 'module_info') )
+
+	def __init__(self, pulse, event_callback=None, subscribe=True):
+		'''Does subscribe() for pulse instance, unless "subscribe=False" is passed.
+			Cache is empty until refresh() in latter case, which subscribe() also does.'''
+		self.pulse, self.event_callback = pulse, event_callback
+		self.server, self.pending, self._listen = None, dict(), False
+		for attr, method in self.obj_types.values(): setattr(self, attr, dict())
+		if subscribe: self.subscribe()
+
+	def subscribe(self):
+		'Sets event mask and callback for pulse instance and does full refresh().'
+		self.pulse.event_mask_set('server', *sorted(self.obj_types))
+		self.pulse.event_callback_set(self.event_cb)
+		self.refresh()
+
+	def refresh(self):
+		'Re-fetches everything via pulse.snapshot(), discarding any pending events.'
+		self.pending.clear()
+		snap = self.pulse.snapshot()
+		self.server = snap.server
+		for attr, method in self.obj_types.values():
+			setattr(self, attr, dict((obj.index, obj) for obj in getattr(snap, attr)))
+
+	def event_cb(self, ev):
+		# Only last event type matters - remove drops object, new/change re-fetches it
+		self.pending[ev.facility, ev.index] = ev.t
+		try:
+			if self.event_callback: self.event_callback(ev)
+		finally:
+			if self._listen: raise PulseLoopStop
+
+	def get(self, facility, index, default=None):
+		'Returns cached object by event facility and index, e.g. get("sink", 0).'
+		if facility == 'server': return self.server
+		return getattr(self, self.obj_types[facility][0]).get(index, default)
+
+	def update(self):
+		'''Applies all pending changes from received events,
+				fetching all new/changed objects from the server at once and dropping removed ones.
+			Returns set of (facility, index) tuples for all updated/removed objects.'''
+		pending, self.pending = self.pending, dict()
+		changes, fetch = set(), list()
+		for (fac, idx), ev_t in pending.items():
+			if fac == 'server': fetch.append((fac, idx, self.pulse.server_info, None))
+			elif fac in self.obj_types:
+				attr, method = self.obj_types[fac]
+				if ev_t != 'remove': fetch.append((fac, idx, getattr(self.pulse, method), idx))
+				elif getattr(self, attr).pop(idx, None) is not None: changes.add((fac, idx))
+		if fetch:
+			res = self.pulse._pulse_get_multi((func, index) for fac, idx, func, index in fetch)
+			for (fac, idx, func, index), data in zip(fetch, res):
+				if fac == 'server':
+					if data: self.server, = data
+				else:
+					objs = getattr(self, self.obj_types[fac][0])
+					if data: objs[idx], = data
+					elif objs.pop(idx, None) is None: continue # new+remove before update
+				changes.add((fac, idx))
+		return changes
+
+	def listen(self, timeout=None):
+		'''Runs pulse.event_listen() until any events are received or timeout
+				passes, if there are none pending already, and returns update() result.
+			"timeout" is in seconds (float), None (default) to wait until there are events.'''
+		if not self.pending:
+			self._listen = True
+			try: self.pulse.event_listen(timeout)
+			finally: self._listen = False
+		return self.update()
@@ -2,15 +2,15 @@
 from __future__ import print_function
 
 import itertools as it, operator as op, functools as ft
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 from contextlib import contextmanager
-import os, sys, inspect, traceback
+import os, sys, io, time, math, json, array, random, inspect, traceback, threading, heapq, mmap, struct as st
 
 from . import _pulsectl as c
 
 
 if sys.version_info.major >= 3:
-	long, unicode = int, str
+	long, unicode, intern_str = int, str, sys.intern
 	print_err = ft.partial(print, file=sys.stderr, flush=True)
 	def wrapper_with_sig_info(func, wrapper, index_arg=False):
 		sig = inspect.signature(func or (lambda: None))
@@ -22,6 +22,7 @@ if sys.version_info.major >= 3:
 
 else:
 	range, map = xrange, it.imap
+	intern_str = lambda s: s # py2 intern() only works with bytes
 	def print_err(*args, **kws):
 		kws.setdefault('file', sys.stderr)
 		print(*args, **kws)
@@ -53,6 +54,20 @@ class FakeLock():
 	def __enter__(self): return self
 	def __exit__(self, *err): pass
 
+class ThreadedMainloopLock(object):
+	'''Re-entrant per-thread lock around pa_threaded_mainloop_lock/unlock.
+		Libpulse lock is only taken/released on outermost enter/exit, as
+			pa_threaded_mainloop_wait() would not release it if it was locked recursively.'''
+	def __init__(self, loop): self.loop, self.local = loop, threading.local()
+	def __enter__(self):
+		n = getattr(self.local, 'n', 0)
+		if not n: c.pa.threaded_mainloop_lock(self.loop)
+		self.local.n = n + 1
+		return self
+	def __exit__(self, *err):
+		self.local.n -= 1
+		if not self.local.n: c.pa.threaded_mainloop_unlock(self.loop)
+
 
 @ft.total_ordering
 class EnumValue(object):
@@ -112,23 +127,217 @@ PulseStateEnum = Enum('sink/source-state', c.PA_OBJ_STATE_MAP)
 PulseUpdateEnum = Enum('update-type', c.PA_UPDATE_MAP)
 PulsePortAvailableEnum = Enum('available', c.PA_PORT_AVAILABLE_MAP)
 PulseDirectionEnum = Enum('direction', c.PA_DIRECTION_MAP)
+PulseStreamStateEnum = Enum('stream-state', c.PA_STREAM_STATE_MAP)
+PulseSampleFormatEnum = Enum('sample-format', c.PA_SAMPLE_FORMAT_MAP)
 
 
 class PulseError(Exception): pass
 class PulseOperationFailed(PulseError): pass
 class PulseOperationInvalid(PulseOperationFailed): pass
 class PulseIndexError(PulseError): pass
+class PulseTimeout(PulseOperationFailed): pass
 
 class PulseLoopStop(Exception): pass
 class PulseDisconnected(Exception): pass
 
+def proplist_decode(proplist):
+	'Returns dict of decoded key/value strings from pa_proplist pointer.'
+	res, state = dict(), c.c_void_p()
+	while True:
+		k = c.pa.proplist_iterate(proplist, c.byref(state))
+		if not k: break
+		res[intern_str(c.force_str(k))] = c.force_str(c.pa.proplist_gets(proplist, k))
+	return res
+
+class LazyProplist(object):
+	'Copy of pa_proplist from info struct, to decode on first access, see PulseObject.proplist_lazy.'
+	__slots__ = 'ptr',
+	def __init__(self, proplist): self.ptr = c.pa.proplist_copy(proplist)
+	def __del__(self):
+		ptr, self.ptr = getattr(self, 'ptr', None), None
+		if ptr: c.pa.proplist_free(ptr)
+	def decode(self): return proplist_decode(self.ptr)
+
+# There are only few distinct channel maps on any system, so these are cached,
+#  with caches capped in size, as channel_map_cache keys can be arbitrary user-passed strings
+channel_names_cache, channel_map_cache, channel_cache_max = dict(), dict(), 256
+
+def channel_map_names(chan_map, chan_map_raw):
+	'''Returns shared tuple of channel names for PA_CHANNEL_MAP struct,
+		cached by its raw (channels, map[:channels]) values, as passed in chan_map_raw list.'''
+	k = chan_map.channels, tuple(chan_map_raw)
+	names = channel_names_cache.get(k)
+	if names is None:
+		names = tuple()
+		if chan_map.channels > 0:
+			s = c.create_string_buffer(b'\0' * 512)
+			c.pa.channel_map_snprint(s, len(s), chan_map)
+			names = tuple(map(c.force_str, s.value.strip().split(b',')))
+		if len(channel_names_cache) < channel_cache_max: channel_names_cache[k] = names
+	return names
+
+def channel_map_parse(chan_str):
+	'Returns new PA_CHANNEL_MAP struct for comma-separated channel names, using cache for parsing.'
+	chan_str = c.force_bytes(chan_str)
+	chan_map = channel_map_cache.get(chan_str)
+	if chan_map is None:
+		chan_map = c.PA_CHANNEL_MAP()
+		c.pa.channel_map_parse(chan_map, chan_str)
+		if len(channel_map_cache) < channel_cache_max: channel_map_cache[chan_str] = chan_map
+	return c.PA_CHANNEL_MAP.from_buffer_copy(chan_map)
+
+def shared_enums():
+	'''Returns dict with sorted event_types/event_facilities/event_masks enum value lists
+			and channel_list_enum Enum of channel position names from libpulse.
+		These are static, so are only built once on first call, and same objects are returned after that.'''
+	if hasattr(shared_enums, 'cache'): return shared_enums.cache
+	chan_names = dict()
+	for n in range(256):
+		name = c.pa.channel_position_to_string(n)
+		if name is None: break
+		chan_names[n] = name
+	shared_enums.cache = dict(
+		event_types=sorted(PulseEventTypeEnum._values.values()),
+		event_facilities=sorted(PulseEventFacilityEnum._values.values()),
+		event_masks=sorted(PulseEventMaskEnum._values.values()),
+		channel_list_enum=Enum('channel_pos', chan_names) )
+	return shared_enums.cache
+
+def sample_spec_struct(spec):
+	'''Returns PA_SAMPLE_SPEC struct for (format, rate, channels) tuple, or passed struct as-is.
+		"format" can be PulseSampleFormatEnum value, its name (e.g. "s16le", "float32le") or int.'''
+	if not isinstance(spec, c.PA_SAMPLE_SPEC):
+		fmt, rate, channels = spec
+		if not is_num(fmt): fmt = PulseSampleFormatEnum[fmt]._c_val
+		spec = c.PA_SAMPLE_SPEC(format=fmt, rate=rate, channels=channels)
+	if not c.pa.sample_spec_valid(spec):
+		raise PulseError('Invalid sample spec: format={} rate={} channels={}'.format(
+			PulseSampleFormatEnum._c_val(spec.format, spec.format), spec.rate, spec.channels ))
+	return spec
+
+def buffer_attr_struct(attrs):
+	'''Returns PA_BUFFER_ATTR struct for dict with any of its
+			maxlength/tlength/prebuf/minreq/fragsize keys, or passed struct/None as-is.
+		Values that are not specified are set to -1, to use defaults picked by the server.'''
+	if attrs is None or isinstance(attrs, c.PA_BUFFER_ATTR): return attrs
+	fields = list(k for k, t in c.PA_BUFFER_ATTR._fields_)
+	attr_struct = c.PA_BUFFER_ATTR(*[c.PA_INVALID]*len(fields))
+	for k, v in attrs.items():
+		if k not in fields: raise TypeError('Unknown buffer attribute: {!r}'.format(k))
+		setattr(attr_struct, k, v)
+	return attr_struct
+
+def wav_parse(buff):
+	'''Returns ((format, rate, channels), data_view) for WAV file contents in buffer-protocol
+			object, with data_view being memoryview slice of it, or None if it's not RIFF/WAVE data.
+		Raises PulseError for WAV files with sample format that pulseaudio does not support.'''
+	buff = memoryview(buff)
+	if buff[:4].tobytes() != b'RIFF' or buff[8:12].tobytes() != b'WAVE': return None
+	pos, spec = 12, None
+	while pos + 8 <= len(buff):
+		chunk, n = st.unpack('<4sI', buff[pos:pos+8].tobytes())
+		pos += 8
+		if chunk == b'fmt ':
+			try:
+				fmt, chans, rate, bits = st.unpack('<HHI6xH', buff[pos:pos+16].tobytes())
+				if fmt == 0xfffe: fmt, = st.unpack('<H', buff[pos+24:pos+26].tobytes()) # extensible
+			except st.error: raise PulseError('Invalid/truncated WAV data')
+			spec = dict([
+				((1, 8), 'u8'), ((1, 16), 's16le'), ((1, 24), 's24le'), ((1, 32), 's32le'),
+				((3, 32), 'float32le'), ((6, 8), 'alaw'), ((7, 8), 'ulaw') ]).get((fmt, bits))
+			if not spec: raise PulseError('Unsupported WAV sample format: {} ({} bits)'.format(fmt, bits))
+			spec = spec, rate, chans
+		elif chunk == b'data':
+			if not spec: break
+			return spec, buff[pos:pos+n] # n can be larger than file for streamed wavs
+		pos += n + (n & 1)
+	raise PulseError('Failed to find fmt/data chunks in WAV data')
+
+_pcm_formats = dict( # format -> (numpy dtype, array typecode, byteorder, zero offset, full-scale value)
+	u8=('u1', 'B', None, 128, 128), s16le=('<i2', 'h', 'little', 0, 2**15),
+	s16be=('>i2', 'h', 'big', 0, 2**15), float32le=('<f4', 'f', 'little', 0, 1.0),
+	float32be=('>f4', 'f', 'big', 0, 1.0), s32le=('<i4', 'i', 'little', 0, 2**31),
+	s32be=('>i4', 'i', 'big', 0, 2**31) )
+if array.array('i').itemsize != 4:
+	for k in 's32le', 's32be': _pcm_formats[k] = _pcm_formats[k][:1] + ('l',) + _pcm_formats[k][2:]
+
+def _numpy():
+	'Returns numpy module if it is installed or None, only trying to import it once.'
+	if not hasattr(_numpy, 'mod'):
+		try: import numpy as np
+		except ImportError: np = None
+		_numpy.mod = np
+	return _numpy.mod
+
+def pcm_levels(data, sample_spec=('s16le', 44100, 2), use_numpy=None):
+	'''Returns PulseLevelsInfo with per-channel peak, RMS (both in 0-1.0 range)
+			and clipped sample counts for raw PCM data in buffer-protocol object.
+		"sample_spec" is same as with Pulse.record() method, can be e.g. PulseRecordStream.sample_spec,
+			with only u8, s16, s32 and float32 formats supported, and any number of channels.
+		Uses numpy if it's installed (or if use_numpy=True), and array module otherwise,
+			which is much slower, as RMS and float clipping there still involve python objects per sample.
+		Does not need libpulse, so can be used on data from anywhere, e.g. wav_parse() output.
+		Clipped samples are ones at or beyond max full-scale value, e.g. -32768, -32767 and 32767 for s16le.'''
+	if isinstance(sample_spec, c.PA_SAMPLE_SPEC): fmt, chans = sample_spec.format, sample_spec.channels
+	else: fmt, chans = sample_spec[0], sample_spec[2]
+	if is_num(fmt): fmt = PulseSampleFormatEnum._c_val(fmt, fmt)
+	try: dtype, tc, order, offset, scale = _pcm_formats[fmt]
+	except KeyError: raise PulseError('Unsupported sample format for pcm_levels: {}'.format(fmt))
+	if not 0 < chans <= c.PA_CHANNELS_MAX: raise PulseError('Invalid channel count: {}'.format(chans))
+	data = memoryview(data)
+	if data.format != 'B' or data.ndim != 1: data = data.cast('B')
+	frame_size = int(dtype[-1]) * chans
+	frames = len(data) // frame_size
+	if not frames: return PulseLevelsInfo(0, [0.0] * chans, [0.0] * chans, [0] * chans)
+	data = data[:frames * frame_size]
+
+	np = _numpy() if use_numpy is not False else None
+	if use_numpy and not np: raise PulseError('numpy module is not available')
+	if np:
+		buff = np.frombuffer(data, dtype=dtype).reshape(frames, chans).astype(np.float64)
+		if offset: buff -= offset
+		buff = np.abs(buff, out=buff)
+		clip = scale if tc == 'f' else scale - 1
+		peak, clipped = buff.max(axis=0) / scale, (buff >= clip).sum(axis=0)
+		rms = np.sqrt(np.square(buff, out=buff).mean(axis=0)) / scale
+		return PulseLevelsInfo(frames, peak.tolist(), rms.tolist(), clipped.tolist())
+
+	buff = array.array(tc)
+	if hasattr(buff, 'frombytes'): buff.frombytes(data)
+	else: buff.fromstring(data.tobytes()) # py2
+	if order and order != sys.byteorder: buff.byteswap()
+	peak, rms, clipped = list(), list(), list()
+	for n in range(chans):
+		vals = buff[n::chans] if chans > 1 else buff
+		v_max, v_min = max(vals) - offset, min(vals) - offset
+		peak.append(max(v_max, -v_min) / float(scale))
+		sq_sum = sum(map(op.mul, vals, vals))
+		if offset: sq_sum += frames * offset**2 - 2 * offset * sum(vals)
+		rms.append(math.sqrt(max(0, sq_sum) / frames) / scale)
+		if tc == 'f': clipped.append(sum(map((1.0).__le__, vals)) + sum(map((-1.0).__ge__, vals)))
+		else: clipped.append(sum(vals.count(offset + v) for v in [scale - 1, 1 - scale, -scale]))
+	return PulseLevelsInfo(frames, peak, rms, clipped)
+
+def obj_slots(*attrs):
+	'Returns __slots__ tuple for all specified space-separated attribute names.'
+	return tuple(sorted(set(it.chain.from_iterable(v.split() for v in attrs))))
+
 class PulseObject(object):
 
+	# Subclasses define __slots__ with all attributes set on
+	#  them to be more compact, as there can be lots of these around.
+	__slots__ = '__weakref__',
+
 	c_struct_wrappers = dict()
 
+	# Setting this to True will make all info objects only copy C proplist struct on init,
+	#  decoding it into "proplist" dict on first access, which is much faster when listing
+	#  lots of objects, but takes some extra memory until then (if these are kept around).
+	proplist_lazy = False
+
 	def __init__(self, struct=None, *field_data_list, **field_data_dict):
 		field_data, fields = dict(), getattr(self, 'c_struct_fields', list())
-		if is_str_native(fields): fields = self.c_struct_fields = fields.split()
+		if is_str_native(fields): fields = type(self).c_struct_fields = fields.split()
 		if field_data_list: field_data.update(zip(fields, field_data_list))
 		if field_data_dict: field_data.update(field_data_dict)
 		if struct is None: field_data, struct = dict(), field_data
@@ -138,11 +347,8 @@ class PulseObject(object):
 
 		if struct:
 			if hasattr(struct, 'proplist'):
-				self.proplist, state = dict(), c.c_void_p()
-				while True:
-					k = c.pa.proplist_iterate(struct.proplist, c.byref(state))
-					if not k: break
-					self.proplist[c.force_str(k)] = c.force_str(c.pa.proplist_gets(struct.proplist, k))
+				if self.proplist_lazy: self._proplist_lazy = LazyProplist(struct.proplist)
+				else: self.proplist = proplist_decode(struct.proplist)
 			if hasattr(struct, 'volume'):
 				self.volume = self._get_wrapper(PulseVolumeInfo)(struct.volume)
 			if hasattr(struct, 'base_volume'):
@@ -156,19 +362,23 @@ class PulseObject(object):
 				self.port_active = (
 					None if not struct.active_port else cls_port(struct.active_port.contents) )
 			if hasattr(struct, 'channel_map'):
-				self.channel_count, self.channel_list = struct.channel_map.channels, list()
+				self.channel_count = struct.channel_map.channels
 				self.channel_list_raw = struct.channel_map.map[:self.channel_count]
-				if self.channel_count > 0:
-					s = c.create_string_buffer(b'\0' * 512)
-					c.pa.channel_map_snprint(s, len(s), struct.channel_map)
-					self.channel_list.extend(map(c.force_str, s.value.strip().split(b',')))
+				self.channel_list = list(
+					channel_map_names(struct.channel_map, self.channel_list_raw) )
 			if hasattr(struct, 'state'):
 				self.state = PulseStateEnum._c_val(
 					struct.state, u'state.{}'.format(struct.state) )
-				self.state_values = sorted(PulseStateEnum._values.values())
 			if hasattr(struct, 'corked'): self.corked = bool(struct.corked)
 			self._init_from_struct(struct)
 
+	def __getattr__(self, k):
+		# Only called for missing attrs, used to decode lazy proplist on first access
+		if k != 'proplist': raise AttributeError(k)
+		self.proplist = self._proplist_lazy.decode()
+		del self._proplist_lazy
+		return self.proplist
+
 	def _get_wrapper(self, cls_base):
 		return self.c_struct_wrappers.get(cls_base, cls_base)
 
@@ -198,6 +408,7 @@ class PulseObject(object):
 
 class PulsePortInfo(PulseObject):
 	c_struct_fields = 'name description available priority'
+	__slots__ = obj_slots(c_struct_fields, 'available_state')
 
 	def _init_from_struct(self, struct):
 		self.available = PulsePortAvailableEnum._c_val(struct.available)
@@ -211,18 +422,35 @@ class PulsePortInfo(PulseObject):
 
 class PulseClientInfo(PulseObject):
 	c_struct_fields = 'name index driver owner_module'
+	__slots__ = obj_slots(c_struct_fields, 'proplist _proplist_lazy')
 
-class PulseServerInfo(PulseObject):
+class PulseServerInfo(PulseObject): # singleton, so no __slots__ here
 	c_struct_fields = ( 'user_name host_name'
 		' server_version server_name default_sink_name default_source_name cookie' )
 
 class PulseModuleInfo(PulseObject):
 	c_struct_fields = 'index name argument n_used auto_unload'
+	__slots__ = obj_slots(c_struct_fields, 'proplist _proplist_lazy')
+
+class PulseSampleInfo(PulseObject):
+	c_struct_fields = 'index name sample_spec duration bytes lazy filename'
+	__slots__ = obj_slots( c_struct_fields,
+		'proplist _proplist_lazy volume channel_count channel_list channel_list_raw' )
+
+	def _init_from_struct(self, struct):
+		self.lazy = bool(struct.lazy)
+
+	def __str__(self):
+		return self._as_str(self.volume, fields='index name bytes')
 
 class PulseSinkInfo(PulseObject):
 	c_struct_fields = ( 'index name mute'
 		' description sample_spec owner_module latency driver'
 		' monitor_source monitor_source_name flags configured_latency card' )
+	__slots__ = obj_slots( c_struct_fields,
+		'proplist _proplist_lazy volume base_volume port_list port_active state'
+		' channel_count channel_list channel_list_raw' )
+	state_values = sorted(PulseStateEnum._values.values())
 
 	def __str__(self):
 		return self._as_str(self.volume, fields='index name description mute')
@@ -231,6 +459,8 @@ class PulseSinkInputInfo(PulseObject):
 	c_struct_fields = ( 'index name mute corked client'
 		' owner_module sink sample_spec'
 		' buffer_usec sink_usec resample_method driver' )
+	__slots__ = obj_slots( c_struct_fields,
+		'proplist _proplist_lazy volume channel_count channel_list channel_list_raw' )
 
 	def __str__(self):
 		return self._as_str(fields='index name mute')
@@ -239,6 +469,10 @@ class PulseSourceInfo(PulseObject):
 	c_struct_fields = ( 'index name mute'
 		' description sample_spec owner_module latency driver monitor_of_sink'
 		' monitor_of_sink_name flags configured_latency card' )
+	__slots__ = obj_slots( c_struct_fields,
+		'proplist _proplist_lazy volume base_volume port_list port_active state'
+		' channel_count channel_list channel_list_raw' )
+	state_values = sorted(PulseStateEnum._values.values())
 
 	def __str__(self):
 		return self._as_str(self.volume, fields='index name description mute')
@@ -247,15 +481,19 @@ class PulseSourceOutputInfo(PulseObject):
 	c_struct_fields = ( 'index name mute corked client'
 		' owner_module source sample_spec'
 		' buffer_usec source_usec resample_method driver' )
+	__slots__ = obj_slots( c_struct_fields,
+		'proplist _proplist_lazy volume channel_count channel_list channel_list_raw' )
 
 	def __str__(self):
 		return self._as_str(fields='index name mute')
 
 class PulseCardProfileInfo(PulseObject):
 	c_struct_fields = 'name description n_sinks n_sources priority available'
+	__slots__ = obj_slots(c_struct_fields)
 
 class PulseCardPortInfo(PulsePortInfo):
 	c_struct_fields = 'name description available priority direction latency_offset n_profiles'
+	__slots__ = obj_slots('direction latency_offset n_profiles profile_list proplist _proplist_lazy')
 
 	def _init_from_struct(self, struct):
 		super(PulseCardPortInfo, self)._init_from_struct(struct)
@@ -265,6 +503,8 @@ class PulseCardPortInfo(PulsePortInfo):
 
 class PulseCardInfo(PulseObject):
 	c_struct_fields = 'name index driver owner_module n_profiles'
+	__slots__ = obj_slots( c_struct_fields,
+		'proplist _proplist_lazy port_list profile_list profile_active' )
 	c_struct_wrappers = {PulsePortInfo: PulseCardPortInfo}
 
 	def __init__(self, struct):
@@ -279,6 +519,7 @@ class PulseCardInfo(PulseObject):
 			profile_active='[{}]'.format(self.profile_active.name) )
 
 class PulseVolumeInfo(PulseObject):
+	__slots__ = 'values',
 
 	def __init__(self, struct_or_values=None, channels=None):
 		if is_num(struct_or_values):
@@ -306,17 +547,16 @@ class PulseVolumeInfo(PulseObject):
 
 class PulseExtStreamRestoreInfo(PulseObject):
 	c_struct_fields = 'name channel_map volume mute device'
+	__slots__ = obj_slots(c_struct_fields, 'channel_count channel_list channel_list_raw')
 
 	@classmethod
 	def struct_from_value( cls, name, volume,
 			channel_list=None, mute=False, device=None ):
 		'Same arguments as with class instance init.'
-		chan_map = c.PA_CHANNEL_MAP()
-		if not channel_list: c.pa.channel_map_init_mono(chan_map)
-		else:
-			if not is_str(channel_list):
-				channel_list = b','.join(map(c.force_bytes, channel_list))
-			c.pa.channel_map_parse(chan_map, channel_list)
+		if not channel_list: channel_list = b'mono' # same as pa_channel_map_init_mono()
+		elif not is_str(channel_list):
+			channel_list = b','.join(map(c.force_bytes, channel_list))
+		chan_map = channel_map_parse(channel_list)
 		if not isinstance(volume, PulseVolumeInfo):
 			volume = PulseVolumeInfo(volume, chan_map.channels)
 		struct = c.PA_EXT_STREAM_RESTORE_INFO(
@@ -346,6 +586,7 @@ class PulseExtStreamRestoreInfo(PulseObject):
 		return self._as_str(self.volume, fields='name mute device')
 
 class PulseEventInfo(PulseObject):
+	__slots__ = 't', 'facility', 'index'
 
 	def __init__(self, ev_t, facility, index):
 		self.t, self.facility, self.index = ev_t, facility, index
@@ -353,12 +594,585 @@ class PulseEventInfo(PulseObject):
 	def __str__(self):
 		return self._as_str(fields='t facility index'.split())
 
+def event_table(facilities=None, types=None):
+	'''Returns list of (type, facility) enum values or None for all possible
+			pa_subscription_event_type_t values (64), to look up events by "ev & 0x3f".
+		Events with facilities/types not in specified lists (if not None) are None there,
+			so empty list there filters-out all events, same as "indexes" in event_callback_set().'''
+	if facilities is None and types is None and hasattr(event_table, 'full'): return event_table.full
+	if facilities is not None: facilities = set(PulseEventFacilityEnum[k] for k in facilities)
+	if types is not None: types = set(PulseEventTypeEnum[k] for k in types)
+	table, ev_mask = list(), c.PA_SUBSCRIPTION_EVENT_FACILITY_MASK | c.PA_SUBSCRIPTION_EVENT_TYPE_MASK
+	for ev in range(ev_mask + 1):
+		n = ev & c.PA_SUBSCRIPTION_EVENT_FACILITY_MASK
+		ev_fac = PulseEventFacilityEnum._c_val(n, 'ev.facility.{}'.format(n))
+		n = ev & c.PA_SUBSCRIPTION_EVENT_TYPE_MASK
+		ev_t = PulseEventTypeEnum._c_val(n, 'ev.type.{}'.format(n))
+		if ( (facilities is not None and ev_fac not in facilities)
+				or (types is not None and ev_t not in types) ): table.append(None)
+		else: table.append((ev_t, ev_fac))
+	if facilities is None and types is None: event_table.full = table
+	return table
+
+def event_coalesce(events, ev):
+	'''Adds PulseEventInfo to {(facility, index): event} dict (usually OrderedDict),
+			keeping only one new/change/remove event there per object, depending on how
+			it changed overall - e.g. new+change -> new, change+remove -> remove, remove+new -> change.
+		"remove" always replaces earlier events, incl. new+remove, as object is gone either way.
+		Returns False if event was simply added, or True if it was merged with existing one.'''
+	key = ev.facility, ev.index
+	ev0 = events.get(key)
+	if ev0 is None:
+		events[key] = ev
+		return False
+	if ev.t == 'remove': events[key] = ev
+	elif ev0.t == 'remove': # re-created with same index
+		events[key] = PulseEventInfo(PulseEventTypeEnum.change, ev.facility, ev.index)
+	return True
+
+class PulseSnapshotInfo(PulseObject): # one-off result object, no need for __slots__
+	obj_lists = 'sinks sources sink_inputs source_outputs cards clients modules'.split()
+
+	def __init__( self, server, sinks, sources,
+			sink_inputs, source_outputs, cards, clients, modules ):
+		self.server, self.sinks, self.sources = server, sinks, sources
+		self.sink_inputs, self.source_outputs = sink_inputs, source_outputs
+		self.cards, self.clients, self.modules = cards, clients, modules
+
+	def __str__(self):
+		return self._as_str(**dict((k, len(getattr(self, k))) for k in self.obj_lists))
+
+class PulseBatchOpInfo(PulseObject):
+	__slots__ = 'op', 'args', 'success'
+
+	def __init__(self, op, args, success=None):
+		self.op, self.args, self.success = op, args, success
+
+	def __str__(self):
+		return self._as_str(fields='op success')
+
+
+class PulseLevelsInfo(PulseObject):
+	__slots__ = 'frames', 'peak', 'rms', 'clipped'
+
+	def __init__(self, frames, peak, rms, clipped):
+		self.frames, self.peak, self.rms, self.clipped = frames, peak, rms, clipped
+
+	def __str__(self):
+		return self._as_str(fields='frames peak rms clipped')
+
+
+class PulseCallStatsInfo(PulseObject):
+	__slots__ = 'method', 'calls', 'errors', 'roundtrips', 'time_total', 'time_max', 'hist'
+
+	def __init__(self, method, buckets):
+		self.method, self.calls, self.errors, self.roundtrips = method, 0, 0, 0
+		self.time_total = self.time_max = 0
+		self.hist = [0] * (len(buckets) + 1) # last one is for values above all buckets
+
+	def __str__(self):
+		return self._as_str(fields='method calls errors roundtrips time_total time_max')
+
+class PulseStats(object):
+	'''Per-method call counters and latency histograms, see Pulse.stats_enable().
+		"buckets" are histogram upper bounds in seconds, same as in Prometheus histograms.'''
+
+	buckets = 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+
+	def __init__(self, buckets=None):
+		if buckets: self.buckets = tuple(sorted(buckets))
+		self.methods, self._lock = dict(), threading.Lock()
+
+	def add(self, method, duration, roundtrips, error=False):
+		with self._lock:
+			info = self.methods.get(method)
+			if not info: info = self.methods[method] = PulseCallStatsInfo(method, self.buckets)
+			info.calls, info.roundtrips = info.calls + 1, info.roundtrips + roundtrips
+			if error: info.errors += 1
+			info.time_total += duration
+			if duration > info.time_max: info.time_max = duration
+			for n, le in enumerate(self.buckets):
+				if duration <= le: break
+			else: n = len(self.buckets)
+			info.hist[n] += 1
+
+	def info(self, reset=False):
+		'''Returns {method: PulseCallStatsInfo} dict with copies of current values.'''
+		with self._lock:
+			res = dict()
+			for k, info in self.methods.items():
+				res[k] = info_copy = PulseCallStatsInfo(k, self.buckets)
+				for attr in info.__slots__: setattr(info_copy, attr, getattr(info, attr))
+				info_copy.hist = list(info.hist)
+			if reset: self.methods.clear()
+		return res
+
+	def prometheus(self, prefix='pulsectl', labels=None):
+		'''Returns stats as Prometheus text exposition format string.
+			"labels" can be a dict of extra labels to add to all metrics.'''
+		def _labels(method, **extra):
+			ls = sorted((labels or dict()).items()) + [('method', method)] + sorted(extra.items())
+			return ','.join('{}="{}"'.format( k,
+				'{}'.format(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') ) for k, v in ls)
+		methods, lines = sorted(self.info().items()), list()
+		for k, t, desc, attr in [
+				('calls_total', 'counter', 'Number of method calls.', 'calls'),
+				('errors_total', 'counter', 'Number of method calls that raised an error.', 'errors'),
+				('roundtrips_total', 'counter', 'Number of server requests sent by method calls.', 'roundtrips') ]:
+			lines.extend(['# HELP {}_{} {}'.format(prefix, k, desc), '# TYPE {}_{} {}'.format(prefix, k, t)])
+			for method, info in methods:
+				lines.append('{}_{}{{{}}} {}'.format(prefix, k, _labels(method), getattr(info, attr)))
+		k = '{}_call_duration_seconds'.format(prefix)
+		lines.extend(['# HELP {} Method call latency.'.format(k), '# TYPE {} histogram'.format(k)])
+		for method, info in methods:
+			n = 0
+			for le, v in zip(self.buckets + ('+Inf',), info.hist):
+				n += v
+				lines.append('{}_bucket{{{}}} {}'.format(k, _labels(method, le=le), n))
+			lines.append('{}_sum{{{}}} {!r}'.format(k, _labels(method), info.time_total))
+			lines.append('{}_count{{{}}} {}'.format(k, _labels(method), info.calls))
+		return '\n'.join(lines) + '\n'
+
+
+class PulsePeakMonitor(object):
+	'''Persistent peak-detect record stream, returned by Pulse.peak_monitor() method.
+
+		Peak values are received when pulse eventloop is running, e.g. in poll() or when
+			iterating over this object, and stored as (timestamp, peak) tuples in "samples" deque,
+			dropping ones that are older than "window" seconds, with latest/peak properties
+			returning last such tuple and max peak value within window, respectively.
+		Timestamps are from same monotonic clock as used for timeouts in this module.
+		With PulseThreaded client, values are received all the time in a background thread.
+
+		Iterating over this object yields all new (timestamp, peak) tuples as they arrive,
+			until close() is called or connection to the server is lost (PulseDisconnected).
+		Must be closed via close() method or using it as a context manager.'''
+
+	def __init__(self, pulse, source=None, stream_idx=None, rate=25, window=1.0):
+		if not window > 0: raise PulseError('Peak monitor window must be positive: {!r}'.format(window))
+		self.pulse, self.rate, self.window = pulse, rate, window
+		self.samples, self._count = deque(), 0
+		self._stream, self._stream_cb = pulse._peak_stream_open(
+			source, stream_idx, rate, self._values_cb )
+
+	def _values_cb(self, values):
+		ts, n = c.mono_time(), len(values) - 1
+		for m, v in enumerate(values):
+			self.samples.append((ts - float(n - m) / self.rate, min(1.0, v)))
+		ts_min = ts - self.window
+		while self.samples and self.samples[0][0] < ts_min: self.samples.popleft()
+		self._count += len(values)
+		self.pulse._pulse_wakeup()
+
+	@property
+	def latest(self):
+		'Most recent (timestamp, peak) tuple or None if there were no values yet.'
+		try: return self.samples[-1]
+		except IndexError: return None
+
+	@property
+	def peak(self):
+		'Max peak value within last "window" seconds, 0 if there were none.'
+		ts_min = c.mono_time() - self.window
+		return max([0] + list(v for ts, v in list(self.samples) if ts >= ts_min))
+
+	def poll(self, timeout=0):
+		'''Runs pulse eventloop until new peak value(s) are received or timeout passes,
+				returning latest (timestamp, peak) tuple, same as "latest" property.
+			timeout should be in seconds (float),
+				0 (default) for non-blocking poll and None for no timeout.'''
+		count = self._count
+		self.pulse._pulse_wait(lambda: not self._stream or self._count != count, timeout)
+		return self.latest
+
+	def __iter__(self):
+		ts_last = self.samples[-1][0] if self.samples else 0
+		while self._stream:
+			samples = list(s for s in list(self.samples) if s[0] > ts_last)
+			if not samples:
+				self.poll(None)
+				continue
+			for s in samples: yield s
+			ts_last = samples[-1][0]
+
+	def close(self):
+		if not self._stream: return
+		try: self.pulse._peak_stream_close(self._stream)
+		finally: self._stream = self._stream_cb = None
+
+	def __enter__(self): return self
+	def __exit__(self, err_t, err, err_tb): self.close()
+
+
+class PulseEventQueue(object):
+	'''Iterator over PulseEventInfo objects, returned by Pulse.events() method.
+
+		Sets itself as pulse.event_callback, queueing events there, and runs pulse eventloop
+			(same as event_listen) when queue is empty, yielding queued events otherwise.
+		Pulse eventloop is not running while events are yielded, so any pulse calls
+			can be made between iterations, with events received during those queued as well.
+		Iteration stops if no events are received within "timeout" seconds, if it's not None,
+			but can be resumed, and previous event_callback is restored on close().
+
+		Queue is bounded by "maxsize" (0 - unlimited), with oldest events dropped on overflow.
+		"coalesce=True" keeps only one event per object in the queue, same as batch
+			mode in Pulse.event_callback_set(), which should not overflow it as easily.
+		Counters for received/dropped/coalesced events and high_water
+			(max queue length) attributes can be used to check how consumer keeps up.'''
+
+	_cb_attrs = 'event_callback event_batch event_batch_max _ev_batch _ev_table _ev_indexes'.split()
+
+	def __init__( self, pulse, timeout=None, maxsize=1024,
+			coalesce=False, facilities=None, types=None, indexes=None ):
+		self.pulse, self.timeout, self.maxsize, self.coalesce = pulse, timeout, maxsize, coalesce
+		self.received = self.dropped = self.coalesced = self.high_water = 0
+		self._queue = OrderedDict() if coalesce else deque()
+		self._cb_prev = list(getattr(pulse, k) for k in self._cb_attrs)
+		pulse.event_callback_set(self._event_cb, facilities=facilities, types=types, indexes=indexes)
+
+	def _event_cb(self, ev):
+		queue = self._queue
+		self.received += 1
+		if not self.coalesce: queue.append(ev)
+		elif event_coalesce(queue, ev): self.coalesced += 1
+		if self.maxsize and len(queue) > self.maxsize:
+			if self.coalesce: queue.popitem(last=False)
+			else: queue.popleft()
+			self.dropped += 1
+		if len(queue) > self.high_water: self.high_water = len(queue)
+		raise PulseLoopStop
+
+	@property
+	def stats(self):
+		'Dict of received/dropped/coalesced/high_water counters and current queue length.'
+		return dict( received=self.received, dropped=self.dropped,
+			coalesced=self.coalesced, high_water=self.high_water, queued=len(self._queue) )
+
+	def __len__(self): return len(self._queue)
+
+	def __iter__(self): return self
+
+	def __next__(self):
+		ts_deadline = None if self.timeout is None else c.mono_time() + self.timeout
+		while not self._queue:
+			if self._cb_prev is None: raise StopIteration
+			delay = None if ts_deadline is None else ts_deadline - c.mono_time()
+			if delay is not None and delay <= 0: raise StopIteration
+			self.pulse.event_listen(delay)
+		if self.coalesce: return self._queue.popitem(last=False)[1]
+		return self._queue.popleft()
+	next = __next__ # py2
+
+	def close(self):
+		'''Restores previous pulse.event_callback, stopping event collection.
+			Events that were already queued can still be iterated over.'''
+		if self._cb_prev is None: return
+		cb_prev, self._cb_prev = self._cb_prev, None
+		if self.pulse.event_callback == self._event_cb:
+			for k, v in zip(self._cb_attrs, cb_prev): setattr(self.pulse, k, v)
+
+	def __enter__(self): return self
+	def __exit__(self, err_t, err, err_tb): self.close()
+
+
+class PulseStream(object):
+	'''Base class for pa_stream wrappers like PulseRecordStream,
+			which should be created via corresponding Pulse methods.
+		Must be closed via close() method or using it as a context manager.'''
+
+	def __init__(self, pulse, name, sample_spec):
+		self.pulse, self.sample_spec = pulse, sample_spec_struct(sample_spec)
+		self.frame_size = c.pa.frame_size(self.sample_spec)
+		self._state_cb = c.PA_STREAM_NOTIFY_CB_T(lambda s, userdata: self._wakeup())
+		with pulse._ctx_lock:
+			self._stream = c.pa.stream_new_with_proplist(
+				pulse._ctx, name, c.byref(self.sample_spec), None, None )
+			if not self._stream: raise PulseError('Failed to create stream: {!r}'.format(name))
+			c.pa.stream_set_state_callback(self._stream, self._state_cb, None)
+
+	def _wakeup(self): self.pulse._pulse_wakeup()
+
+	def _wait(self, check, timeout=None):
+		'''Runs pulse eventloop until check() returns True-ish value or timeout passes, returning it.
+			check() is called with pulse._ctx_lock held, and can call _ready() to check stream state.'''
+		def _check():
+			if not self._stream: raise PulseError('Stream is closed')
+			return check()
+		return self.pulse._pulse_wait(_check, timeout)
+
+	def _ready(self):
+		'''Returns True if stream is ready, False if it is not connected yet,
+			or raises PulseError if stream has failed or was terminated by the server.'''
+		state = c.pa.stream_get_state(self._stream)
+		if state == c.PA_STREAM_READY: return True
+		if state in [c.PA_STREAM_FAILED, c.PA_STREAM_TERMINATED]:
+			raise PulseError('Stream is in {} state: {}'.format(
+				PulseStreamStateEnum._c_val(state), c.pa.strerror(c.pa.context_errno(self.pulse._ctx)) ))
+		return False
+
+	@property
+	def state(self):
+		'PulseStreamStateEnum value for current stream state, e.g. "ready" or "failed".'
+		if not self._stream: return PulseStreamStateEnum.terminated
+		with self.pulse._ctx_lock:
+			return PulseStreamStateEnum._c_val(c.pa.stream_get_state(self._stream))
+
+	def wait_ready(self, timeout=None):
+		'''Waits until stream is connected and ready, returning True,
+			or False if timeout passes, raising PulseError if it fails instead.'''
+		return self._wait(self._ready, timeout)
+
+	def cork(self, paused=True, timeout=KeyError):
+		'''Pauses data transfer for the stream (or resumes it with paused=False).
+			Can be used to stop the server from sending or playing more data until resumed.
+			Server replies right away, so "timeout" defaults to pulse.op_timeout, same as other calls.'''
+		with self.pulse._pulse_op_cb(raw=True, timeout=timeout) as cb:
+			cb = c.PA_STREAM_SUCCESS_CB_T(lambda s, success, userdata, cb=cb: cb(success))
+			c.pa.operation_unref(self.pulse._pulse_op_track(
+				c.pa.stream_cork(self._stream, int(bool(paused)), cb, None) ))
+
+	def close(self):
+		if not self._stream: return
+		try:
+			with self.pulse._ctx_lock:
+				try: c.pa.stream_disconnect(self._stream)
+				except c.pa.CallError: pass # was never connected or removed already
+				c.pa.stream_unref(self._stream)
+		finally: self._stream = None
+
+	def __enter__(self): return self
+	def __exit__(self, err_t, err, err_tb): self.close()
+
+
+class PulseWriteStream(PulseStream):
+	'''Base for writable streams, with write() copying data from any buffer-protocol object
+		(bytes, bytearray, array.array, mmap, numpy arrays, etc) directly into memory
+		provided by libpulse via pa_stream_begin_write(), without intermediate python copies.'''
+
+	def __init__(self, pulse, name, sample_spec):
+		super(PulseWriteStream, self).__init__(pulse, name, sample_spec)
+		self._write_cb = c.PA_STREAM_REQUEST_CB_T(lambda s, bs, userdata: self._wakeup())
+		with pulse._ctx_lock: c.pa.stream_set_write_callback(self._stream, self._write_cb, None)
+
+	def _writable(self):
+		if not self._ready(): return 0
+		n = c.pa.stream_writable_size(self._stream)
+		return n if n < 2**(8 * c.sizeof(c.c_size_t)) - 1 else 0 # (size_t) -1 on errors
+
+	@property
+	def writable_size(self):
+		'Number of bytes that can be written to the stream without waiting.'
+		if not self._stream: return 0
+		with self.pulse._ctx_lock: return self._writable()
+
+	def write(self, data, timeout=None):
+		'''Writes all data from buffer-protocol object to the stream,
+				waiting for the server to request more as necessary, and returns number of bytes written.
+			"timeout" is in seconds (float) for the whole operation, None (default) to wait indefinitely,
+				with return value being less than data length in bytes if it passes before everything is written.
+			Data is sent as-is, so must match sample_spec of the stream,
+				and should consist of whole frames (see frame_size attribute).'''
+		src = memoryview(data)
+		if src.format != 'B' or src.ndim != 1: src = src.cast('B')
+		n, n_max = 0, len(src)
+		ts_deadline = None if timeout is None else c.mono_time() + timeout
+		while n < n_max:
+			delay = None if ts_deadline is None else max(0, ts_deadline - c.mono_time())
+			writable = self._wait(self._writable, delay)
+			if not writable: break
+			with self.pulse._ctx_lock: # chunks are limited to what server requested, to avoid overruns
+				buff, bs = c.c_void_p(), c.c_size_t(min(writable, n_max - n))
+				c.pa.stream_begin_write(self._stream, buff, c.byref(bs))
+				m = min(bs.value, writable, n_max - n)
+				try: c.mem_view(buff.value, m)[:] = src[n:n+m]
+				except:
+					c.pa.stream_cancel_write(self._stream)
+					raise
+				c.pa.stream_write(self._stream, buff, m, None, 0, c.PA_SEEK_RELATIVE)
+			n += m
+		return n
+
+
+class PulseRecordStream(PulseStream):
+	'''Raw PCM record stream, returned by Pulse.record() method.
+
+		Data is received into libpulse buffer when pulse eventloop runs, e.g. when waiting for
+			it in read() or read_into(), and released from there only after it is processed,
+			so that memory usage is bounded by "maxlength" buffer attribute.
+		cork() method can be used to pause stream on the server, if data is not needed for a while,
+			and "readable_size" property to check how much data is buffered.
+
+		Holes in the stream (e.g. from dropped data, buffer underruns on the server)
+			are skipped, or returned as zero-filled data if hole_fill=True was used,
+			with total length of these (in bytes) counted in "holes" attribute.'''
+
+	def __init__( self, pulse, source=None, sample_spec=('s16le', 44100, 2),
+			buffer_attr=None, stream_idx=None, hole_fill=False, name='record' ):
+		super(PulseRecordStream, self).__init__(pulse, name, sample_spec)
+		self.holes, self.hole_fill, self._frag = 0, hole_fill, None
+		self._read_cb = c.PA_STREAM_REQUEST_CB_T(lambda s, bs, userdata: self._wakeup())
+		if source is not None: source = unicode(source).encode('utf-8')
+		with pulse._ctx_lock:
+			if stream_idx is not None: c.pa.stream_set_monitor_stream(self._stream, stream_idx)
+			c.pa.stream_set_read_callback(self._stream, self._read_cb, None)
+			try:
+				c.pa.stream_connect_record( self._stream, source,
+					buffer_attr_struct(buffer_attr), c.PA_STREAM_ADJUST_LATENCY )
+			except c.pa.CallError:
+				self.close()
+				raise
+
+	@property
+	def readable_size(self):
+		'Number of bytes buffered in libpulse and available for reading without waiting.'
+		with self.pulse._ctx_lock:
+			n = c.pa.stream_readable_size(self._stream) if self._stream else 0
+		if self._frag: n += len(self._frag[0]) - self._frag[1]
+		return n if n < 2**(8 * c.sizeof(c.c_size_t)) - 1 else 0 # (size_t) -1 on errors
+
+	def _frag_get(self):
+		'''Returns current [view, pos, peeked] fragment, with next one
+				peeked from libpulse buffer if current one was fully read, or None if there's none.
+			Must be called with pulse._ctx_lock held.'''
+		frag = self._frag
+		if frag and frag[1] < len(frag[0]): return frag
+		self.drop()
+		while self._ready():
+			buff, bs = c.c_void_p(), c.c_size_t()
+			c.pa.stream_peek(self._stream, buff, c.byref(bs))
+			if not bs.value: break
+			if buff.value:
+				self._frag = [c.mem_view(buff.value, bs.value), 0, True]
+				break
+			self.holes += bs.value
+			c.pa.stream_drop(self._stream)
+			if self.hole_fill:
+				self._frag = [memoryview(bytearray(bs.value)), 0, False]
+				break
+		return self._frag
+
+	def drop(self):
+		'''Releases current data fragment in libpulse buffer, if there is one.
+			Done automatically when next one is needed or on close(),
+				but can be used to free libpulse memory sooner, discarding any unread data there.'''
+		frag, self._frag = self._frag, None
+		if not frag or not frag[2]: return
+		try: frag[0].release()
+		except (AttributeError, BufferError): pass # py2 or views exported from it
+		with self.pulse._ctx_lock: c.pa.stream_drop(self._stream)
+
+	def read(self, timeout=None):
+		'''Returns memoryview of unsigned bytes for next recorded data fragment,
+				waiting for it for up to "timeout" seconds, or returning None after that.
+			"timeout" is in seconds (float), None (default) to wait indefinitely, 0 for non-blocking read.
+			Returned memoryview points directly to libpulse memory, and is only
+				valid until next read/read_into/drop/close call, so must be copied or processed before that.'''
+		frag = self._wait(self._frag_get, timeout)
+		if not frag: return None
+		view, pos = frag[:2]
+		frag[1] = len(view)
+		return view[pos:] if pos else view
+
+	def read_into(self, buff, timeout=None):
+		'''Copies recorded data into writable buffer-protocol object (e.g. bytearray,
+				array.array or numpy array), until it is full or timeout passes, returning number of bytes copied.
+			"timeout" is same as for read(), but for whole operation, not each fragment.
+			Sample data is copied as-is, without any conversion, so destination
+				format should match sample_spec of the stream, e.g. array("h") for s16le on x86.'''
+		dst = memoryview(buff)
+		if dst.format != 'B': dst = dst.cast('B')
+		n, n_max = 0, len(dst)
+		ts_deadline = None if timeout is None else c.mono_time() + timeout
+		while n < n_max:
+			delay = None if ts_deadline is None else max(0, ts_deadline - c.mono_time())
+			frag = self._wait(self._frag_get, delay)
+			if not frag: break
+			view, pos = frag[:2]
+			m = min(len(view) - pos, n_max - n)
+			dst[n:n+m], frag[1] = view[pos:pos+m], pos + m
+			n += m
+		return n
+
+	def read_levels(self, timeout=None):
+		'''Reads next data fragment same as read() and returns pcm_levels() for it,
+			i.e. PulseLevelsInfo with per-channel peak/rms/clipped values, or None on timeout.'''
+		view = self.read(timeout)
+		return pcm_levels(view, self.sample_spec) if view is not None else None
+
+	def __iter__(self):
+		'''Yields memoryviews from read() calls until stream is closed or fails.
+			Same as with read(), each yielded view is only valid until next one.'''
+		while self._stream:
+			view = self.read()
+			if view is not None: yield view
+
+	def close(self):
+		if self._stream: self.drop()
+		super(PulseRecordStream, self).close()
+
+
+class PulseSampleUploadStream(PulseWriteStream):
+	'''Stream to upload sample of specified length to server sample cache.
+		Used by Pulse.sample_upload() method, where sample is written via write() and finish().'''
+
+	def __init__(self, pulse, name, sample_spec, length):
+		super(PulseSampleUploadStream, self).__init__(pulse, name, sample_spec)
+		with pulse._ctx_lock:
+			try: c.pa.stream_connect_upload(self._stream, length)
+			except c.pa.CallError:
+				self.close()
+				raise
+
+	def finish(self, timeout=KeyError):
+		'''Completes the upload, waiting for the server to store the sample.
+			Raises PulseError if sample was not stored, e.g. due to incomplete or invalid data,
+				or PulseTimeout if "timeout" (default - pulse.op_timeout) passes before that.'''
+		if timeout is KeyError: timeout = self.pulse.op_timeout
+		with self.pulse._ctx_lock: c.pa.stream_finish_upload(self._stream)
+		def _stored():
+			state = c.pa.stream_get_state(self._stream)
+			if state == c.PA_STREAM_TERMINATED: return True # upload is done
+			return self._ready() and False
+		if not self._wait(_stored, timeout):
+			raise PulseTimeout('Timed-out waiting for sample upload to finish [{:,.1f}s]'.format(timeout))
+
+
+class PulsePlaybackStream(PulseWriteStream):
+	'''Raw PCM playback stream, returned by Pulse.play_stream() method.
+
+		write() waits for the server to request more data when its buffer is full,
+			and copies it directly into libpulse memory, without intermediate python copies.
+		drain() can be used to wait until all written data was played.'''
+
+	def __init__( self, pulse, sink=None,
+			sample_spec=('s16le', 44100, 2), buffer_attr=None, name='playback' ):
+		super(PulsePlaybackStream, self).__init__(pulse, name, sample_spec)
+		if sink is not None: sink = unicode(sink).encode('utf-8')
+		with pulse._ctx_lock:
+			try:
+				c.pa.stream_connect_playback( self._stream, sink,
+					buffer_attr_struct(buffer_attr), c.PA_STREAM_ADJUST_LATENCY, None, None )
+			except c.pa.CallError:
+				self.close()
+				raise
+
+	def drain(self, timeout=None):
+		'''Waits until all data written to the stream was played by the server.
+			Also starts playback if less than "prebuf" buffer attribute was written so far.
+			"timeout" (seconds) is separate from op_timeout, as draining takes as long
+				as buffered audio plays, and is None (no timeout) by default, raising PulseTimeout otherwise.'''
+		with self.pulse._pulse_op_cb(raw=True, timeout=timeout) as cb:
+			cb = c.PA_STREAM_SUCCESS_CB_T(lambda s, success, userdata, cb=cb: cb(success))
+			c.pa.operation_unref(self.pulse._pulse_op_track(c.pa.stream_drain(self._stream, cb, None)))
+
 
 class Pulse(object):
 
 	_ctx = None
+	_ev_held_max = 1024 # events held during _pulse_wait(), same as PulseEventQueue maxsize
 
-	def __init__(self, client_name=None, server=None, connect=True, threading_lock=False):
+	def __init__( self, client_name=None,
+			server=None, connect=True, threading_lock=False, op_timeout=None, reconnect=False ):
 		'''Connects to specified pulse server by default.
 			Specifying "connect=False" here prevents that, but be sure to call connect() later.
 			"connect=False" can also be used here to
@@ -366,16 +1180,22 @@ class Pulse(object):
 			"threading_lock" option (either bool or lock instance) can be used to wrap
 				non-threadsafe eventloop polling (can only be done from one thread at a time)
 				into a mutex lock, and should only be needed if same-instance methods
-				will/should/might be called from different threads at the same time.'''
-		self.name = client_name or 'pulsectl'
-		self.server, self.connected = server, None
-		self._ret = self._ctx = self._loop = self._api = None
-		self._actions, self._action_ids = dict(),\
+				will/should/might be called from different threads at the same time.
+			"op_timeout" sets default timeout (seconds) for any blocking pulse operations,
+				raising PulseTimeout after cancelling operation, if server does not respond in time.
+				Can be overridden for info/control methods (e.g. sink_list, sink_mute) via same kw.
+			"reconnect=True" enables automatic reconnection with default reconnect_set() options.'''
+		self.name, self.op_timeout = client_name or 'pulsectl', op_timeout
+		self.server, self.connected, self.reconnects = server, None, 0
+		self._ret = self._ctx = self._loop = self._api = self._batch = self._op_act_id = None
+		self._reconnect = self._event_masks = self._stats = None
+		self._conn_lost, self._op_local = False, threading.local()
+		self._actions, self._action_ops, self._action_ids = dict(), dict(),\
 			it.chain.from_iterable(map(range, it.repeat(2**30)))
 		self.init()
+		if reconnect: self.reconnect_set()
 		if threading_lock:
 			if threading_lock is True:
-				import threading
 				threading_lock = threading.Lock()
 			self._loop_lock = threading_lock
 		if connect:
@@ -388,23 +1208,25 @@ class Pulse(object):
 		self._pa_state_cb = c.PA_STATE_CB_T(self._pulse_state_cb)
 		self._pa_subscribe_cb = c.PA_SUBSCRIBE_CB_T(self._pulse_subscribe_cb)
 
-		self._loop, self._loop_lock = c.pa.mainloop_new(), FakeLock()
+		self._loop_init()
+		self._ret = c.pa.return_value()
+		with self._ctx_lock: self._ctx_init()
+		self.event_callback = self.event_batch = self.event_batch_max = None
+		self._ev_batch = self._ev_indexes = None
+		self._ev_table, self._ev_hold = event_table(), False
+		self._ev_held, self.event_held_dropped = deque(maxlen=self._ev_held_max), 0
+
+	def _shared_enum(k):
+		return property( lambda self: shared_enums()[k],
+			doc='Same {} value for all instances, see shared_enums() function.'.format(k) )
+	event_types, event_facilities, event_masks, channel_list_enum = map(
+		_shared_enum, ['event_types', 'event_facilities', 'event_masks', 'channel_list_enum'] )
+	del _shared_enum
+
+	def _loop_init(self):
+		self._loop, self._loop_lock, self._ctx_lock = c.pa.mainloop_new(), FakeLock(), FakeLock()
 		self._loop_running = self._loop_closed = False
 		self._api = c.pa.mainloop_get_api(self._loop)
-		self._ret = c.pa.return_value()
-
-		self._ctx_init()
-		self.event_types = sorted(PulseEventTypeEnum._values.values())
-		self.event_facilities = sorted(PulseEventFacilityEnum._values.values())
-		self.event_masks = sorted(PulseEventMaskEnum._values.values())
-		self.event_callback = None
-
-		chan_names = dict()
-		for n in range(256):
-			name = c.pa.channel_position_to_string(n)
-			if name is None: break
-			chan_names[n] = name
-		self.channel_list_enum = Enum('channel_pos', chan_names)
 
 	def _ctx_init(self):
 		if self._ctx:
@@ -423,12 +1245,17 @@ class Pulse(object):
 		if self._loop_closed:
 			raise PulseError('Eventloop object was already'
 				' destroyed and cannot be reused from this instance.')
-		if self.connected is not None: self._ctx_init()
-		flags, self.connected = 0, None
-		if not autospawn: flags |= c.PA_CONTEXT_NOAUTOSPAWN
-		if wait: flags |= c.PA_CONTEXT_NOFAIL
-		try: c.pa.context_connect(self._ctx, self.server, flags, None)
-		except c.pa.CallError: self.connected = False
+		with self._ctx_lock:
+			if self.connected is not None: self._ctx_init()
+			flags, self.connected, self._conn_lost = 0, None, False
+			if not autospawn: flags |= c.PA_CONTEXT_NOAUTOSPAWN
+			if wait: flags |= c.PA_CONTEXT_NOFAIL
+			try: c.pa.context_connect(self._ctx, self.server, flags, None)
+			except c.pa.CallError: self.connected = False
+			self._pulse_connect_wait(timeout)
+		if self.connected is False: raise PulseError('Failed to connect to pulseaudio server')
+
+	def _pulse_connect_wait(self, timeout=None):
 		if not timeout: # simplier process
 			while self.connected is None: self._pulse_iterate()
 		else:
@@ -442,11 +1269,10 @@ class Pulse(object):
 				c.pa.context_disconnect(self._ctx)
 				while self.connected is not False: self._pulse_iterate()
 				raise PulseError('Timed-out connecting to pulseaudio server [{:,.1f}s]'.format(timeout))
-		if self.connected is False: raise PulseError('Failed to connect to pulseaudio server')
 
 	def disconnect(self):
 		if not self._ctx or not self.connected: return
-		c.pa.context_disconnect(self._ctx)
+		with self._ctx_lock: c.pa.context_disconnect(self._ctx)
 
 	def close(self):
 		if not self._loop: return
@@ -470,17 +1296,107 @@ class Pulse(object):
 		if state >= c.PA_CONTEXT_READY:
 			if state == c.PA_CONTEXT_READY: self.connected = True
 			elif state in [c.PA_CONTEXT_FAILED, c.PA_CONTEXT_TERMINATED]:
+				# FAILED after being connected = lost connection, TERMINATED = disconnect() call
+				if state == c.PA_CONTEXT_FAILED and self.connected: self._conn_lost = True
 				self.connected, self._loop_stop = False, True
 
+	def reconnect_set( self, enabled=True,
+			delay_min=0.1, delay_max=10.0, attempts=None, timeout=5.0, retry=True ):
+		'''Enables (or disables with enabled=False) automatic reconnection to the server,
+				when connection to it is lost (e.g. on server restart), but not after disconnect() calls.
+			Reconnection is attempted on next operation or from event_listen() and events(),
+				with randomized exponential backoff delays between "delay_min" and "delay_max" seconds,
+				giving up after specified number of "attempts" (None - never) and using "timeout" for each one.
+			Within operations, reconnection also stops after op_timeout (or "timeout", if it's None)
+				and raises PulseDisconnected, while event_listen() keeps trying up to "attempts"
+				or until its own timeout, if any.
+			Event mask from last event_mask_set() call is set again after reconnecting,
+				and list/by-name info operations that failed due to lost connection are retried once,
+				unless "retry=False" is specified, as well as sink/source_default_set() by name.
+			Info lookups and setters that address objects by index (e.g. sink_info, mute/volume/move/port)
+				are never retried,
+				as server assigns new indexes to all objects on restart, so same index can refer
+				to an unrelated stream or device afterwards. Re-query objects and repeat these instead.
+			"reconnects" attribute counts reconnections, and PulseStream objects are not re-created.'''
+		self._reconnect = None if not enabled else dict( delay_min=delay_min,
+			delay_max=delay_max, attempts=attempts, timeout=timeout, retry=retry )
+
+	def _pulse_reconnect(self, timeout=None):
+		'''Reconnects to the server, if reconnection is enabled and connection was lost,
+				giving up after "attempts" from reconnect_set() or "timeout" (seconds, None - no limit).
+			Returns False if connection is still lost after that, True otherwise.'''
+		if not (self._reconnect and self._conn_lost and self._loop and not self._loop_closed): return True
+		opts, n = self._reconnect, 0
+		delay, ts_deadline = opts['delay_min'], None if timeout is None else c.mono_time() + timeout
+		while True:
+			conn_timeout = opts['timeout']
+			if ts_deadline is not None:
+				conn_timeout = min(conn_timeout, ts_deadline - c.mono_time())
+				if conn_timeout <= 0: return False
+			try: self.connect(timeout=conn_timeout)
+			except PulseError: self._conn_lost, n = True, n + 1
+			else: break
+			if opts['attempts'] is not None and n >= opts['attempts']: return False
+			delay_sleep = random.uniform(delay / 2.0, delay) # "equal jitter" backoff
+			if ts_deadline is not None:
+				delay_sleep = min(delay_sleep, ts_deadline - c.mono_time())
+			if delay_sleep > 0: time.sleep(delay_sleep)
+			delay = min(delay * 2, opts['delay_max'])
+		self.reconnects += 1
+		if self._event_masks is not None: self.event_mask_set(*self._event_masks)
+		return True
+
+	def _pulse_reconnect_check(self, timeout=KeyError):
+		'''Same as _pulse_reconnect(), but for use from operations, limited by
+				"timeout" (default - op_timeout, or reconnect_set() timeout if it's None),
+				and raising PulseDisconnected if connection could not be re-established.'''
+		if not (self._reconnect and self._conn_lost): return
+		if timeout is KeyError: timeout = self.op_timeout
+		if timeout is None: timeout = self._reconnect['timeout']
+		if not self._pulse_reconnect(timeout): raise PulseDisconnected()
+
+	def _pulse_call_retry(self, func, retry=True):
+		'''Runs func(), re-running it once after reconnecting to the server,
+			if it fails due to lost connection and reconnect_set() is enabled with retries.'''
+		self._pulse_reconnect_check()
+		try: return func()
+		except PulseOperationFailed as err:
+			if ( isinstance(err, PulseTimeout) or not self._conn_lost
+				or not retry or not self._reconnect or not self._reconnect['retry'] ): raise
+			self._pulse_reconnect_check()
+		return func()
+
 	def _pulse_subscribe_cb(self, ctx, ev, idx, userdata):
 		if not self.event_callback: return
-		n = ev & c.PA_SUBSCRIPTION_EVENT_FACILITY_MASK
-		ev_fac = PulseEventFacilityEnum._c_val(n, 'ev.facility.{}'.format(n))
-		n = ev & c.PA_SUBSCRIPTION_EVENT_TYPE_MASK
-		ev_t = PulseEventTypeEnum._c_val(n, 'ev.type.{}'.format(n))
-		try: self.event_callback(PulseEventInfo(ev_t, ev_fac, idx))
+		ev = self._ev_table[ev & 0x3f]
+		if ev is None or (self._ev_indexes is not None and idx not in self._ev_indexes): return
+		if self._ev_hold: # from _pulse_wait()
+			if len(self._ev_held) == self._ev_held_max: self.event_held_dropped += 1 # oldest one
+			return self._ev_held.append((ev, idx))
+		self._pulse_event_dispatch(ev, idx)
+
+	def _pulse_event_dispatch(self, ev, idx):
+		# ev is (type, facility) tuple from event_table()
+		ev = PulseEventInfo(ev[0], ev[1], idx)
+		if self._ev_batch is None: self._pulse_event_callback(ev)
+		else: self._pulse_event_batch_add(ev)
+
+	def _pulse_event_callback(self, ev):
+		try: self.event_callback(ev)
 		except PulseLoopStop: self._loop_stop = True
 
+	def _pulse_event_batch_add(self, ev):
+		# Deadline is pushed back by each new event, but only up to event_batch_max from first one
+		ts = c.mono_time()
+		if not self._ev_batch: self._ev_batch_ts_max = ts + self.event_batch_max
+		self._ev_batch_ts = min(ts + self.event_batch, self._ev_batch_ts_max)
+		event_coalesce(self._ev_batch, ev)
+
+	def _pulse_event_batch_flush(self):
+		if not self._ev_batch or c.mono_time() < self._ev_batch_ts: return
+		batch, self._ev_batch = self._ev_batch, OrderedDict()
+		self._pulse_event_callback(list(batch.values()))
+
 	def _pulse_poll_cb(self, func, func_err, ufds, nfds, timeout, userdata):
 		fd_list = list(ufds[n] for n in range(nfds))
 		try: nfds = func(fd_list, timeout / 1000.0)
@@ -510,36 +1426,127 @@ class Pulse(object):
 	def _pulse_run(self):
 		with self._pulse_loop() as loop: c.pa.mainloop_run(loop, self._ret)
 
-	def _pulse_iterate(self, block=True):
-		with self._pulse_loop() as loop: c.pa.mainloop_iterate(loop, int(block), self._ret)
-
-	@contextmanager
-	def _pulse_op_cb(self, raw=False):
+	def _pulse_iterate(self, block=True, timeout=None):
+		'''Runs one loop iteration, waiting for events if "block" is set,
+			but only up to "timeout" seconds (float), if it's not None.'''
+		with self._pulse_loop() as loop:
+			if not block or timeout is None:
+				return c.pa.mainloop_iterate(loop, int(block), self._ret)
+			c.pa.mainloop_prepare(loop, max(0, int(timeout * 1000000)))
+			c.pa.mainloop_poll(loop)
+			if not self._loop_closed: c.pa.mainloop_dispatch(loop)
+
+	def _pulse_action(self):
+		'''Returns (act_id, cb) tuple to track completion of async pa_operation,
+			where cb(success=True) should be called from libpulse callback on completion.'''
 		act_id = next(self._action_ids)
 		self._actions[act_id] = None
+		return act_id, lambda s=True,k=act_id: self._actions.update({k: bool(s)})
+
+	def _pulse_actions_wait(self, act_ids, timeout=KeyError):
+		'''Runs eventloop until all specified actions are completed or connection fails.
+			Returns list of results for these (True/False or None if incomplete), in same order.
+			Raises PulseTimeout if "timeout" (default - self.op_timeout) passes before that,
+				cancelling all incomplete operations that were registered via _pulse_op_track().'''
+		if timeout is KeyError: timeout = self.op_timeout
+		ts_deadline = None if timeout is None else c.mono_time() + timeout
 		try:
-			cb = lambda s=True,k=act_id: self._actions.update({k: bool(s)})
-			if not raw: cb = c.PA_CONTEXT_SUCCESS_CB_T(lambda ctx,s,d,cb=cb: cb(s))
-			yield cb
-			while self.connected and self._actions[act_id] is None: self._pulse_iterate()
-			if not self._actions[act_id]: raise PulseOperationFailed(act_id)
-		finally: self._actions.pop(act_id, None)
+			for act_id in act_ids:
+				while self.connected and self._actions[act_id] is None:
+					if ts_deadline is None: self._pulse_iterate()
+					else:
+						delay = ts_deadline - c.mono_time()
+						if delay <= 0: self._pulse_ops_cancel(act_ids, timeout)
+						self._pulse_iterate(timeout=delay)
+			return list(self._actions[act_id] for act_id in act_ids)
+		finally:
+			for act_id in act_ids:
+				self._actions.pop(act_id, None)
+				self._action_ops.pop(act_id, None)
+
+	def _pulse_op_track(self, pa_op, act_id=None):
+		'''Registers pa_operation for action (default - current _pulse_op_cb one),
+				to be cancelled on timeout in _pulse_actions_wait(), and returns it.
+			Must be called with _ctx_lock held, right after operation is created.'''
+		self._action_ops[self._op_act_id if act_id is None else act_id] = pa_op
+		self._op_local.count = getattr(self._op_local, 'count', 0) + 1 # per-thread, for round-trip stats
+		return pa_op
+
+	def _pulse_ops_cancel(self, act_ids, timeout):
+		'''Cancels incomplete operations for specified actions, so that their
+			callbacks won't be called anymore, and raises PulseTimeout for these.'''
+		act_ids_cancel = list()
+		with self._ctx_lock:
+			for act_id in act_ids:
+				if self._actions.get(act_id) is not None: continue
+				act_ids_cancel.append(act_id)
+				pa_op = self._action_ops.pop(act_id, None)
+				if pa_op and self.connected: c.pa.operation_cancel(pa_op)
+		raise PulseTimeout('Timed-out waiting for pulse operation(s) [{:,.1f}s]: {}'.format(
+			timeout, ', '.join(map(str, act_ids_cancel)) ))
+
+	@contextmanager
+	def _pulse_op_cb(self, raw=False, timeout=KeyError):
+		self._pulse_reconnect_check(timeout)
+		act_id, cb = self._pulse_action()
+		try:
+			with self._ctx_lock:
+				if not raw: cb = c.PA_CONTEXT_SUCCESS_CB_T(lambda ctx,s,d,cb=cb: cb(s))
+				act_id_prev, self._op_act_id = self._op_act_id, act_id # for _pulse_op_track()
+				try: yield cb
+				finally: self._op_act_id = act_id_prev
+				if not self._pulse_actions_wait([act_id], timeout)[0]: raise PulseOperationFailed(act_id)
+		finally:
+			self._actions.pop(act_id, None)
+			self._action_ops.pop(act_id, None)
 
 	def _pulse_poll(self, timeout=None):
 		'''timeout should be in seconds (float),
 			0 for non-blocking poll and None (default) for no timeout.'''
 		with self._pulse_loop() as loop:
 			ts = c.mono_time()
-			ts_deadline = timeout and (ts + timeout)
-			while True:
-				delay = max(0, int((ts_deadline - ts) * 1000000)) if ts_deadline else -1
+			ts_deadline = None if timeout is None else ts + timeout
+			while self._ev_held and not self._loop_stop:
+				self._pulse_event_dispatch(*self._ev_held.popleft())
+			while not self._loop_stop:
+				ts_wake = ts_deadline
+				if self._ev_batch and (ts_wake is None or self._ev_batch_ts < ts_wake):
+					ts_wake = self._ev_batch_ts # to deliver batched events in time
+				delay = max(0, int((ts_wake - ts) * 1000000)) if ts_wake is not None else -1
 				c.pa.mainloop_prepare(loop, delay) # delay in us
 				c.pa.mainloop_poll(loop)
 				if self._loop_closed: break # interrupted by close() or such
 				c.pa.mainloop_dispatch(loop)
+				if self._ev_batch: self._pulse_event_batch_flush()
 				if self._loop_stop: break
 				ts = c.mono_time()
-				if ts_deadline and ts >= ts_deadline: break
+				if ts_deadline is not None and ts >= ts_deadline: break
+
+	def _pulse_wait(self, check, timeout=None):
+		'''Runs eventloop until check() returns True-ish value or timeout passes, returning last result.
+			check() is called with _ctx_lock held, and libpulse callbacks that can change its result
+				should call _pulse_wakeup(), as with PulseStream and PulsePeakMonitor objects.
+			Events received meanwhile are held until next event_listen() call,
+				so that event_callback is not called and PulseLoopStop does not interfere with this.
+			Up to _ev_held_max events are held, with oldest ones dropped and counted in event_held_dropped.
+			Runs at least one non-blocking loop iteration with timeout=0.
+			Raises PulseDisconnected if connection to the server is lost.'''
+		ts_deadline, polled = None if timeout is None else c.mono_time() + timeout, False
+		ev_hold, self._ev_hold = self._ev_hold, True
+		try:
+			while True:
+				with self._ctx_lock: res = check()
+				if res: return res
+				if not self.connected: raise PulseDisconnected()
+				delay = None if ts_deadline is None else ts_deadline - c.mono_time()
+				if delay is not None and delay <= 0 and polled: return res
+				self._pulse_iterate(timeout=None if delay is None else max(0, delay))
+				polled = True
+		finally: self._ev_hold = ev_hold
+
+	def _pulse_wakeup(self):
+		'''Should be called from libpulse callbacks that can change _pulse_wait() check() result.
+			Does nothing here, as check() is run after every loop iteration anyway.'''
 
 
 	def _pulse_info_cb(self, info_cls, data_list, done_cb, ctx, info, eof, userdata):
@@ -554,165 +1561,382 @@ class Pulse(object):
 		if eof: done_cb()
 		else: data_list.append(info_cls(info[0]))
 
-	def _pulse_get_list(cb_t, pulse_func, info_cls, singleton=False, index_arg=True):
-		def _wrapper_method(self, index=None):
-			data = list()
-			with self._pulse_op_cb(raw=True) as cb:
-				cb = cb_t(
-					ft.partial(self._pulse_info_cb, info_cls, data, cb) if not singleton else
-					lambda ctx, info, userdata, cb=cb: data.append(info_cls(info[0])) or cb() )
-				pa_op = pulse_func( self._ctx,
-					*([index, cb, None] if index is not None else [cb, None]) )
-			c.pa.operation_unref(pa_op)
-			data = data or list()
+	def _pulse_info_op(self, spec, data, cb, index=None):
+		'''Sends info request for _pulse_get_list() spec, returning (c_cb, pa_op) tuple.
+			Info objects are appended to "data" list, with cb() called when it's done.
+			Returned c_cb callback object must be kept around until then.'''
+		cb_t, pulse_func, info_cls, singleton = spec
+		cb = cb_t(
+			ft.partial(self._pulse_info_cb, info_cls, data, cb) if not singleton else
+			lambda ctx, info, userdata, cb=cb: data.append(info_cls(info[0])) or cb() )
+		pa_op = pulse_func( self._ctx,
+			*([index, cb, None] if index is not None else [cb, None]) )
+		return cb, pa_op
+
+	def _pulse_stats_method(name):
+		'Decorator to record stats for method calls under specified name, if enabled via stats_enable().'
+		def _decorator(func):
+			@ft.wraps(func)
+			def _wrapper(self, *args, **kws):
+				if self._stats is None: return func(self, *args, **kws)
+				return self._pulse_stats_call(name, func, self, *args, **kws)
+			return _wrapper
+		return _decorator
+
+	def _pulse_get_list(cb_t, pulse_func, info_cls, singleton=False, index_arg=True, name=None):
+		spec, by_name = (cb_t, pulse_func, info_cls, singleton), pulse_func.__name__.endswith('_by_name')
+		def _wrapper_method(self, index=None, op_timeout=KeyError):
+			# Lookups by index are not retried, as indexes get re-assigned on server restart
+			retry = index is None or by_name
+			def _get():
+				data = list()
+				with self._ctx_lock:
+					with self._pulse_op_cb(raw=True, timeout=op_timeout) as cb:
+						cb, pa_op = self._pulse_info_op(spec, data, cb, index)
+						c.pa.operation_unref(self._pulse_op_track(pa_op))
+				return data
+			data = self._pulse_call_retry(_get, retry) if self._stats is None else\
+				self._pulse_stats_call(_wrapper_method._pulse_stats_key, self._pulse_call_retry, _get, retry)
 			if index is not None or singleton:
 				if not data: raise PulseIndexError(index)
 				data, = data
 			return data
+		_wrapper_method._pulse_get_spec = spec
+		_wrapper_method._pulse_stats_key = name or pulse_func.__name__.rsplit('.pa_', 1)[-1]
 		return wrapper_with_sig_info( None, _wrapper_method,
 			not (pulse_func.__name__.endswith('_list') or singleton or not index_arg) )
 
+	@_pulse_stats_method('get_multi')
+	def _pulse_get_multi(self, calls):
+		'''Sends multiple info requests at once and waits for all of them together.
+			"calls" is an iterable of (method, index) tuples, with method being
+				one of the _pulse_get_list() wrappers (e.g. self.sink_info) and index=None for lists.
+			Returns list of info-object lists for each call, in the same order.
+			Empty list is returned for index-calls where there is no such object.'''
+		self._pulse_reconnect_check()
+		acts, data_lists = list(), list()
+		with self._ctx_lock:
+			try:
+				for method, index in calls:
+					act_id, cb = self._pulse_action()
+					data_lists.append(list())
+					try: cb, pa_op = self._pulse_info_op(method._pulse_get_spec, data_lists[-1], cb, index)
+					except Exception:
+						self._actions.pop(act_id, None)
+						raise
+					acts.append((act_id, cb))
+					c.pa.operation_unref(self._pulse_op_track(pa_op, act_id))
+			finally: res = self._pulse_actions_wait(list(act_id for act_id, cb in acts))
+		if not all(res): raise PulseOperationFailed(list(act_id for act_id, cb in acts))
+		return data_lists
+
 	get_sink_by_name = _pulse_get_list(
 		c.PA_SINK_INFO_CB_T,
-		c.pa.context_get_sink_info_by_name, PulseSinkInfo )
+		c.pa.context_get_sink_info_by_name, PulseSinkInfo, name='get_sink_by_name' )
 	get_source_by_name = _pulse_get_list(
 		c.PA_SOURCE_INFO_CB_T,
-		c.pa.context_get_source_info_by_name, PulseSourceInfo )
+		c.pa.context_get_source_info_by_name, PulseSourceInfo, name='get_source_by_name' )
 	get_card_by_name = _pulse_get_list(
 		c.PA_CARD_INFO_CB_T,
-		c.pa.context_get_card_info_by_name, PulseCardInfo )
+		c.pa.context_get_card_info_by_name, PulseCardInfo, name='get_card_by_name' )
+	get_sample_by_name = _pulse_get_list(
+		c.PA_SAMPLE_INFO_CB_T,
+		c.pa.context_get_sample_info_by_name, PulseSampleInfo, name='get_sample_by_name' )
 
 	sink_input_list = _pulse_get_list(
 		c.PA_SINK_INPUT_INFO_CB_T,
-		c.pa.context_get_sink_input_info_list, PulseSinkInputInfo )
+		c.pa.context_get_sink_input_info_list, PulseSinkInputInfo, name='sink_input_list' )
 	sink_input_info = _pulse_get_list(
 		c.PA_SINK_INPUT_INFO_CB_T,
-		c.pa.context_get_sink_input_info, PulseSinkInputInfo )
+		c.pa.context_get_sink_input_info, PulseSinkInputInfo, name='sink_input_info' )
 	source_output_list = _pulse_get_list(
 		c.PA_SOURCE_OUTPUT_INFO_CB_T,
-		c.pa.context_get_source_output_info_list, PulseSourceOutputInfo )
+		c.pa.context_get_source_output_info_list, PulseSourceOutputInfo, name='source_output_list' )
 	source_output_info = _pulse_get_list(
 		c.PA_SOURCE_OUTPUT_INFO_CB_T,
-		c.pa.context_get_source_output_info, PulseSourceOutputInfo )
+		c.pa.context_get_source_output_info, PulseSourceOutputInfo, name='source_output_info' )
 
 	sink_list = _pulse_get_list(
-		c.PA_SINK_INFO_CB_T, c.pa.context_get_sink_info_list, PulseSinkInfo )
+		c.PA_SINK_INFO_CB_T, c.pa.context_get_sink_info_list, PulseSinkInfo, name='sink_list' )
 	sink_info = _pulse_get_list(
-		c.PA_SINK_INFO_CB_T, c.pa.context_get_sink_info_by_index, PulseSinkInfo )
+		c.PA_SINK_INFO_CB_T, c.pa.context_get_sink_info_by_index, PulseSinkInfo, name='sink_info' )
 	source_list = _pulse_get_list(
-		c.PA_SOURCE_INFO_CB_T, c.pa.context_get_source_info_list, PulseSourceInfo )
+		c.PA_SOURCE_INFO_CB_T, c.pa.context_get_source_info_list, PulseSourceInfo, name='source_list' )
 	source_info = _pulse_get_list(
-		c.PA_SOURCE_INFO_CB_T, c.pa.context_get_source_info_by_index, PulseSourceInfo )
+		c.PA_SOURCE_INFO_CB_T, c.pa.context_get_source_info_by_index, PulseSourceInfo, name='source_info' )
 	card_list = _pulse_get_list(
-		c.PA_CARD_INFO_CB_T, c.pa.context_get_card_info_list, PulseCardInfo )
+		c.PA_CARD_INFO_CB_T, c.pa.context_get_card_info_list, PulseCardInfo, name='card_list' )
 	card_info = _pulse_get_list(
-		c.PA_CARD_INFO_CB_T, c.pa.context_get_card_info_by_index, PulseCardInfo )
+		c.PA_CARD_INFO_CB_T, c.pa.context_get_card_info_by_index, PulseCardInfo, name='card_info' )
 	client_list = _pulse_get_list(
-		c.PA_CLIENT_INFO_CB_T, c.pa.context_get_client_info_list, PulseClientInfo )
+		c.PA_CLIENT_INFO_CB_T, c.pa.context_get_client_info_list, PulseClientInfo, name='client_list' )
 	client_info = _pulse_get_list(
-		c.PA_CLIENT_INFO_CB_T, c.pa.context_get_client_info, PulseClientInfo )
+		c.PA_CLIENT_INFO_CB_T, c.pa.context_get_client_info, PulseClientInfo, name='client_info' )
 	server_info = _pulse_get_list(
-		c.PA_SERVER_INFO_CB_T, c.pa.context_get_server_info, PulseServerInfo, singleton=True )
+		c.PA_SERVER_INFO_CB_T, c.pa.context_get_server_info,
+		PulseServerInfo, singleton=True, name='server_info' )
 	module_info = _pulse_get_list(
-		c.PA_MODULE_INFO_CB_T, c.pa.context_get_module_info, PulseModuleInfo )
+		c.PA_MODULE_INFO_CB_T, c.pa.context_get_module_info, PulseModuleInfo, name='module_info' )
 	module_list = _pulse_get_list(
-		c.PA_MODULE_INFO_CB_T, c.pa.context_get_module_info_list, PulseModuleInfo )
-
+		c.PA_MODULE_INFO_CB_T, c.pa.context_get_module_info_list, PulseModuleInfo, name='module_list' )
+	sample_list = _pulse_get_list(
+		c.PA_SAMPLE_INFO_CB_T, c.pa.context_get_sample_info_list, PulseSampleInfo, name='sample_list' )
+	sample_info = _pulse_get_list(
+		c.PA_SAMPLE_INFO_CB_T, c.pa.context_get_sample_info_by_index, PulseSampleInfo, name='sample_info' )
+
+
+	_snapshot_methods = dict(
+		server='server_info', sinks='sink_list', sources='source_list',
+		sink_inputs='sink_input_list', source_outputs='source_output_list',
+		cards='card_list', clients='client_list', modules='module_list' )
+
+	@_pulse_stats_method('snapshot')
+	def snapshot(self):
+		'''Returns PulseSnapshotInfo with server_info() and results of all
+				sink/source/sink_input/source_output/card/client/module_list() calls,
+				requesting all of these from the server at once and waiting for them together.
+			Should be both faster and more consistent than making these calls one-by-one.'''
+		keys = sorted(self._snapshot_methods)
+		data = dict(zip(keys, self._pulse_get_multi(
+			(getattr(self, self._snapshot_methods[k]), None) for k in keys )))
+		if not data['server']: raise PulseIndexError('server_info')
+		data['server'], = data['server']
+		return PulseSnapshotInfo(**data)
+
+
+	@staticmethod
+	def _pulse_method_args(func, index_arg, args, kws):
+		'Returns list of pulse_op arguments for _pulse_method_call() wrapper call.'
+		if index_arg:
+			if 'index' in kws: index = kws.pop('index')
+			else: index, args = args[0], args[1:]
+		pulse_args = func(*args, **kws) if func else list()
+		if not is_list(pulse_args): pulse_args = [pulse_args]
+		return list(pulse_args) if not index_arg else [index] + list(pulse_args)
+
+	def _pulse_method_issue(self, pulse_op, pulse_args, cb):
+		'''Sends pa_operation for _pulse_method_call() wrapper, returning (c_cb, pa_op) tuple.
+			cb(success) is called on completion, returned c_cb must be kept around until then.'''
+		cb = c.PA_CONTEXT_SUCCESS_CB_T(lambda ctx,s,d,cb=cb: cb(s))
+		try: pa_op = pulse_op(self._ctx, *(pulse_args + [cb, None]))
+		except c.ArgumentError as err: raise TypeError(err.args)
+		except c.pa.CallError as err: raise PulseOperationInvalid(err.args[-1])
+		return cb, pa_op
+
+	def _pulse_value_op(self, pulse_op, pulse_args, cb_t, data, cb):
+		'''Sends pa_operation with uint32 value callback (e.g. module index), returning (c_cb, pa_op) tuple.
+			Value is appended to "data" list before cb() is called, returned c_cb must be kept around until then.'''
+		cb = cb_t(lambda ctx, value, userdata, cb=cb: data.append(value) or cb())
+		try: pa_op = pulse_op(self._ctx, *(pulse_args + [cb, None]))
+		except c.pa.CallError as err: raise PulseOperationInvalid(err.args[-1])
+		return cb, pa_op
+
+	@staticmethod
+	def _pulse_value(data):
+		'Returns value from _pulse_value_op() data list, or None if it is PA_INVALID.'
+		value, = data
+		return value if value != c.PA_INVALID else None
+
+	def _pulse_value_call(self, pulse_op, pulse_args, cb_t):
+		'Synchronous wrapper for _pulse_value_op(), returning _pulse_value() result.'
+		data = list()
+		with self._pulse_op_cb(raw=True) as cb:
+			cb, pa_op = self._pulse_value_op(pulse_op, pulse_args, cb_t, data, cb)
+			c.pa.operation_unref(self._pulse_op_track(pa_op))
+		return self._pulse_value(data)
 
-	def _pulse_method_call(pulse_op, func=None, index_arg=True):
+	def _pulse_method_call(pulse_op, func=None, index_arg=True, retry=False, name=None):
 		'''Creates following synchronous wrapper for async pa_operation callable:
-			wrapper(index, ...) -> pulse_op(index, [*]args_func(...))
-			index_arg=False: wrapper(...) -> pulse_op([*]args_func(...))'''
+				wrapper(index, ...) -> pulse_op(index, [*]args_func(...))
+				index_arg=False: wrapper(...) -> pulse_op([*]args_func(...))
+			"retry" marks operations that can be safely re-run after reconnect, i.e. not ones
+				addressing objects by index, as server assigns new indexes to everything on restart.
+			"name" is a method name to record stats under, same as with _pulse_get_list().'''
 		def _wrapper(self, *args, **kws):
-			if index_arg:
-				if 'index' in kws: index = kws.pop('index')
-				else: index, args = args[0], args[1:]
-			pulse_args = func(*args, **kws) if func else list()
-			if not is_list(pulse_args): pulse_args = [pulse_args]
-			if index_arg: pulse_args = [index] + list(pulse_args)
-			with self._pulse_op_cb() as cb:
-				try: pulse_op(self._ctx, *(list(pulse_args) + [cb, None]))
-				except c.ArgumentError as err: raise TypeError(err.args)
-				except c.pa.CallError as err: raise PulseOperationInvalid(err.args[-1])
+			op_timeout = kws.pop('op_timeout', KeyError)
+			pulse_args = self._pulse_method_args(func, index_arg, args, kws)
+			if self._batch is not None: return self._pulse_batch_add(pulse_op, pulse_args)
+			def _call():
+				with self._ctx_lock:
+					with self._pulse_op_cb(raw=True, timeout=op_timeout) as cb:
+						cb, pa_op = self._pulse_method_issue(pulse_op, pulse_args, cb)
+						c.pa.operation_unref(self._pulse_op_track(pa_op))
+			if self._stats is None: self._pulse_call_retry(_call, retry)
+			else: self._pulse_stats_call(_wrapper._pulse_stats_key, self._pulse_call_retry, _call, retry)
+		_wrapper._pulse_call_spec = pulse_op, func, index_arg
+		_wrapper._pulse_stats_key = name or pulse_op.__name__.rsplit('.pa_', 1)[-1]
 		return wrapper_with_sig_info(func, _wrapper, index_arg)
 
+	def _pulse_stats_call(self, key, func, *args, **kws):
+		'''Runs func(*args, **kws), recording its duration and number of server requests in stats.
+			Requests are counted per-thread, and nested calls are only counted as part of outermost one.'''
+		local = self._op_local
+		if getattr(local, 'stats_key', None): return func(*args, **kws)
+		stats, ts, ops, local.stats_key = self._stats, c.mono_time(), getattr(local, 'count', 0), key
+		try: res = func(*args, **kws)
+		except Exception:
+			stats.add(key, c.mono_time() - ts, getattr(local, 'count', 0) - ops, True)
+			raise
+		else: stats.add(key, c.mono_time() - ts, getattr(local, 'count', 0) - ops)
+		finally: local.stats_key = None
+		return res
+
+	def stats_enable(self, enabled=True, buckets=None):
+		'''Enables (or disables with enabled=False, discarding values) collecting
+				call counters, server round-trips and latency histograms for info/control methods,
+				which can be queried via stats() or stats_prometheus() methods.
+			snapshot() is counted as one call, and cache.PulseStateCache refreshes under "get_multi" name.
+			"buckets" can be a list of histogram upper bounds in seconds, see PulseStats.buckets.'''
+		self._stats = PulseStats(buckets) if enabled else None
+
+	def stats(self, reset=False):
+		'''Returns {method: PulseCallStatsInfo} dict with call stats, if enabled via stats_enable().
+			PulseCallStatsInfo has calls, errors, roundtrips, time_total, time_max (seconds)
+				and latency histogram list (counts, non-cumulative) with buckets from PulseStats.
+			"reset" flag zeroes all counters after returning them.'''
+		return self._stats.info(reset) if self._stats else dict()
+
+	def stats_prometheus(self, path=None, prefix='pulsectl', labels=None):
+		'''Returns stats() in Prometheus text exposition format, or writes it to a file,
+				if "path" is specified, replacing it atomically (for e.g. node_exporter textfile collector).
+			"prefix" is used for metric names and "labels" dict - extra labels to add to all of them.'''
+		text = (self._stats or PulseStats()).prometheus(prefix, labels)
+		if not path: return text
+		path_tmp = '{}.{}.tmp'.format(path, os.getpid())
+		try:
+			with io.open(path_tmp, 'w') as dst: dst.write(c.force_str(text))
+			os.rename(path_tmp, path)
+		finally:
+			if os.path.exists(path_tmp): os.unlink(path_tmp)
+
+	def _pulse_batch_add(self, pulse_op, pulse_args):
+		ops, results = self._batch
+		act_id, cb = self._pulse_action()
+		with self._ctx_lock:
+			try: cb, pa_op = self._pulse_method_issue(pulse_op, pulse_args, cb)
+			except Exception:
+				self._actions.pop(act_id, None)
+				raise
+			c.pa.operation_unref(self._pulse_op_track(pa_op, act_id))
+		ops.append((act_id, cb)) # cb must be kept around until operation is done
+		results.append(PulseBatchOpInfo(pulse_op.__name__.rsplit('.pa_', 1)[-1], pulse_args))
+
+	@contextmanager
+	def batch(self, raise_on_fail=True):
+		'''Context manager to pipeline simple mutating operations
+				(e.g. sink_input_volume_set, sink_mute, sink_input_move, volume_set, etc),
+				sending all of them to the server back-to-back and only waiting
+				for all their completion callbacks together, on exit from the context.
+			Yields a list, which gets PulseBatchOpInfo object appended to it for each queued
+				operation, with "success" attribute for all of these set on context exit.
+			"raise_on_fail" will raise PulseOperationFailed on exit if any of the operations failed,
+				with list of failed PulseBatchOpInfo objects as an argument.
+			Any other (e.g. *_list or *_info) calls work as usual within the context,
+				and will also process any completion callbacks for operations queued before them.
+			Note that info-objects are updated by wrappers like mute()
+				or volume_set() immediately, not when/if queued operation succeeds.
+			Example - set volume for all sink inputs in one go:
+				with pulse.batch():
+					for si in pulse.sink_input_list(): pulse.volume_set_all_chans(si, 0.5)'''
+		if self._batch is not None:
+			raise PulseError('Nested pulse.batch() contexts are not supported')
+		ops, results = self._batch = list(), list()
+		body_ok = False
+		try:
+			yield results
+			body_ok = True
+		finally:
+			self._batch = None
+			try: res = self._pulse_actions_wait(list(act_id for act_id, cb in ops))
+			except Exception:
+				if body_ok: raise
+				res = list() # exception from the context body is propagated instead
+			for op_info, s in zip(results, res): op_info.success = bool(s)
+		if raise_on_fail:
+			failed = list(op_info for op_info in results if not op_info.success)
+			if failed: raise PulseOperationFailed(failed)
+
 	card_profile_set_by_index = _pulse_method_call(
-		c.pa.context_set_card_profile_by_index, lambda profile_name: profile_name )
+		c.pa.context_set_card_profile_by_index,
+		lambda profile_name: profile_name, name='card_profile_set_by_index' )
 
 	sink_default_set = _pulse_method_call(
-		c.pa.context_set_default_sink, index_arg=False,
+		c.pa.context_set_default_sink, index_arg=False, retry=True, name='sink_default_set',
 		func=lambda sink: sink.name if isinstance(sink, PulseSinkInfo) else sink )
 	source_default_set = _pulse_method_call(
-		c.pa.context_set_default_source, index_arg=False,
+		c.pa.context_set_default_source, index_arg=False, retry=True, name='source_default_set',
 		func=lambda source: source.name if isinstance(source, PulseSourceInfo) else source )
 
 	sink_input_mute = _pulse_method_call(
-		c.pa.context_set_sink_input_mute, lambda mute=True: mute )
+		c.pa.context_set_sink_input_mute, lambda mute=True: mute, name='sink_input_mute' )
 	sink_input_move = _pulse_method_call(
-		c.pa.context_move_sink_input_by_index, lambda sink_index: sink_index )
+		c.pa.context_move_sink_input_by_index, lambda sink_index: sink_index, name='sink_input_move' )
 	sink_mute = _pulse_method_call(
-		c.pa.context_set_sink_mute_by_index, lambda mute=True: mute )
+		c.pa.context_set_sink_mute_by_index, lambda mute=True: mute, name='sink_mute' )
 	sink_input_volume_set = _pulse_method_call(
-		c.pa.context_set_sink_input_volume, lambda vol: vol.to_struct() )
+		c.pa.context_set_sink_input_volume, lambda vol: vol.to_struct(), name='sink_input_volume_set' )
 	sink_volume_set = _pulse_method_call(
-		c.pa.context_set_sink_volume_by_index, lambda vol: vol.to_struct() )
+		c.pa.context_set_sink_volume_by_index, lambda vol: vol.to_struct(), name='sink_volume_set' )
 	sink_suspend = _pulse_method_call(
-		c.pa.context_suspend_sink_by_index, lambda suspend=True: suspend )
+		c.pa.context_suspend_sink_by_index, lambda suspend=True: suspend, name='sink_suspend' )
 	sink_port_set = _pulse_method_call(
 		c.pa.context_set_sink_port_by_index,
-		lambda port: port.name if isinstance(port, PulsePortInfo) else port )
+		lambda port: port.name if isinstance(port, PulsePortInfo) else port, name='sink_port_set' )
 
 	source_output_mute = _pulse_method_call(
-		c.pa.context_set_source_output_mute, lambda mute=True: mute )
+		c.pa.context_set_source_output_mute, lambda mute=True: mute, name='source_output_mute' )
 	source_output_move = _pulse_method_call(
-		c.pa.context_move_source_output_by_index, lambda sink_index: sink_index )
+		c.pa.context_move_source_output_by_index, lambda sink_index: sink_index, name='source_output_move' )
 	source_mute = _pulse_method_call(
-		c.pa.context_set_source_mute_by_index, lambda mute=True: mute )
+		c.pa.context_set_source_mute_by_index, lambda mute=True: mute, name='source_mute' )
 	source_output_volume_set = _pulse_method_call(
-		c.pa.context_set_source_output_volume, lambda vol: vol.to_struct() )
+		c.pa.context_set_source_output_volume, lambda vol: vol.to_struct(), name='source_output_volume_set' )
 	source_volume_set = _pulse_method_call(
-		c.pa.context_set_source_volume_by_index, lambda vol: vol.to_struct() )
+		c.pa.context_set_source_volume_by_index, lambda vol: vol.to_struct(), name='source_volume_set' )
 	source_suspend = _pulse_method_call(
-		c.pa.context_suspend_source_by_index, lambda suspend=True: suspend )
+		c.pa.context_suspend_source_by_index, lambda suspend=True: suspend, name='source_suspend' )
 	source_port_set = _pulse_method_call(
 		c.pa.context_set_source_port_by_index,
-		lambda port: port.name if isinstance(port, PulsePortInfo) else port )
+		lambda port: port.name if isinstance(port, PulsePortInfo) else port, name='source_port_set' )
 
 
-	def module_load(self, name, args=''):
+	@staticmethod
+	def _module_load_args(name, args):
+		'Returns (pulse_op, pulse_args, cb_t) for _pulse_value_op() in module_load().'
 		if is_list(args): args = ' '.join(args)
-		name, args = map(c.force_bytes, [name, args])
-		data = list()
-		with self._pulse_op_cb(raw=True) as cb:
-			cb = c.PA_CONTEXT_INDEX_CB_T(
-				lambda ctx, index, userdata, cb=cb: data.append(index) or cb() )
-			try: c.pa.context_load_module(self._ctx, name, args, cb, None)
-			except c.pa.CallError as err: raise PulseOperationInvalid(err.args[-1])
-		index, = data
-		if index == c.PA_INVALID:
-			raise PulseError('Failed to load module: {} {}'.format(name, args))
+		return c.pa.context_load_module, list(map(c.force_bytes, [name, args])), c.PA_CONTEXT_INDEX_CB_T
+
+	@staticmethod
+	def _module_load_check(index, pulse_args):
+		if index is None: raise PulseError('Failed to load module: {} {}'.format(*pulse_args))
 		return index
 
-	module_unload = _pulse_method_call(c.pa.context_unload_module, None)
+	@_pulse_stats_method('module_load')
+	def module_load(self, name, args=''):
+		pulse_op, pulse_args, cb_t = self._module_load_args(name, args)
+		return self._module_load_check(self._pulse_value_call(pulse_op, pulse_args, cb_t), pulse_args)
+
+	module_unload = _pulse_method_call(c.pa.context_unload_module, None, name='module_unload')
+
+	sample_remove = _pulse_method_call(
+		c.pa.context_remove_sample, index_arg=False,
+		func=lambda name: name.name if isinstance(name, PulseSampleInfo) else name, name='sample_remove' )
 
 
+	# (pulse_op, pulse_args, cb_t) for _pulse_value_op() in stream_restore_test()
+	_stream_restore_test_args = c.pa.ext_stream_restore_test, list(), c.PA_EXT_STREAM_RESTORE_TEST_CB_T
+
+	@_pulse_stats_method('stream_restore_test')
 	def stream_restore_test(self):
 		'Returns module-stream-restore version int (e.g. 1) or None if it is unavailable.'
-		data = list()
-		with self._pulse_op_cb(raw=True) as cb:
-			cb = c.PA_EXT_STREAM_RESTORE_TEST_CB_T(
-				lambda ctx, version, userdata, cb=cb: data.append(version) or cb() )
-			try: c.pa.ext_stream_restore_test(self._ctx, cb, None)
-			except c.pa.CallError as err: raise PulseOperationInvalid(err.args[-1])
-		version, = data
-		return version if version != c.PA_INVALID else None
+		return self._pulse_value_call(*self._stream_restore_test_args)
 
 	stream_restore_read = _pulse_get_list(
 		c.PA_EXT_STREAM_RESTORE_READ_CB_T,
-		c.pa.ext_stream_restore_read, PulseExtStreamRestoreInfo, index_arg=False )
+		c.pa.ext_stream_restore_read, PulseExtStreamRestoreInfo, index_arg=False, name='stream_restore_read' )
 	stream_restore_list = stream_restore_read # for consistency with other *_list methods
 
-	@ft.partial(_pulse_method_call, c.pa.ext_stream_restore_write, index_arg=False)
+	@ft.partial(_pulse_method_call, c.pa.ext_stream_restore_write, index_arg=False, name='stream_restore_write')
 	def stream_restore_write( obj_name_or_list,
 			mode='merge', apply_immediately=False, **obj_kws ):
 		'''Update module-stream-restore db entry for specified name.
@@ -732,7 +1956,7 @@ class Pulse(object):
 			for k,t in obj_struct._fields_: setattr(dst_struct, k, getattr(obj_struct, k))
 		return mode, obj_array, len(obj_array), int(bool(apply_immediately))
 
-	@ft.partial(_pulse_method_call, c.pa.ext_stream_restore_delete, index_arg=False)
+	@ft.partial(_pulse_method_call, c.pa.ext_stream_restore_delete, index_arg=False, name='stream_restore_delete')
 	def stream_restore_delete(obj_name_or_list):
 		'''Can be passed string name,
 			PulseExtStreamRestoreInfo object or a list of any of these.'''
@@ -745,14 +1969,24 @@ class Pulse(object):
 		return [name_struct]
 
 
-	def default_set(self, obj):
-		'Set passed sink or source to be used as default one by pulseaudio server.'
+	_obj_methods = dict( # info object type -> method name, for default_set(), mute() and such
+		default_set={PulseSinkInfo: 'sink_default_set', PulseSourceInfo: 'source_default_set'},
+		mute={ PulseSinkInfo: 'sink_mute', PulseSinkInputInfo: 'sink_input_mute',
+			PulseSourceInfo: 'source_mute', PulseSourceOutputInfo: 'source_output_mute' },
+		port_set={PulseSinkInfo: 'sink_port_set', PulseSourceInfo: 'source_port_set'},
+		volume_set={ PulseSinkInfo: 'sink_volume_set', PulseSinkInputInfo: 'sink_input_volume_set',
+			PulseSourceInfo: 'source_volume_set', PulseSourceOutputInfo: 'source_output_volume_set' } )
+
+	def _obj_method(self, op, obj):
+		'Returns name of per-object-type method to call for op (e.g. "mute") with info object.'
 		assert_pulse_object(obj)
-		method = {
-			PulseSinkInfo: self.sink_default_set,
-			PulseSourceInfo: self.source_default_set }.get(type(obj))
+		method = self._obj_methods[op].get(type(obj))
 		if not method: raise NotImplementedError(type(obj))
-		method(obj)
+		return method
+
+	def default_set(self, obj):
+		'Set passed sink or source to be used as default one by pulseaudio server.'
+		getattr(self, self._obj_method('default_set', obj))(obj)
 
 	def sink_default_get(self):
 		'Wrapper around server_info() to return sink for default_sink_name there.'
@@ -762,23 +1996,11 @@ class Pulse(object):
 		return self.get_source_by_name(self.server_info().default_source_name)
 
 	def mute(self, obj, mute=True):
-		assert_pulse_object(obj)
-		method = {
-			PulseSinkInfo: self.sink_mute,
-			PulseSinkInputInfo: self.sink_input_mute,
-			PulseSourceInfo: self.source_mute,
-			PulseSourceOutputInfo: self.source_output_mute }.get(type(obj))
-		if not method: raise NotImplementedError(type(obj))
-		method(obj.index, mute)
+		getattr(self, self._obj_method('mute', obj))(obj.index, mute)
 		obj.mute = mute
 
 	def port_set(self, obj, port):
-		assert_pulse_object(obj)
-		method = {
-			PulseSinkInfo: self.sink_port_set,
-			PulseSourceInfo: self.source_port_set }.get(type(obj))
-		if not method: raise NotImplementedError(type(obj))
-		method(obj.index, port)
+		getattr(self, self._obj_method('port_set', obj))(obj.index, port)
 		obj.port_active = port
 
 	def card_profile_set(self, card, profile):
@@ -793,14 +2015,7 @@ class Pulse(object):
 		card.profile_active = profile
 
 	def volume_set(self, obj, vol):
-		assert_pulse_object(obj)
-		method = {
-			PulseSinkInfo: self.sink_volume_set,
-			PulseSinkInputInfo: self.sink_input_volume_set,
-			PulseSourceInfo: self.source_volume_set,
-			PulseSourceOutputInfo: self.source_output_volume_set }.get(type(obj))
-		if not method: raise NotImplementedError(type(obj))
-		method(obj.index, vol)
+		getattr(self, self._obj_method('volume_set', obj))(obj.index, vol)
 		obj.volume = vol
 
 	def volume_set_all_chans(self, obj, vol):
@@ -826,27 +2041,68 @@ class Pulse(object):
 		mask = 0
 		for m in masks: mask |= PulseEventMaskEnum[m]._c_val
 		with self._pulse_op_cb() as cb:
-			c.pa.context_subscribe(self._ctx, mask, cb, None)
+			c.pa.operation_unref(self._pulse_op_track(c.pa.context_subscribe(self._ctx, mask, cb, None)))
+		self._event_masks = masks # to set again after reconnect
 
-	def event_callback_set(self, func):
+	def event_callback_set( self, func, batch=None,
+			facilities=None, types=None, indexes=None, batch_max=None ):
 		'''Call event_listen() to start receiving these,
 				and be sure to raise PulseLoopStop in a callback to stop the loop.
 			Callback should accept single argument - PulseEventInfo instance.
-			Passing None will disable the thing.'''
-		self.event_callback = func
+			Passing None will disable the thing.
+			"facilities", "types" and "indexes" can be lists of event_facilities/event_types
+				values and object index numbers to only pass matching events to the callback,
+				which is done on raw event values, before creating any python objects for these.
+				Unlike event_mask_set(), this does not change which events are sent by the server.
+			"batch" can be set to a number of seconds (float, 0 - one loop iteration)
+				to collect events for until there are no new ones within that time, and pass these
+				to callback as a list, with only one event per (facility, index) - e.g. one "change"
+				event for many of those, "new" for new+change, "remove" for new/change+remove.
+			"batch_max" limits how long batch can be extended by new events (seconds from the first one),
+				defaulting to 10x "batch" value, so that constant stream of events is still delivered.
+			Batched events are only passed to callback while event_listen() is running.'''
+		if batch is True: batch = 0
+		if batch_max is None and batch is not None and batch is not False: batch_max = batch * 10
+		self._ev_table = event_table(facilities, types)
+		self._ev_indexes = frozenset(indexes) if indexes is not None else None
+		self.event_callback, self.event_batch, self.event_batch_max = func, batch, batch_max
+		self._ev_batch = OrderedDict() if batch is not None and batch is not False else None
+		self._ev_held.clear()
 
 	def event_listen(self, timeout=None, raise_on_disconnect=True):
 		'''Does not return until PulseLoopStop
 				gets raised in event callback or timeout passes.
 			timeout should be in seconds (float),
 				0 for non-blocking poll and None (default) for no timeout.
-			raise_on_disconnect causes PulseDisconnected exceptions by default.
+			raise_on_disconnect causes PulseDisconnected exceptions by default,
+				unless connection gets re-established, if that is enabled via reconnect_set().
 			Do not run any pulse operations from these callbacks.'''
 		assert self.event_callback
-		try: self._pulse_poll(timeout)
-		except c.pa.CallError: pass # e.g. from mainloop_dispatch() on disconnect
+		ts_deadline = timeout and c.mono_time() + timeout
+		while True:
+			try: self._pulse_poll(timeout)
+			except c.pa.CallError: pass # e.g. from mainloop_dispatch() on disconnect
+			if self.connected or not self._conn_lost or not self._reconnect: break
+			if not self._pulse_reconnect(
+				None if timeout is None else max(0, ts_deadline - c.mono_time()) ): break
+			if timeout: timeout = max(0, ts_deadline - c.mono_time())
+			if timeout == 0: break
 		if raise_on_disconnect and not self.connected: raise PulseDisconnected()
 
+	def events( self, timeout=None, maxsize=1024,
+			coalesce=False, facilities=None, types=None, indexes=None ):
+		'''Returns PulseEventQueue iterator over events, set as event_callback until closed.
+			"timeout" (seconds) stops iteration if there are no events within it, None - never stop.
+			"maxsize" limits number of queued events, dropping oldest ones, 0 - no limit.
+			"coalesce" keeps only one merged event per object in the queue, same as event_coalesce().
+			"facilities", "types" and "indexes" filters are same as in event_callback_set().
+			Does not set event mask, so event_mask_set() should be used before that.
+			Example:
+				pulse.event_mask_set('sink', 'sink_input')
+				with pulse.events(coalesce=True) as evs:
+					for ev in evs: print(ev, pulse.sink_input_list())'''
+		return PulseEventQueue(self, timeout, maxsize, coalesce, facilities, types, indexes)
+
 	def event_listen_stop(self):
 		'''Stop event_listen() loop from e.g. another thread.
 			Does nothing if libpulse poll is not running yet, so might be racey with
@@ -868,75 +2124,423 @@ class Pulse(object):
 		c.pa.mainloop_set_poll_func(self._loop, self._pa_poll_cb, None)
 
 
-	def get_peak_sample(self, source, timeout, stream_idx=None):
-		'''Returns peak (max) value in 0-1.0 range for samples in source/stream within timespan.
-			"source" can be either int index of pulseaudio source
-				(i.e. source.index), its name (source.name), or None to use default source.
-			Resulting value is what pulseaudio returns as
-				PA_SAMPLE_FLOAT32NE float after "timeout" seconds.
-			If specified source does not exist, 0 should be returned after timeout.
-			This can be used to detect if there's any sound
-				on the microphone or any sound played through a sink via its monitor_source index,
-				or same for any specific stream connected to these (if "stream_idx" is passed).
-			Sample stream masquerades as
-				application.id=org.PulseAudio.pavucontrol to avoid being listed in various mixer apps.
-			Example - get peak for specific sink input "si" for 0.8 seconds:
-				pulse.get_peak_sample(pulse.sink_info(si.sink).monitor_source, 0.8, si.index)'''
-		samples, proplist = [0], c.pa.proplist_from_string('application.id=org.PulseAudio.pavucontrol')
-		ss = c.PA_SAMPLE_SPEC(format=c.PA_SAMPLE_FLOAT32NE, rate=25, channels=1)
-		s = c.pa.stream_new_with_proplist(self._ctx, 'peak detect', c.byref(ss), None, proplist)
-		c.pa.proplist_free(proplist)
-
+	def _peak_stream_open(self, source, stream_idx, rate, values_cb):
+		'''Creates and connects PA_STREAM_PEAK_DETECT record stream for get_peak_sample()
+				and PulsePeakMonitor, passing lists of float peak values to values_cb as they arrive.
+			Returns (stream, c_cb) tuple, where c_cb must be kept around until _peak_stream_close().'''
 		@c.PA_STREAM_REQUEST_CB_T
 		def read_cb(s, bs, userdata):
-			buff, bs = c.c_void_p(), c.c_int(bs)
+			buff, bs = c.c_void_p(), c.c_size_t(bs)
 			c.pa.stream_peek(s, buff, c.byref(bs))
 			try:
 				if not buff or bs.value < 4: return
 				# This assumes that native byte order for floats is BE, same as pavucontrol
-				samples[0] = max(samples[0], c.cast(buff, c.POINTER(c.c_float))[0])
+				values_cb(c.cast(buff, c.POINTER(c.c_float))[:bs.value // 4])
 			finally:
 				# stream_drop() flushes buffered data (incl. buff=NULL "hole" data)
 				# stream.h: "should not be called if the buffer is empty"
 				if bs.value: c.pa.stream_drop(s)
 
-		if stream_idx is not None: c.pa.stream_set_monitor_stream(s, stream_idx)
-		c.pa.stream_set_read_callback(s, read_cb, None)
 		if source is not None: source = unicode(source).encode('utf-8')
-		try:
-			c.pa.stream_connect_record( s, source,
-				c.PA_BUFFER_ATTR(fragsize=4, maxlength=2**32-1),
-				c.PA_STREAM_DONT_MOVE | c.PA_STREAM_PEAK_DETECT |
-					c.PA_STREAM_ADJUST_LATENCY | c.PA_STREAM_DONT_INHIBIT_AUTO_SUSPEND )
-		except c.pa.CallError:
-			c.pa.stream_unref(s)
-			raise
+		with self._ctx_lock:
+			proplist = c.pa.proplist_from_string('application.id=org.PulseAudio.pavucontrol')
+			ss = c.PA_SAMPLE_SPEC(format=c.PA_SAMPLE_FLOAT32NE, rate=rate, channels=1)
+			s = c.pa.stream_new_with_proplist(self._ctx, 'peak detect', c.byref(ss), None, proplist)
+			c.pa.proplist_free(proplist)
+			if stream_idx is not None: c.pa.stream_set_monitor_stream(s, stream_idx)
+			c.pa.stream_set_read_callback(s, read_cb, None)
+			try:
+				c.pa.stream_connect_record( s, source,
+					c.PA_BUFFER_ATTR(fragsize=4, maxlength=2**32-1),
+					c.PA_STREAM_DONT_MOVE | c.PA_STREAM_PEAK_DETECT |
+						c.PA_STREAM_ADJUST_LATENCY | c.PA_STREAM_DONT_INHIBIT_AUTO_SUSPEND )
+			except c.pa.CallError:
+				c.pa.stream_unref(s)
+				raise
+		return s, read_cb
 
-		try: self._pulse_poll(timeout)
-		finally:
+	def _peak_stream_wait(self, timeout):
+		'''Runs eventloop for "timeout" seconds or until disconnected, to collect peak values.
+			Uses _pulse_wait(), so that events are not passed to event_callback in the meantime,
+				and PulseLoopStop or event_listen() in other threads don't interfere with it.'''
+		self._pulse_wait(lambda: not self.connected, timeout)
+
+	def _peak_stream_close(self, s):
+		with self._ctx_lock:
 			try: c.pa.stream_disconnect(s)
 			except c.pa.CallError: pass # stream was removed
+			c.pa.stream_unref(s)
 
-		c.pa.stream_unref(s)
+	def get_peak_sample(self, source, timeout, stream_idx=None):
+		'''Returns peak (max) value in 0-1.0 range for samples in source/stream within timespan.
+			"source" can be either int index of pulseaudio source
+				(i.e. source.index), its name (source.name), or None to use default source.
+			Resulting value is what pulseaudio returns as
+				PA_SAMPLE_FLOAT32NE float after "timeout" seconds.
+			If specified source does not exist, 0 should be returned after timeout.
+			This can be used to detect if there's any sound
+				on the microphone or any sound played through a sink via its monitor_source index,
+				or same for any specific stream connected to these (if "stream_idx" is passed).
+			Sample stream masquerades as
+				application.id=org.PulseAudio.pavucontrol to avoid being listed in various mixer apps.
+			See also get_peak_samples() to get peaks for multiple sources/streams at once,
+				and peak_monitor() to keep such stream open for multiple measurements.
+			Example - get peak for specific sink input "si" for 0.8 seconds:
+				pulse.get_peak_sample(pulse.sink_info(si.sink).monitor_source, 0.8, si.index)'''
+		samples = [0]
+		def values_cb(values): samples[0] = max(samples[0], max(values))
+		s, cb = self._peak_stream_open(source, stream_idx, 25, values_cb)
+		try: self._peak_stream_wait(timeout)
+		finally: self._peak_stream_close(s)
 		return min(1.0, samples[0])
 
+	def get_peak_samples(self, targets, timeout):
+		'''Same as get_peak_sample(), but for any number of sources/streams at once,
+				opening all peak-detect streams together and running eventloop for a single "timeout".
+			"targets" is an iterable of source index/name values (None for default source)
+				or (source, stream_idx) tuples, same as get_peak_sample() arguments.
+			Returns {target: peak} dict for all passed targets, with lists converted to tuples.
+			Example - check which sink inputs are playing something:
+				peaks = pulse.get_peak_samples(list(
+					(pulse.sink_info(si.sink).monitor_source, si.index)
+					for si in pulse.sink_input_list() ), 0.5)'''
+		peaks, streams = dict(), list()
+		try:
+			for target in targets:
+				if isinstance(target, list): target = tuple(target)
+				source, stream_idx = target if is_list(target) else (target, None)
+				peaks[target] = 0
+				def values_cb(values, k=target): peaks[k] = max(peaks[k], max(values))
+				streams.append(self._peak_stream_open(source, stream_idx, 25, values_cb))
+			if streams: self._peak_stream_wait(timeout)
+		finally:
+			for s, cb in streams: self._peak_stream_close(s)
+		return dict((k, min(1.0, v)) for k, v in peaks.items())
+
+	def peak_monitor(self, source=None, stream_idx=None, rate=25, window=1.0):
+		'''Returns PulsePeakMonitor for source/stream, which keeps peak-detect
+				stream connected until its close(), instead of doing it for each get_peak_sample() call.
+			"source" and "stream_idx" are same as with get_peak_sample(),
+				"rate" is a number of peak values per second, each one being a max over 1/rate interval,
+				and "window" is a timespan (seconds) of most recent peak values to keep around (must be >0).
+			Example - print VU-meter values for default source 10 times per second:
+				with pulse.peak_monitor(rate=10) as mon:
+					for ts, peak in mon: print('{:.2f} {}'.format(ts, '#' * int(peak * 50)))'''
+		return PulsePeakMonitor(self, source, stream_idx, rate, window)
+
+
+	def record( self, source=None, sample_spec=('s16le', 44100, 2),
+			buffer_attr=None, stream_idx=None, hole_fill=False, name='record' ):
+		'''Returns PulseRecordStream to read raw PCM data from specified source or stream.
+			"source" and "stream_idx" are same as with get_peak_sample(), None for default source.
+			"sample_spec" is (format, rate, channels) tuple or PA_SAMPLE_SPEC struct,
+				with format being PulseSampleFormatEnum value or its name, e.g. "s16le" or "float32le".
+			"buffer_attr" can be a dict of PA_BUFFER_ATTR values (in bytes), e.g. fragsize=4096,
+				with "fragsize" being the size of data chunks to receive, and
+				"maxlength" - max amount of data buffered by the client before it is dropped.
+			Example - save 10s of audio from default source:
+				with pulse.record() as rec, open('audio.raw', 'wb') as dst:
+					buff = bytearray(rec.frame_size * 44100 * 10)
+					dst.write(buff[:rec.read_into(buff)])'''
+		return PulseRecordStream( self, source, sample_spec,
+			buffer_attr, stream_idx, hole_fill=hole_fill, name=name )
+
+	def play_stream( self, sink=None,
+			sample_spec=('s16le', 44100, 2), buffer_attr=None, name='playback' ):
+		'''Returns PulsePlaybackStream to write raw PCM data to specified sink (None - default one).
+			"sample_spec" and "buffer_attr" are same as with record() method,
+				except buffer attributes relevant for playback are maxlength, tlength, prebuf and minreq.
+			Example - play 1s of 440 Hz tone:
+				rate, tone = 44100, array.array('h')
+				tone.extend(int(8000 * math.sin(2 * math.pi * 440 * n / rate)) for n in range(rate))
+				with pulse.play_stream(sample_spec=('s16le', rate, 1)) as s: s.write(tone); s.drain()'''
+		return PulsePlaybackStream(self, sink, sample_spec, buffer_attr, name=name)
+
+	def sample_upload(self, name, data_or_path, sample_spec=None):
+		'''Stores sound sample with specified name in the server sample cache,
+				replacing any existing one with same name, to be played by play_sample() later.
+			"data_or_path" can be a path (str) to WAV or raw PCM file, or buffer-protocol object
+				(bytes, array, numpy array, mmap, etc) with same contents, and files are
+				mmap'ed and uploaded from there, so that large ones are not read into memory.
+				On python2, paths must be unicode or have __fspath__, as str there is bytes data.
+			Empty files or data (incl. WAV without any frames) raise PulseError.
+			"sample_spec" is same as with play_stream() method, and must be specified for raw PCM,
+				while for WAV files it's read from the header and only overrides that, if passed.'''
+		src = src_mmap = None
+		try:
+			if isinstance(data_or_path, unicode) or hasattr(data_or_path, '__fspath__'):
+				with open(data_or_path, 'rb') as src_file:
+					if not os.fstat(src_file.fileno()).st_size: # can't be mmap'ed
+						raise PulseError('Sample file is empty: {!r}'.format(data_or_path))
+					src_mmap = mmap.mmap(src_file.fileno(), 0, access=mmap.ACCESS_READ)
+				data = src = memoryview(src_mmap)
+			else: data = data_or_path
+			wav = wav_parse(data)
+			if wav:
+				spec, data = wav
+				if sample_spec is None: sample_spec = spec
+			if sample_spec is None: raise PulseError('sample_spec must be specified for raw PCM data')
+			data = memoryview(data)
+			if data.format != 'B' or data.ndim != 1: data = data.cast('B')
+			if not len(data): raise PulseError('Sample data is empty: {!r}'.format(name))
+			with PulseSampleUploadStream(self, name, sample_spec, len(data)) as s:
+				if s.write(data) != len(data): raise PulseError('Sample upload was interrupted')
+				s.finish()
+		finally:
+			data = wav = None
+			if src is not None: src.release()
+			if src_mmap is not None:
+				try: src_mmap.close()
+				except BufferError: pass # views are still referenced from traceback, gc will close it
+
 	def play_sample(self, name, sink=None, volume=1.0, proplist_str=None):
 		'''Play specified sound sample,
 				with an optional sink object/name/index, volume and proplist string parameters.
-			Sample must be stored on the server in advance, see e.g. "pacmd list-samples".
+			Sample must be stored on the server in advance, e.g. via sample_upload() method.
+			Returns as soon as playback is started, not when it ends, so op_timeout applies here as usual.
 			See also libcanberra for an easy XDG theme sample loading, storage and playback API.'''
+		proplist = c.pa.proplist_from_string(proplist_str) if proplist_str else None
+		pulse_op, pulse_args = self._play_sample_args(name, sink, volume, proplist)
+		try:
+			with self._pulse_op_cb(raw=True) as cb:
+				cb, pa_op = self._pulse_method_issue(pulse_op, pulse_args, cb)
+				c.pa.operation_unref(self._pulse_op_track(pa_op))
+		finally:
+			if proplist: c.pa.proplist_free(proplist)
+
+	@staticmethod
+	def _play_sample_args(name, sink, volume, proplist=None):
+		'Returns (pulse_op, pulse_args) for play_sample(), with proplist struct freed by the caller.'
 		if isinstance(sink, PulseSinkInfo): sink = sink.index
 		sink = str(sink) if sink is not None else None
-		proplist = c.pa.proplist_from_string(proplist_str) if proplist_str else None
-		volume = int(round(volume*c.PA_VOLUME_NORM))
-		with self._pulse_op_cb() as cb:
-			try:
-				if not proplist:
-					c.pa.context_play_sample(self._ctx, name, sink, volume, cb, None)
-				else:
-					c.pa.context_play_sample_with_proplist(
-						self._ctx, name, sink, volume, proplist, cb, None )
-			except c.pa.CallError as err: raise PulseOperationInvalid(err.args[-1])
+		pulse_args = [name, sink, int(round(volume*c.PA_VOLUME_NORM))]
+		if not proplist: return c.pa.context_play_sample, pulse_args
+		return c.pa.context_play_sample_with_proplist, pulse_args + [proplist]
+
+
+class PulseThreaded(Pulse):
+	'''Pulse client running libpulse eventloop in its own
+			thread via pa_threaded_mainloop, with same API as Pulse class.
+
+		Any number of threads can call methods of the same instance at the same time,
+			each sending its operations to the server and waiting for their own results,
+			with loop thread only holding the lock while processing something.
+
+		Events are queued in the loop thread and passed to event_callback from
+			whichever thread is running event_listen(), which does not block other
+			threads from running other operations (or even same thread from the callback).
+		Events are only queued when event_callback is set,
+			and should be processed via event_listen() at some point after that.
+
+		batch() works same as with Pulse, but is not per-thread, and
+			should not be used while other threads can run operations on the same instance.
+		set_poll_func() is not supported here.'''
+
+	def _loop_init(self):
+		self._loop = c.pa.threaded_mainloop_new()
+		self._loop_lock, self._ctx_lock = FakeLock(), ThreadedMainloopLock(self._loop)
+		self._loop_running = self._loop_closed = False
+		self._api = c.pa.threaded_mainloop_get_api(self._loop)
+		self._ev_queue, self._ev_cond = deque(), threading.Condition()
+		self._timers, self._timer_ids, self._timer_cond = list(), it.count(), threading.Condition()
+		self._timer_thread = None
+		c.pa.threaded_mainloop_start(self._loop)
+
+	def close(self):
+		if not self._loop: return
+		self._pulse_timers_stop()
+		try:
+			self.disconnect()
+			c.pa.threaded_mainloop_stop(self._loop)
+			c.pa.context_unref(self._ctx)
+			c.pa.threaded_mainloop_free(self._loop)
+		finally: self._ctx = self._loop = None
+		self._loop_closed = True
+		self.event_listen_stop()
+
+	def _pulse_signal(self):
+		with self._ctx_lock: c.pa.threaded_mainloop_signal(self._loop, 0)
+
+	def _pulse_timer(self, timeout):
+		'''Schedules _pulse_signal() call after "timeout" seconds, to wake up threaded_mainloop_wait(),
+				returning timer to pass to _pulse_timer_cancel() or None if timeout is None.
+			All timers are handled by one long-lived thread, started on first use.'''
+		if timeout is None: return
+		timer = [c.mono_time() + timeout, next(self._timer_ids), True] # deadline, id, active
+		with self._timer_cond:
+			heapq.heappush(self._timers, timer)
+			if self._timer_thread is None:
+				self._timer_thread = threading.Thread(
+					target=self._pulse_timers_run, name='pulsectl-timers' )
+				self._timer_thread.daemon = True
+				self._timer_thread.start()
+			elif self._timers[0] is timer: self._timer_cond.notify()
+		return timer
+
+	def _pulse_timer_cancel(self, timer):
+		if timer: timer[2] = False # removed from heap in the timer thread
+
+	def _pulse_timers_run(self):
+		while True:
+			with self._timer_cond:
+				while True:
+					if not self._timer_thread: return # stopped on close()
+					while self._timers and not self._timers[0][2]: heapq.heappop(self._timers)
+					delay = None if not self._timers else self._timers[0][0] - c.mono_time()
+					if delay is not None and delay <= 0: break
+					self._timer_cond.wait(delay)
+				heapq.heappop(self._timers)
+			self._pulse_signal() # not under _timer_cond, as it takes mainloop lock
+
+	def _pulse_timers_stop(self):
+		with self._timer_cond:
+			thread, self._timer_thread = self._timer_thread, False
+			self._timer_cond.notify()
+		if thread and thread is not threading.current_thread(): thread.join()
+
+	def _pulse_connect_wait(self, timeout=None):
+		timer, ts_deadline = self._pulse_timer(timeout or None), timeout and c.mono_time() + timeout
+		try:
+			while self.connected is None:
+				if timeout and c.mono_time() >= ts_deadline: break
+				c.pa.threaded_mainloop_wait(self._loop)
+		finally: self._pulse_timer_cancel(timer)
+		if self.connected is None:
+			c.pa.context_disconnect(self._ctx)
+			while self.connected is not False: c.pa.threaded_mainloop_wait(self._loop)
+			raise PulseError('Timed-out connecting to pulseaudio server [{:,.1f}s]'.format(timeout))
+
+	def _pulse_state_cb(self, ctx, userdata):
+		super(PulseThreaded, self)._pulse_state_cb(ctx, userdata)
+		c.pa.threaded_mainloop_signal(self._loop, 0)
+		with self._ev_cond: self._ev_cond.notify_all()
+
+	def _pulse_subscribe_cb(self, ctx, ev, idx, userdata):
+		if not self.event_callback: return
+		ev = self._ev_table[ev & 0x3f]
+		if ev is None or (self._ev_indexes is not None and idx not in self._ev_indexes): return
+		with self._ev_cond:
+			self._ev_queue.append((ev, idx))
+			self._ev_cond.notify_all()
+
+	def _pulse_action(self):
+		act_id, cb = super(PulseThreaded, self)._pulse_action()
+		return act_id, lambda s=True,cb=cb: cb(s) or c.pa.threaded_mainloop_signal(self._loop, 0)
+
+	def _pulse_actions_wait(self, act_ids, timeout=KeyError):
+		if timeout is KeyError: timeout = self.op_timeout
+		timer, ts_deadline = self._pulse_timer(timeout), timeout is not None and c.mono_time() + timeout
+		try:
+			with self._ctx_lock:
+				for act_id in act_ids:
+					while self.connected and self._actions[act_id] is None:
+						if timeout is not None and c.mono_time() >= ts_deadline:
+							self._pulse_ops_cancel(act_ids, timeout)
+						c.pa.threaded_mainloop_wait(self._loop)
+			return list(self._actions[act_id] for act_id in act_ids)
+		finally:
+			self._pulse_timer_cancel(timer)
+			for act_id in act_ids:
+				self._actions.pop(act_id, None)
+				self._action_ops.pop(act_id, None)
+
+	def _pulse_poll(self, timeout=None):
+		# Passes queued events to event_callback until loop is stopped or timeout passes
+		ts_deadline = timeout is not None and c.mono_time() + timeout
+		with self._ev_cond: self._loop_stop = False
+		while True:
+			with self._ev_cond:
+				while not self._ev_queue:
+					if self._ev_batch and c.mono_time() >= self._ev_batch_ts: break
+					if self._loop_stop or not self.connected: return
+					delay = None if ts_deadline is False else ts_deadline - c.mono_time()
+					if delay is not None and delay <= 0: return
+					if self._ev_batch: # to deliver batched events in time
+						delay = min(d for d in [delay, self._ev_batch_ts - c.mono_time()] if d is not None)
+					self._ev_cond.wait(delay)
+				if self._ev_batch is None: evs = [self._ev_queue.popleft()]
+				else: evs, self._ev_queue = self._ev_queue, deque()
+			for ev, idx in evs:
+				if self.event_callback: self._pulse_event_dispatch(ev, idx)
+			if self._ev_batch: self._pulse_event_batch_flush()
+			if self._loop_stop: return
+
+	def _pulse_wait(self, check, timeout=None):
+		# Loop thread runs callbacks with the lock held, so _pulse_wakeup() can't be missed here
+		timer, ts_deadline = self._pulse_timer(timeout), timeout is not None and c.mono_time() + timeout
+		try:
+			with self._ctx_lock:
+				while True:
+					res = check()
+					if res or (timeout is not None and c.mono_time() >= ts_deadline): return res
+					if not self.connected: raise PulseDisconnected()
+					c.pa.threaded_mainloop_wait(self._loop)
+		finally: self._pulse_timer_cancel(timer)
+
+	def _pulse_wakeup(self):
+		# Only called from loop thread, where lock is already held
+		c.pa.threaded_mainloop_signal(self._loop, 0)
+
+	def event_listen_stop(self):
+		'''Stop event_listen() loop from e.g. another thread.
+			Same as with Pulse class, does nothing if event_listen() is not running yet.'''
+		with self._ev_cond:
+			self._loop_stop = True
+			self._ev_cond.notify_all()
+
+	def set_poll_func(self, func, func_err_handler=None):
+		raise NotImplementedError('Not supported with pa_threaded_mainloop')
+
+
+def trace_set(sink):
+	'''Sets callable to pass LibPulseCall namedtuple to after every libpulse call,
+			e.g. PulseTraceRing/PulseTraceJSONL instance, or None to disable tracing (default).
+		Tuples have (func, args, ts, duration, res, errno) fields, with func being libpulse
+			function name, args/res - short summaries of values, ts/duration - monotonic time
+			of the call and its duration in seconds, and errno set for failed context calls.
+		This is a global setting for all Pulse instances, with negligible overhead when disabled.
+		Sink will be called from eventloop thread with PulseThreaded as well.
+		Exceptions raised by it are printed to stderr, and don't affect libpulse calls.
+		Returns previously set sink.'''
+	return c.pa.trace_swap(sink)
+
+class PulseTraceRing(object):
+	'''Tracing sink to use with trace_set(), which stores last "size" calls in "calls" deque.
+		summary() method can be used to aggregate these per-function.'''
+
+	def __init__(self, size=1000): self.calls = deque(maxlen=size)
+	def __call__(self, call): self.calls.append(call)
+
+	def summary(self):
+		'''Returns {func: (count, duration_total, duration_max)} dict for stored calls,
+			in seconds, which can be used to find which libpulse functions take most time.'''
+		res = dict()
+		for call in list(self.calls):
+			n, total, peak = res.get(call.func, (0, 0, 0))
+			res[call.func] = n + 1, total + call.duration, max(peak, call.duration)
+		return res
+
+class PulseTraceJSONL(object):
+	'''Tracing sink to use with trace_set(), which writes calls as JSON lines to a file.
+		"dst" can be a path to append to or a file object opened in text mode.
+		Can be used as a context manager, to close opened file on exit.'''
+
+	def __init__(self, dst, flush=False):
+		self._dst_close = not hasattr(dst, 'write')
+		self.dst, self.flush = dst if not self._dst_close else io.open(dst, 'a'), flush
+		self._lock = threading.Lock()
+
+	def __call__(self, call):
+		line = json.dumps(dict(zip(call._fields, call)), sort_keys=True) + '\n'
+		if isinstance(line, bytes): line = line.decode('utf-8') # py2
+		with self._lock:
+			self.dst.write(line)
+			if self.flush: self.dst.flush()
+
+	def close(self):
+		if self._dst_close: self.dst.close()
+	def __enter__(self): return self
+	def __exit__(self, *err): self.close()
 
 
 def connect_to_cli(server=None, as_file=True, socket_timeout=1.0, attempts=5, retry_delay=0.3):
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+
+import itertools as it, operator as op, functools as ft
+import os, sys, json, time, platform, contextlib, argparse, subprocess
+
+try: import pulsectl
+except ImportError:
+	sys.path.insert( 1,
+		os.path.abspath(os.path.join(__file__, *['..']*3)) )
+	import pulsectl
+
+from pulsectl import _pulsectl as c
+from pulsectl._pulsectl import mono_time
+from pulsectl.tests.test_with_dummy_instance import dummy_pulse_init, dummy_pulse_cleanup
+
+
+# Run as e.g.: python -m pulsectl.tests.benchmarks -n 100
+#  or: python -m pulsectl.tests.benchmarks -s 10,100,1000 -j results.json
+# These are not tests and are not run by "unittest discover" due to filename.
+
+
+def timed(func, repeat):
+	'Returns (min, avg) time for specified number of func() calls, in seconds.'
+	ts_list = list()
+	for n in range(repeat):
+		ts = mono_time()
+		func()
+		ts_list.append(mono_time() - ts)
+	return min(ts_list), sum(ts_list) / len(ts_list)
+
+@contextlib.contextmanager
+def dummy_instance(null_sinks=0, streams=0):
+	'''Starts dummy pulseaudio instance with specified number of extra null-sinks,
+		and opens playback streams (sink-inputs) from the same client, spread over these sinks.
+		Streams are never written to, so don't use any cpu on the server.'''
+	info, stream_list = dummy_pulse_init(), list()
+	try:
+		with pulsectl.Pulse('bench', server=info.sock_unix) as pulse:
+			for n in range(null_sinks):
+				pulse.module_load('module-null-sink', 'sink_name=bench-{}'.format(n))
+			for n in range(streams):
+				stream_list.append(pulse.play_stream( 'bench-{}'.format(n % null_sinks)
+					if null_sinks else None, ('u8', 8000, 1), name='bench-{}'.format(n) ))
+			for s in stream_list: s.wait_ready()
+			try: yield info, pulse
+			finally:
+				for s in stream_list: s.close()
+	finally: dummy_pulse_cleanup(info)
+
+
+def bench_proplist(pulse, n, repeat):
+	'sink_list() + source_list() with eager/lazy proplist decoding, and lazy with proplist access.'
+	res, lazy_mode = dict(), pulsectl.PulseObject.proplist_lazy
+	def list_objs(access=False):
+		for obj in it.chain(pulse.sink_list(), pulse.source_list()):
+			if access: obj.proplist
+	try:
+		for k, lazy, access in [
+				('eager', False, False), ('lazy', True, False), ('lazy-access', True, True) ]:
+			pulsectl.PulseObject.proplist_lazy = lazy
+			res[k] = timed(ft.partial(list_objs, access), repeat)
+	finally: pulsectl.PulseObject.proplist_lazy = lazy_mode
+	return res
+
+
+def bench_memory(pulse, n, repeat):
+	'''Average per-object memory footprint (shallow, in bytes) of info objects with
+		__slots__ vs same attributes in __dict__ and per-object state_values list (pre-26.10.4).'''
+	class DictObject(object): pass
+	res = dict()
+	for k, objs in [
+			('sink', pulse.sink_list()), ('source', pulse.source_list()),
+			('module', pulse.module_list()), ('client', pulse.client_list()) ]:
+		sz_slots = sz_dict = 0
+		for obj in objs:
+			sz_slots += sys.getsizeof(obj)
+			obj_dict = DictObject()
+			for slot in it.chain.from_iterable(
+					getattr(cls, '__slots__', ()) for cls in type(obj).__mro__ ):
+				if slot != '__weakref__' and hasattr(obj, slot):
+					setattr(obj_dict, slot, getattr(obj, slot))
+			if hasattr(obj, 'state'): obj_dict.state_values = list(obj.state_values)
+			sz_dict += sys.getsizeof(obj_dict) + sys.getsizeof(vars(obj_dict))
+			if hasattr(obj, 'state'): sz_dict += sys.getsizeof(obj_dict.state_values)
+		res['{}-slots'.format(k)] = sz_slots // len(objs)
+		res['{}-dict'.format(k)] = sz_dict // len(objs)
+	return res
+
+
+def bench_events(pulse, n, repeat):
+	'''Subscription callback handling of n*100 raw events (all facilities/types),
+		with and without facility/index filters set via event_callback_set().'''
+	res, evs = dict(), list((ev, idx) for idx in range(n) for ev in [0x10, 0x12, 0x00, 0x21] * 25)
+	def run():
+		for ev, idx in evs: pulse._pulse_subscribe_cb(None, ev, idx, None)
+	try:
+		for k, filters in [ ('all', dict()),
+				('sink-only', dict(facilities=['sink'])), ('one-index', dict(indexes=[0])) ]:
+			pulse.event_callback_set(lambda ev: None, **filters)
+			res[k] = timed(run, repeat)
+	finally: pulse.event_callback_set(None)
+	return res
+
+
+def bench_sink_input_list(pulse, n, repeat):
+	'sink_input_list() with n sink-inputs.'
+	return dict(list=timed(pulse.sink_input_list, repeat))
+
+
+def timed_batch(pulse, func, repeat):
+	'Returns dict with timed() results for func() calls, made one-by-one and within pulse.batch().'
+	def run(batch):
+		if not batch: return func()
+		with pulse.batch(): func()
+	return dict( (k, timed(ft.partial(run, batch), repeat))
+		for k, batch in [('sequential', False), ('batch', True)] )
+
+
+def bench_volume_set(pulse, n, repeat):
+	'volume_set_all_chans() for all n sink-inputs, one-by-one and pipelined via batch().'
+	sis, vol = pulse.sink_input_list(), [0.5]
+	def vol_set():
+		vol[0] = 1.0 - vol[0] # alternate values, as unchanged ones can be a no-op on the server
+		for si in sis: pulse.volume_set_all_chans(si, vol[0])
+	return timed_batch(pulse, vol_set, repeat)
+
+
+def bench_sink_input_move(pulse, n, repeat):
+	'''sink_input_move() of all n sink-inputs to next sink in the list, one-by-one and via batch().
+		Number of streams per sink is kept the same, as server limits it (256 by default).'''
+	sinks = list(s.index for s in pulse.sink_list())
+	def move():
+		for si in pulse.sink_input_list():
+			pulse.sink_input_move(si.index, sinks[(sinks.index(si.sink) + 1) % len(sinks)])
+	return timed_batch(pulse, move, repeat)
+
+
+def bench_event_throughput(pulse, n, repeat):
+	'''Time until "change" events for all n sink-inputs are received after batched mute toggle,
+		and resulting events-per-second rate. Server can merge events, which is ignored here.'''
+	sis, evs, mute = pulse.sink_input_list(), set(), [False]
+	def ev_cb(ev):
+		evs.add(ev.index)
+		if len(evs) >= len(sis): raise pulsectl.PulseLoopStop
+	def run():
+		evs.clear()
+		mute[0] = not mute[0]
+		with pulse.batch():
+			for si in sis: pulse.sink_input_mute(si.index, mute[0])
+		while len(evs) < len(sis): pulse.event_listen(timeout=5)
+	pulse.event_mask_set('sink_input')
+	pulse.event_callback_set(ev_cb)
+	try: ts = timed(run, repeat)
+	finally:
+		pulse.event_callback_set(None)
+		pulse.event_mask_set('null')
+	return dict(events=ts, rate=int(len(sis) / ts[1]))
+
+
+def bench_peak_sample(pulse, n, repeat, timeout=0.05):
+	'''get_peak_sample() from one sink monitor and get_peak_samples() from up to n of them at once.
+		Reported time is overhead on top of "timeout" that both calls always wait for.'''
+	srcs = list(s.monitor_source for s in pulse.sink_list())[:n]
+	res = dict(
+		single=timed(lambda: pulse.get_peak_sample(srcs[0], timeout), repeat),
+		multi=timed(lambda: pulse.get_peak_samples(srcs, timeout), repeat) )
+	return dict((k, tuple(max(0, v - timeout) for v in ts)) for k, ts in res.items())
+
+
+def bench_import(pulse, n, repeat):
+	'''"import pulsectl" time in a new python process, minus interpreter startup time,
+		and same with connecting and making one sink_list() call, where libpulse gets loaded.'''
+	env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter( None,
+		[os.path.dirname(os.path.dirname(pulsectl.__file__)), os.environ.get('PYTHONPATH')] )))
+	def py_run(code): subprocess.check_call([sys.executable, '-c', code], env=env)
+	res, ts_base = dict(), timed(ft.partial(py_run, 'pass'), repeat)
+	for k, code in [ ('import', 'import pulsectl'),
+			('import-call', 'import pulsectl; pulsectl.Pulse(server={!r}).sink_list()'.format(pulse.server)) ]:
+		res[k] = tuple(max(0, a - b) for a, b in zip(timed(ft.partial(py_run, code), repeat), ts_base))
+	return res
+
+
+def bench_call_overhead(pulse, n, repeat):
+	'''n*1000 proplist_gets() calls via raw ctypes function, LibPulse attribute (fast-path),
+		wrapper stored before binding (as in Pulse class attributes) and with trace_set() enabled.'''
+	proplist, res, calls = c.pa.proplist_from_string(b'media.name=bench'), dict(), n * 1000
+	def run(func):
+		for m in range(calls): func(proplist, b'media.name')
+	try:
+		c.pa.proplist_gets(proplist, b'media.name') # binds function
+		for k, func in [ ('ctypes', c.pa._lib.pa_proplist_gets),
+				('fast', c.pa.proplist_gets), ('wrapper', c.pa.funcs['proplist_gets']) ]:
+			res[k] = timed(ft.partial(run, func), repeat)
+		pulsectl.trace_set(lambda call: None)
+		try: res['traced'] = timed(ft.partial(run, c.pa.proplist_gets), repeat)
+		finally: pulsectl.trace_set(None)
+	finally: c.pa.proplist_free(proplist)
+	return res
+
+
+def main(args=None):
+	benchmarks = sorted(k[6:] for k in globals() if k.startswith('bench_'))
+	parser = argparse.ArgumentParser(
+		description='Run performance benchmarks against dummy pulseaudio instance.')
+	parser.add_argument('bench', nargs='*',
+		help='Benchmark(s) to run, default - all of them: {}'.format(', '.join(benchmarks)))
+	parser.add_argument('-n', '--objects', type=int, metavar='n', default=50,
+		help='Number of objects (null sinks and playback streams)'
+			' to create for benchmarks. Default: %(default)s')
+	parser.add_argument('-s', '--scales', metavar='n1,n2,...',
+		help='Comma-separated list of object counts to run benchmarks with,'
+			' each one against new pulseaudio instance, e.g. 10,100,1000. Overrides -n option.')
+	parser.add_argument('-r', '--repeat', type=int, metavar='n', default=20,
+		help='Number of times to repeat each timed operation. Default: %(default)s')
+	parser.add_argument('-j', '--json', metavar='path',
+		help='Write results to specified JSON file, or "-" to print it instead of text output.'
+			' Timings there are in seconds, as {"min": ..., "avg": ...} objects.')
+	opts = parser.parse_args(sys.argv[1:] if args is None else args)
+
+	for k in opts.bench or benchmarks:
+		if k not in benchmarks: parser.error('Unknown benchmark: {!r}'.format(k))
+	scales = [opts.objects] if not opts.scales else list(map(int, opts.scales.split(',')))
+
+	results = list()
+	for n in scales:
+		with dummy_instance(n, n) as (info, pulse):
+			for k in opts.bench or benchmarks:
+				func = globals()['bench_{}'.format(k)]
+				for name, res in sorted(func(pulse, n, opts.repeat).items()):
+					results.append(dict(bench=k, n=n, name=name, result=res))
+					if isinstance(res, tuple): # timed() result
+						results[-1]['result'] = dict(zip(['min', 'avg'], res))
+						res = 'min={:.2f}ms avg={:.2f}ms'.format(*(v * 1000 for v in res))
+					if opts.json != '-': print('{}[n={}] {}: {}'.format(k, n, name, res))
+
+	if opts.json:
+		results = json.dumps(dict( results=results, meta=dict(
+			ts=time.time(), repeat=opts.repeat, scales=scales,
+			python=platform.python_version() ) ), indent=2, sort_keys=True)
+		if opts.json == '-': print(results)
+		else:
+			with open(opts.json, 'w') as dst: dst.write(results + '\n')
+
+if __name__ == '__main__': sys.exit(main())
@@ -3,8 +3,8 @@
 from __future__ import unicode_literals, print_function
 
 import itertools as it, operator as op, functools as ft
-import unittest, contextlib, hashlib, atexit, signal, threading, select, errno
-import os, sys, io, time, subprocess, tempfile, shutil, socket
+import unittest, contextlib, array, struct, math, hashlib, atexit, signal, threading, select, errno
+import os, sys, io, time, json, subprocess, tempfile, shutil, socket, wave
 
 if sys.version_info.major > 2: unicode = str
 
@@ -361,6 +361,77 @@ class DummyTests(unittest.TestCase):
 			pulse.event_mask_set('null')
 			pulse.event_callback_set(None)
 
+	def test_events_batch(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sink, batches = pulse.sink_list()[0], list()
+			def ev_cb(evs):
+				batches.append(evs)
+				raise pulsectl.PulseLoopStop
+			pulse.event_mask_set('sink')
+			pulse.event_callback_set(ev_cb, batch=0.2)
+			with pulse.batch():
+				for n in range(20): pulse.volume_set_all_chans(sink, 0.5 + n / 100.0)
+			mod_idx = pulse.module_load('module-null-sink', 'sink_name=t-batch')
+			sink_tmp = pulse.get_sink_by_name('t-batch')
+			pulse.module_unload(mod_idx)
+			pulse.event_listen(timeout=5)
+			self.assertEqual(len(batches), 1)
+			evs = list((ev.t, ev.facility, ev.index) for ev in batches[0])
+			self.assertEqual(evs.count(('change', 'sink', sink.index)), 1)
+			self.assertEqual(len(evs), len(set(evs)))
+			self.assertEqual( # new+change+remove
+				[ev for ev in evs if ev[2] == sink_tmp.index], [('remove', 'sink', sink_tmp.index)] )
+			pulse.event_listen(timeout=0.3)
+			self.assertEqual(len(batches), 1)
+			pulse.event_mask_set('null')
+			pulse.event_callback_set(None)
+
+	def test_events_iter(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sink = pulse.sink_list()[0]
+			pulse.event_mask_set('sink')
+			with pulse.events(timeout=0.5, maxsize=5) as evs:
+				self.assertEqual(list(evs), list())
+				for n in range(10): pulse.volume_set_all_chans(sink, 0.5 + n / 100.0)
+				ev = next(evs)
+				self.assertEqual((ev.t, ev.facility, ev.index), ('change', 'sink', sink.index))
+				pulse.sink_info(sink.index) # blocking calls work between events
+				n = 1 + len(list(evs)) # server can merge some events, so counts can vary
+				self.assertEqual(n + evs.dropped, evs.received)
+				self.assertTrue(evs.high_water <= 5 and n <= 5)
+			self.assertIsNone(pulse.event_callback)
+			with pulse.events(timeout=0.5, coalesce=True) as evs:
+				with pulse.batch():
+					for n in range(10): pulse.volume_set_all_chans(sink, 0.5 + n / 100.0)
+				self.assertEqual(list((ev.t, ev.index) for ev in evs), [('change', sink.index)])
+				self.assertEqual((evs.coalesced, evs.dropped), (evs.received - 1, 0))
+				self.assertEqual(evs.stats['queued'], 0)
+			pulse.event_mask_set('null')
+
+	def test_events_filter(self):
+		table = pulsectl.pulsectl.event_table(['sink', 'source'], ['change'])
+		self.assertEqual(len(table), 64)
+		self.assertEqual(table[0x10], ('change', 'sink'))
+		self.assertEqual((table[0x00], table[0x12], table[0x20]), (None, None, None))
+		self.assertIs(pulsectl.pulsectl.event_table(), pulsectl.pulsectl.event_table())
+		for table in pulsectl.pulsectl.event_table([]), pulsectl.pulsectl.event_table(types=[]):
+			self.assertEqual(table, [None] * 64)
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sink1, sink2 = pulse.sink_list()[:2]
+			pulse.event_mask_set('all')
+			with pulse.events( timeout=0.5,
+					facilities=['sink'], types=['change'], indexes=[sink1.index] ) as evs:
+				mod_idx = pulse.module_load('module-null-sink', 'sink_name=t-filter')
+				pulse.module_unload(mod_idx)
+				pulse.volume_set_all_chans(sink2, 0.6)
+				pulse.volume_set_all_chans(sink1, 0.6)
+				evs = list((ev.t, ev.facility, ev.index) for ev in evs)
+				self.assertTrue(evs)
+				self.assertEqual(set(evs), {('change', 'sink', sink1.index)})
+			self.assertIsNone(pulse.event_callback)
+			self.assertIs(pulse._ev_table, pulsectl.pulsectl.event_table())
+			pulse.event_mask_set('null')
+
 	def test_cli(self):
 		xdg_dir_prev = os.environ.get('XDG_RUNTIME_DIR')
 		try:
@@ -428,6 +499,305 @@ class DummyTests(unittest.TestCase):
 			self.assertEqual(pulse.sink_info(sink.index).volume.values, sink.volume.values)
 			pulse.volume_set_all_chans(sink, 1.0)
 
+	def test_batch(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sinks = pulse.sink_list()
+			sink_nx = max(s.index for s in sinks) + 1
+
+			with pulse.batch() as ops:
+				for sink in sinks:
+					pulse.sink_mute(sink.index)
+					pulse.volume_set_all_chans(sink, 0.5)
+				self.assertTrue(all(op.success is None for op in ops))
+			self.assertEqual(len(ops), len(sinks) * 2)
+			self.assertTrue(all(op.success for op in ops))
+			for sink in pulse.sink_list():
+				self.assertTrue(sink.mute)
+				self.assertEqual(sink.volume.value_flat, 0.5)
+
+			with self.assertRaises(pulsectl.PulseOperationFailed):
+				with pulse.batch() as ops:
+					for sink in sinks: pulse.sink_mute(sink.index, False)
+					pulse.sink_mute(sink_nx, False)
+			self.assertEqual([op.success for op in ops], [True]*len(sinks) + [False])
+			for sink in pulse.sink_list(): self.assertFalse(sink.mute)
+
+			with pulse.batch(raise_on_fail=False) as ops:
+				pulse.sink_mute(sink_nx)
+				for sink in sinks: pulse.volume_set_all_chans(sink, 1.0)
+			self.assertEqual([op.success for op in ops], [False] + [True]*len(sinks))
+
+			with self.assertRaises(ValueError): # not replaced by PulseOperationFailed
+				with pulse.batch() as ops:
+					pulse.sink_mute(sink_nx)
+					pulse.sink_mute(sinks[0].index)
+					raise ValueError('test')
+			self.assertEqual([op.success for op in ops], [False, True]) # still waited for
+
+	def test_snapshot(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			snap = pulse.snapshot()
+			self.assertEqual(snap.server.server_name, pulse.server_info().server_name)
+			for k, func in [
+					('sinks', pulse.sink_list), ('sources', pulse.source_list),
+					('sink_inputs', pulse.sink_input_list),
+					('source_outputs', pulse.source_output_list),
+					('cards', pulse.card_list), ('clients', pulse.client_list),
+					('modules', pulse.module_list) ]:
+				self.assertEqual(
+					sorted(obj.index for obj in getattr(snap, k)),
+					sorted(obj.index for obj in func()) )
+			self.assertEqual(len(snap.sinks), 2)
+			self.assertTrue(snap.modules)
+
+	def test_state_cache(self):
+		from pulsectl.cache import PulseStateCache
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			cache = PulseStateCache(pulse)
+			self.assertEqual(set(cache.sinks), set(s.index for s in pulse.sink_list()))
+			self.assertEqual(set(cache.modules), set(m.index for m in pulse.module_list()))
+			self.assertEqual(cache.server.server_name, pulse.server_info().server_name)
+
+			def listen_until(check, timeout=3):
+				ts_deadline = time.time() + timeout
+				while not check():
+					delta = ts_deadline - time.time()
+					if delta <= 0: raise AssertionError('Timeout waiting for cache update')
+					cache.listen(delta)
+
+			sink = cache.sinks[min(cache.sinks)]
+			pulse.volume_set_all_chans(sink, 0.3)
+			listen_until(lambda: round(cache.get('sink', sink.index).volume.value_flat, 3) == 0.3)
+
+			idx = pulse.module_load('module-null-sink')
+			listen_until(lambda: len(cache.sinks) == 3 and idx in cache.modules)
+			pulse.module_unload(idx)
+			listen_until(lambda: len(cache.sinks) == 2 and idx not in cache.modules)
+			pulse.volume_set_all_chans(sink, 1.0)
+			pulse.event_mask_set('null')
+			pulse.event_callback_set(None)
+
+	def test_proplist_lazy(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sink, lazy_mode = pulse.sink_list()[0], pulsectl.PulseObject.proplist_lazy
+			try:
+				pulsectl.PulseObject.proplist_lazy = True
+				sink_lazy = pulse.sink_list()[0]
+			finally: pulsectl.PulseObject.proplist_lazy = lazy_mode
+			self.assertEqual(sink_lazy.proplist, sink.proplist)
+			self.assertIs(sink_lazy.proplist, sink_lazy.proplist)
+			self.assertTrue(isinstance(list(sink_lazy.proplist.keys())[0], unicode))
+			with self.assertRaises(AttributeError): pulse.server_info().proplist
+
+	def test_obj_slots(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sink, src = pulse.sink_list()[0], pulse.source_list()[0]
+			for obj in sink, src, sink.volume:
+				self.assertFalse(hasattr(obj, '__dict__'))
+				with self.assertRaises(AttributeError): obj.some_attr_that_does_not_exist = 1
+			self.assertIs(sink.state_values, src.state_values)
+			self.assertIn(sink.state, sink.state_values)
+			self.assertTrue(repr(sink).startswith('<PulseSinkInfo at '))
+			si = pulse.server_info()
+			self.assertEqual(vars(si)['server_name'], si.server_name)
+
+	def test_channel_map_cache(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sink1, sink2 = pulse.sink_list()[:2]
+			self.assertEqual( sink1.channel_list,
+				[pulse.channel_list_enum.front_left, pulse.channel_list_enum.front_right] )
+			self.assertEqual(sink1.channel_list, sink2.channel_list)
+			self.assertIsNot(sink1.channel_list, sink2.channel_list)
+			names = pulsectl.pulsectl.channel_names_cache[
+				sink1.channel_count, tuple(sink1.channel_list_raw) ]
+			self.assertEqual(list(names), sink1.channel_list)
+
+			sr1, sr2 = (
+				pulsectl.PulseExtStreamRestoreInfo.struct_from_value(
+					'test', 0.5, ['front-left', 'front-right'] ) for n in range(2) )
+			sr1.channel_map.map[0] = sr1.channel_map.map[1]
+			self.assertEqual(sr2.channel_map.channels, 2)
+			self.assertEqual(sr2.channel_map.map[:2], [1, 2])
+
+		cache = pulsectl.pulsectl.channel_map_cache
+		for n in range(pulsectl.pulsectl.channel_cache_max + 10):
+			pulsectl.pulsectl.channel_map_parse('aux{},aux{}'.format(n // 32, n % 32))
+		self.assertLessEqual(len(cache), pulsectl.pulsectl.channel_cache_max)
+
+	def test_libpulse_lazy(self):
+		lib = pulsectl._pulsectl.LibPulse()
+		self.assertIsNone(lib._lib)
+		func = lib.strerror
+		self.assertIs(lib.strerror, func)
+		self.assertIsNone(lib._lib)
+		self.assertEqual(func(0), 'OK')
+		self.assertIsNotNone(lib._lib)
+		self.assertIsNot(lib.strerror, func) # replaced by bound fast-path callable
+		self.assertEqual(lib.strerror(0), 'OK')
+		self.assertEqual(func(0), 'OK')
+		with self.assertRaises(AttributeError): lib.no_such_function
+
+	def test_trace(self):
+		ring, tmp_file = pulsectl.PulseTraceRing(100), os.path.join(self.tmp_dir, 'trace.jsonl')
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			with pulsectl.PulseTraceJSONL(tmp_file) as sink_jsonl:
+				self.assertIsNone(pulsectl.trace_set(lambda call: (ring(call), sink_jsonl(call))))
+				try: pulse.sink_list()
+				finally: pulsectl.trace_set(None)
+			n = len(ring.calls)
+			pulse.sink_list()
+			self.assertEqual(len(ring.calls), n)
+		call = list(call for call in ring.calls if call.func == 'pa_context_get_sink_info_list')[0]
+		self.assertEqual(call.args, ('LP_PA_CONTEXT', 'CFunctionType', None))
+		self.assertEqual(call.res, 'LP_PA_OPERATION')
+		self.assertGreaterEqual(call.duration, 0)
+		self.assertIsNone(call.errno)
+		self.assertEqual(ring.summary()['pa_context_get_sink_info_list'][0], 1)
+		with open(tmp_file) as src: lines = list(json.loads(line) for line in src)
+		self.assertEqual(len(lines), n)
+		self.assertEqual(lines[0]['func'], ring.calls[0].func)
+
+		class ErrSink(object):
+			def __init__(self): self.lines = list()
+			def write(self, s): self.lines.append(s)
+			def flush(self): pass
+		def sink_fail(call): raise RuntimeError('trace sink failure')
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			stderr, sys.stderr = sys.stderr, ErrSink()
+			try:
+				pulsectl.trace_set(sink_fail)
+				try: self.assertTrue(pulse.sink_list()) # not affected by sink errors
+				finally: self.assertIs(pulsectl.trace_set(None), sink_fail)
+			finally: stderr, sys.stderr = sys.stderr, stderr
+			self.assertIn('trace sink failure', ''.join(stderr.lines))
+
+	def test_stats(self):
+		tmp_file = os.path.join(self.tmp_dir, 'stats.prom')
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			pulse.sink_list()
+			self.assertEqual(pulse.stats(), dict())
+			pulse.stats_enable()
+			sink = pulse.sink_list()[0]
+			pulse.sink_list()
+			pulse.sink_mute(sink.index, False)
+			with self.assertRaises(pulsectl.PulseOperationFailed): pulse.sink_mute(2**20)
+			self.assertIsNotNone(pulse.stream_restore_test())
+			stats = pulse.stats()
+			self.assertEqual(sorted(stats), ['sink_list', 'sink_mute', 'stream_restore_test'])
+			st = stats['sink_list']
+			self.assertEqual((st.calls, st.errors, st.roundtrips), (2, 0, 2))
+			self.assertEqual(sum(st.hist), 2)
+			self.assertGreaterEqual(st.time_total, st.time_max)
+			st = stats['sink_mute']
+			self.assertEqual((st.calls, st.errors, st.roundtrips), (2, 1, 2))
+			pulse.stats_prometheus(tmp_file, labels=dict(host='test'))
+			with open(tmp_file) as src: lines = src.read().splitlines()
+			self.assertIn('pulsectl_calls_total{host="test",method="sink_list"} 2', lines)
+			self.assertIn( 'pulsectl_call_duration_seconds_bucket'
+				'{host="test",method="sink_mute",le="+Inf"} 2', lines )
+			self.assertEqual(len(pulse.stats(reset=True)), 3)
+			self.assertEqual(pulse.stats(), dict())
+			pulse.snapshot()
+			pulse.stream_restore_list()
+			stats = pulse.stats()
+			self.assertEqual(sorted(stats), ['snapshot', 'stream_restore_read'])
+			self.assertEqual((stats['snapshot'].calls, stats['snapshot'].roundtrips), (1, 8))
+		with pulsectl.PulseThreaded('t', server=self.sock_unix) as pulse:
+			pulse.stats_enable()
+			def worker():
+				for n in range(10): pulse.sink_list()
+			threads = list(threading.Thread(target=worker) for n in range(4))
+			for t in threads: t.start()
+			for t in threads: t.join()
+			st = pulse.stats()['sink_list']
+			self.assertEqual((st.calls, st.roundtrips), (40, 40)) # counted per-thread
+
+	def test_shared_enums(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as p1,\
+				pulsectl.PulseThreaded('t', server=self.sock_unix) as p2:
+			for k in 'event_types event_facilities event_masks channel_list_enum'.split():
+				self.assertIs(getattr(p1, k), getattr(p2, k))
+			self.assertIn('sink', p1.event_facilities)
+			self.assertIn('change', p1.event_types)
+			self.assertEqual(p1.channel_list_enum.front_left, 'front-left')
+
+	def test_async(self):
+		if sys.version_info < (3, 6): return self.skipTest('python-3.6+ only')
+		import asyncio
+		from pulsectl.aio import AsyncPulse
+		loop, pulse = asyncio.new_event_loop(), AsyncPulse('t', server=self.sock_unix)
+		run = loop.run_until_complete
+		gather = lambda *coros: run(asyncio.gather(*map(loop.create_task, coros)))
+		try:
+			run(pulse.connect())
+			sinks, srcs, si = gather(pulse.sink_list(), pulse.source_list(), pulse.server_info())
+			self.assertEqual(len(sinks), 2)
+			self.assertEqual(len(srcs), 2)
+			self.assertIn(si.default_sink_name, set(s.name for s in sinks))
+			with self.assertRaises(pulsectl.PulseIndexError): run(pulse.sink_info(2**20))
+			snap = run(pulse.snapshot())
+			self.assertEqual(len(snap.sinks), 2)
+
+			sink = sinks[0]
+			events = pulse.subscribe_events('sink')
+			ev_next = loop.create_task(events.__anext__())
+			run(asyncio.sleep(0.1)) # to run subscribe_events() up to queue.get()
+			gather(pulse.volume_set_all_chans(sink, 0.6), pulse.sink_mute(sink.index, False))
+			ev = run(asyncio.wait_for(ev_next, 5))
+			self.assertEqual((ev.facility, ev.t, ev.index), ('sink', 'change', sink.index))
+			run(events.aclose())
+			sink = run(pulse.sink_info(sink.index))
+			self.assertAlmostEqual(sink.volume.value_flat, 0.6, 2)
+			self.assertEqual(sink.mute, 0)
+
+			run(pulse.mute(sink))
+			self.assertEqual((sink.mute, run(pulse.sink_info(sink.index)).mute), (True, 1))
+			with self.assertRaises(NotImplementedError): run(pulse.port_set(snap.modules[0], 'x'))
+			idx = run(pulse.module_load('module-null-sink'))
+			self.assertEqual(len(run(pulse.sink_list())), 3)
+			run(pulse.module_unload(idx))
+			with self.assertRaises(pulsectl.PulseError):
+				run(pulse.module_load('module-that-does-not-exist'))
+			self.assertIsNotNone(run(pulse.stream_restore_test()))
+		finally:
+			pulse.close()
+			loop.close()
+
+	def test_threaded(self):
+		with pulsectl.PulseThreaded('t', server=self.sock_unix) as pulse:
+			sink, errs, res = pulse.sink_list()[0], list(), dict()
+			def worker(n):
+				try:
+					for m in range(10): res[n, m] = len(pulse.sink_list()) + len(pulse.source_list())
+				except Exception as err: errs.append(err)
+			threads = list(threading.Thread(target=worker, args=[n]) for n in range(4))
+			for t in threads: t.start()
+			for t in threads: t.join()
+			self.assertEqual(errs, list())
+			self.assertEqual(len(res), 40)
+			self.assertEqual(set(res.values()), set([4]))
+
+			evs = list()
+			def ev_cb(ev):
+				if ev.facility != 'sink' or ev.index != sink.index: return
+				evs.append(pulse.sink_info(ev.index)) # blocking calls work from callbacks here
+				raise pulsectl.PulseLoopStop
+			pulse.event_mask_set('sink')
+			pulse.event_callback_set(ev_cb)
+			listener = threading.Thread(target=pulse.event_listen, kwargs=dict(timeout=5))
+			listener.start()
+			pulse.volume_set_all_chans(sink, 0.6)
+			listener.join()
+			self.assertEqual(len(evs), 1)
+			self.assertAlmostEqual(evs[0].volume.value_flat, 0.6, 2)
+			pulse.event_callback_set(None)
+
+		with pulsectl.PulseThreaded('t', server=self.sock_unix, op_timeout=5) as pulse:
+			threads = threading.active_count()
+			for n in range(20): pulse.sink_info(sink.index)
+			self.assertLessEqual(threading.active_count(), threads + 1) # one timer thread for all ops
+		self.assertFalse([t for t in threading.enumerate() if t.name == 'pulsectl-timers'])
+
 	def test_get_sink_src(self):
 		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
 			src, sink = pulse.source_list(), pulse.sink_list()
@@ -646,6 +1016,217 @@ class DummyTests(unittest.TestCase):
 				paplay.wait()
 
 
+	def test_get_peak_samples(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			srcs = pulse.source_list()
+			source_nx = max(s.index for s in srcs) + 1
+			targets = list(it.chain.from_iterable(
+				[s.index, s.name, (s.index, None)] for s in srcs )) + [source_nx]
+			ts = time.time()
+			peaks = pulse.get_peak_samples(targets + [[srcs[0].index, None]], 0.2)
+			self.assertLess(time.time() - ts, 0.2 * len(targets) / 2) # not sequential
+			self.assertEqual(set(peaks), set(targets))
+			for k, v in peaks.items(): self.assertTrue(0 <= v <= 1.0)
+			self.assertEqual(peaks[source_nx], 0)
+			self.assertEqual(pulse.get_peak_samples([], 0.2), dict())
+
+		for pulse_cls in pulsectl.Pulse, pulsectl.PulseThreaded:
+			with pulse_cls('t', server=self.sock_unix) as pulse:
+				evs = list()
+				def ev_cb(ev):
+					evs.append(ev)
+					raise pulsectl.PulseLoopStop
+				pulse.event_mask_set('all')
+				pulse.event_callback_set(ev_cb)
+				ts = time.time()
+				pulse.get_peak_samples([srcs[0].index, srcs[1].index], 0.3)
+				self.assertGreaterEqual(time.time() - ts, 0.3) # not stopped early by events
+				self.assertEqual(evs, list())
+				pulse.event_listen(0.5)
+				self.assertTrue(evs) # new/remove events for peak streams
+
+	def test_peak_monitor(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			source_any = max(s.index for s in pulse.source_list())
+			with pulse.peak_monitor(source_any, rate=50, window=0.5) as mon:
+				ts = time.time()
+				mon.poll(0)
+				mon.poll(0.2)
+				self.assertLess(time.time() - ts, 1.0)
+				self.assertTrue(0 <= mon.peak <= 1.0)
+				self.assertEqual(mon.latest, mon.samples[-1] if mon.samples else None)
+			self.assertIsNone(mon._stream)
+			mon.close()
+			self.assertEqual(list(mon), list())
+			with self.assertRaises(pulsectl.PulseError): pulse.peak_monitor(source_any, window=0)
+			self._test_peak_monitor_threaded()
+			if not os.environ.get('DEV_TESTS'): return # rest relies on actual audio playback
+
+			test_wav = os.path.join(self.tmp_dir, 'test-peak-monitor.wav')
+			with open(test_wav, 'wb') as dst:
+				dst.write(hash_prng(b'consistent-prng-key-for-audible-noise', 5 * 2**20))
+			paplay = subprocess.Popen( ['paplay', '--raw', test_wav],
+				env=dict(PATH=os.environ['PATH'], XDG_RUNTIME_DIR=self.tmp_dir) )
+			try:
+				time.sleep(0.5) # to start playback
+				sink = pulse.sink_info(pulse.sink_input_list()[0].sink)
+				with pulse.peak_monitor(sink.monitor_source, rate=50, window=0.5) as mon:
+					samples = list(it.islice(mon, 20))
+					self.assertEqual(len(samples), 20)
+					self.assertEqual(samples, sorted(samples))
+					self.assertGreater(max(v for ts, v in samples), 0)
+					self.assertGreater(mon.peak, 0)
+			finally:
+				if paplay.poll() is None: paplay.kill()
+				paplay.wait()
+
+	def _test_peak_monitor_threaded(self):
+		with pulsectl.PulseThreaded('t', server=self.sock_unix) as pulse:
+			source_any = max(s.index for s in pulse.source_list())
+			with pulse.peak_monitor(source_any, rate=50, window=0.5) as mon:
+				samples, errs = list(), list()
+				def worker():
+					try:
+						for n in range(5): samples.append(mon.poll(None))
+						samples.extend(it.islice(mon, 5))
+					except Exception as err: errs.append(err)
+				t = threading.Thread(target=worker)
+				t.daemon = True
+				t.start()
+				for n in range(20): pulse.event_listen_stop() # should not affect mon.poll()
+				t.join(10)
+				self.assertFalse(t.is_alive())
+				self.assertEqual(errs, list())
+				self.assertEqual(len(samples), 10)
+				self.assertEqual(samples, sorted(samples))
+				self.assertTrue(all(0 <= v <= 1.0 for ts, v in samples))
+
+	def test_record(self):
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			sink = pulse.sink_list()[0]
+			with pulse.record( sink.monitor_source,
+					('s16le', 8000, 2), buffer_attr=dict(fragsize=800) ) as rec:
+				self.assertEqual(rec.frame_size, 4)
+				self.assertTrue(rec.wait_ready(5))
+				self.assertEqual(rec.state, 'ready')
+				chunk = rec.read(5)
+				self.assertIsInstance(chunk, memoryview)
+				self.assertTrue(chunk and len(chunk) % 4 == 0)
+				self.assertEqual(bytes(chunk), b'\0' * len(chunk)) # nothing plays there
+				buff = bytearray(3200)
+				self.assertEqual(rec.read_into(buff, 5), 3200)
+				self.assertEqual(buff, bytearray(3200))
+				rec.cork()
+				rec.drop()
+				rec.cork(False)
+				self.assertEqual(len(rec.read(5)) % 4, 0)
+			self.assertEqual(rec.state, 'terminated')
+			rec.close()
+			with self.assertRaises(pulsectl.PulseError):
+				pulse.record(sample_spec=('s16le', 0, 2))
+			with self.assertRaises(pulsectl.PulseError):
+				with pulse.record('no-such-source') as rec: rec.read(5)
+
+	def test_play_stream(self):
+		for pulse_cls in pulsectl.Pulse, pulsectl.PulseThreaded:
+			self._test_play_stream(pulse_cls)
+
+	def _test_play_stream(self, pulse_cls):
+		with pulse_cls('t', server=self.sock_unix) as pulse:
+			sink, evs = pulse.sink_list()[0], list()
+			def ev_cb(ev):
+				evs.append(ev)
+				if ev.t == 'new': raise pulsectl.PulseLoopStop
+			pulse.event_mask_set('sink_input')
+			pulse.event_callback_set(ev_cb)
+			with pulse.play_stream(sink.name, ('s16le', 8000, 1), name='t-play') as s:
+				self.assertEqual(s.frame_size, 2)
+				self.assertTrue(s.wait_ready(5))
+				self.assertEqual(evs, list()) # only passed to callback from event_listen()
+				pulse.event_listen(5)
+				self.assertEqual([ev.t for ev in evs], ['new'])
+				pulse.event_callback_set(None)
+				self.assertGreater(s.writable_size, 0)
+				si, = (si for si in pulse.sink_input_list() if si.name == 't-play')
+				self.assertEqual(si.sink, sink.index)
+				tone = array.array('h', (int(8000 * math.sin(n / 10.0)) for n in range(4000)))
+				self.assertEqual(s.write(tone), 8000)
+				self.assertEqual(s.write(b'\0' * 800), 800)
+				self.assertEqual(s.write(bytearray(4000), timeout=5), 4000)
+				ts = time.time()
+				s.drain()
+				self.assertLess(time.time() - ts, 5)
+			self.assertEqual(s.state, 'terminated')
+			self.assertFalse([si for si in pulse.sink_input_list() if si.name == 't-play'])
+
+	def test_sample_cache(self):
+		test_wav = os.path.join(self.tmp_dir, 'test-sample.wav')
+		dst = wave.open(test_wav, 'wb')
+		try:
+			dst.setnchannels(1), dst.setsampwidth(2), dst.setframerate(8000)
+			dst.writeframes(array.array('h', range(800)).tostring()
+				if sys.version_info.major < 3 else array.array('h', range(800)).tobytes())
+		finally: dst.close()
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			pulse.sample_upload('t-wav', test_wav)
+			pulse.sample_upload('t-raw', bytearray(800), ('u8', 8000, 2))
+			with self.assertRaises(pulsectl.PulseError): pulse.sample_upload('t-err', b'\0' * 800)
+			with self.assertRaises(pulsectl.PulseError): pulse.sample_upload('t-err', b'', ('u8', 8000, 1))
+			test_empty = os.path.join(self.tmp_dir, 'test-sample-empty.wav')
+			open(test_empty, 'wb').close()
+			with self.assertRaises(pulsectl.PulseError): pulse.sample_upload('t-err', test_empty)
+			samples = dict((s.name, s) for s in pulse.sample_list())
+			self.assertEqual(set(samples), {'t-wav', 't-raw'})
+			s = pulse.get_sample_by_name('t-wav')
+			self.assertEqual((s.bytes, s.channel_count, s.lazy), (1600, 1, False))
+			self.assertEqual(s.duration, 100000) # us
+			self.assertEqual(pulse.sample_info(s.index).name, 't-wav')
+			self.assertEqual((samples['t-raw'].bytes, samples['t-raw'].channel_count), (800, 2))
+			pulse.play_sample('t-wav')
+			pulse.sample_remove('t-wav')
+			pulse.sample_remove(samples['t-raw'])
+			self.assertEqual(pulse.sample_list(), list())
+			with self.assertRaises(pulsectl.PulseOperationFailed): pulse.sample_remove('t-wav')
+			with self.assertRaises(pulsectl.PulseIndexError): pulse.get_sample_by_name('t-wav')
+
+	def test_wav_parse(self):
+		wav_parse = pulsectl.pulsectl.wav_parse
+		fmt = struct.pack('<HHIIHH', 1, 2, 8000, 32000, 4, 16)
+		wav = lambda *chunks: b'RIFF\0\0\0\0WAVE' + b''.join(
+			struct.pack('<4sI', k, len(v) if n is None else n) + v for k, v, n in chunks )
+		spec, data = wav_parse(wav((b'fmt ', fmt, None), (b'data', b'\0' * 8, None)))
+		self.assertEqual((spec, data.tobytes()), (('s16le', 8000, 2), b'\0' * 8))
+		self.assertIsNone(wav_parse(b'not a wav file'))
+		for buff in [ wav((b'fmt ', fmt[:8], 16)),
+				wav((b'data', b'\0' * 8, None)), wav((b'fmt ', fmt.replace(b'\x10', b'\x0c'), None)) ]:
+			with self.assertRaises(pulsectl.PulseError): wav_parse(buff)
+
+	def test_pcm_levels(self):
+		pcm = array.array('h', [0, 100, -32768, 200, 32767, -300, 16384, 7])
+		if sys.byteorder != 'little': pcm.byteswap()
+		modes = [False]
+		try: import numpy
+		except ImportError: pass
+		else: modes.append(True)
+		for use_numpy in modes:
+			lvl = pulsectl.pcm_levels(pcm, ('s16le', 8000, 2), use_numpy=use_numpy)
+			self.assertEqual((lvl.frames, lvl.peak[0], lvl.clipped), (4, 1.0, [2, 0]))
+			self.assertAlmostEqual(lvl.peak[1], 300 / 32768.0)
+			self.assertAlmostEqual(lvl.rms[0], math.sqrt((32768**2 + 32767**2 + 16384**2) / 4.0) / 32768)
+			lvl = pulsectl.pcm_levels(
+				bytearray([128, 0, 255, 192]), ('u8', 8000, 1), use_numpy=use_numpy )
+			self.assertEqual((lvl.peak, lvl.clipped), ([1.0], [2]))
+			lvl = pulsectl.pcm_levels(b'', ('float32le', 8000, 3), use_numpy=use_numpy)
+			self.assertEqual((lvl.frames, lvl.peak, lvl.clipped), (0, [0.0] * 3, [0] * 3))
+		with self.assertRaises(pulsectl.PulseError): pulsectl.pcm_levels(pcm, ('alaw', 8000, 1))
+		with self.assertRaises(pulsectl.PulseError): pulsectl.pcm_levels(pcm, ('s16le', 8000, 0))
+		with pulsectl.Pulse('t', server=self.sock_unix) as pulse:
+			with pulse.record(pulse.sink_list()[0].monitor_source, ('float32le', 8000, 2)) as rec:
+				lvl = rec.read_levels(5)
+				self.assertGreater(lvl.frames, 0)
+				self.assertEqual((lvl.peak, lvl.rms, lvl.clipped), ([0.0] * 2, [0.0] * 2, [0] * 2))
+
+
 class PulseCrashTests(unittest.TestCase):
 
 	@classmethod
@@ -696,5 +1277,88 @@ class PulseCrashTests(unittest.TestCase):
 
 		finally: dummy_pulse_cleanup(info)
 
+	def test_reconnect_auto(self):
+		info = dummy_pulse_init()
+		try:
+			with pulsectl.Pulse('t', server=info.sock_unix, reconnect=True) as pulse:
+				pulse.reconnect_set(delay_min=0.05, delay_max=0.2, attempts=50)
+				pulse.event_mask_set('sink')
+				self.assertTrue(pulse.sink_list())
+				info.proc.terminate()
+				info.proc.wait()
+				dummy_pulse_init(info)
+				self.assertTrue(pulse.sink_list()) # retried after reconnect
+				self.assertTrue(pulse.connected)
+				self.assertEqual(pulse.reconnects, 1)
+
+				evs = list()
+				def ev_cb(ev):
+					evs.append(ev)
+					raise pulsectl.PulseLoopStop
+				pulse.event_callback_set(ev_cb)
+				pulse.module_load('module-null-sink')
+				pulse.event_listen(timeout=5)
+				self.assertTrue(evs)
+				self.assertEqual(evs[0].facility, 'sink')
+
+				pulse.reconnect_set(delay_min=0.05, delay_max=0.2, timeout=0.5)
+				info.proc.terminate()
+				info.proc.wait()
+				ts = time.time()
+				with self.assertRaises(pulsectl.PulseDisconnected): pulse.sink_list()
+				self.assertLess(time.time() - ts, 3) # not retried forever within calls
+				dummy_pulse_init(info)
+				self.assertTrue(pulse.sink_list())
+				self.assertEqual(pulse.reconnects, 2)
+
+				pulse.disconnect() # explicit disconnect does not reconnect
+				with self.assertRaises(Exception): pulse.sink_list()
+				self.assertFalse(pulse.connected)
+				self.assertEqual(pulse.reconnects, 2)
+		finally: dummy_pulse_cleanup(info)
+
+	def test_reconnect_no_retry(self):
+		info = dummy_pulse_init()
+		try:
+			with pulsectl.Pulse('t', server=info.sock_unix, reconnect=True) as pulse:
+				pulse.reconnect_set(delay_min=0.05, delay_max=0.2, attempts=50)
+				sink = pulse.sink_list()[0]
+				info.proc.terminate()
+				info.proc.wait()
+				dummy_pulse_init(info)
+				with self.assertRaises(pulsectl.PulseOperationFailed):
+					pulse.sink_info(sink.index) # index can refer to different sink after restart
+				self.assertEqual(pulse.get_sink_by_name(sink.name).name, sink.name) # retried
+				self.assertEqual(pulse.reconnects, 1)
+
+				pulse.reconnect_set(delay_min=0.05, delay_max=0.2) # unlimited attempts
+				pulse.event_callback_set(lambda ev: None)
+				info.proc.terminate()
+				info.proc.wait()
+				ts = time.time()
+				with self.assertRaises(pulsectl.PulseDisconnected): pulse.event_listen(timeout=0.5)
+				self.assertLess(time.time() - ts, 3) # reconnection is limited by timeout
+		finally: dummy_pulse_cleanup(info)
+
+	def test_op_timeout(self):
+		info = dummy_pulse_init()
+		try:
+			for pulse_cls in pulsectl.Pulse, pulsectl.PulseThreaded:
+				with pulse_cls('t', server=info.sock_unix, op_timeout=0.3) as pulse:
+					sink = pulse.sink_list()[0]
+					info.proc.send_signal(signal.SIGSTOP) # simulates hung server
+					try:
+						ts = time.time()
+						with self.assertRaises(pulsectl.PulseTimeout): pulse.server_info()
+						with self.assertRaises(pulsectl.PulseTimeout): pulse.sink_list(op_timeout=0.1)
+						with self.assertRaises(pulsectl.PulseOperationFailed): pulse.sink_mute(sink.index)
+						self.assertLess(time.time() - ts, 2.0)
+						self.assertEqual((pulse._actions, pulse._action_ops), (dict(), dict()))
+					finally: info.proc.send_signal(signal.SIGCONT)
+					self.assertEqual(pulse.sink_info(sink.index, op_timeout=None).name, sink.name)
+					pulse.sink_mute(sink.index, False)
+					self.assertTrue(pulse.connected)
+		finally: dummy_pulse_cleanup(info)
+
 
 if __name__ == '__main__': unittest.main()
@@ -10,7 +10,7 @@ except IOError: readme = ''
 setup(
 
 	name = 'pulsectl',
-	version = '24.12.0',
+	version = '26.10.24',
 	author = 'George Filipkin, Mike Kazantsev',
 	author_email = 'mk.fraggod@gmail.com',
 	license = 'MIT',